@@ -0,0 +1,137 @@
+"""Flat arrays of axis aligned boxes with vectorized ray and box queries"""
+import numpy as np
+
+from gmod.misc import concat_ranges
+
+# rays x boxes evaluated at once by the chunked queries
+QUERY_CHUNK = 1 << 20
+
+
+def transform_aabbs(
+    mins: np.ndarray, maxs: np.ndarray, matrices: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Boxes enclosing (..., 3) boxes moved by (..., 3, 4) matrices"""
+    center = (mins + maxs) * 0.5
+    extent = (maxs - mins) * 0.5
+    rotation = matrices[..., :3]
+    new_center = (rotation @ center[..., None])[..., 0] + matrices[..., 3]
+    new_extent = (np.abs(rotation) @ extent[..., None])[..., 0]
+    return (
+        (new_center - new_extent).astype(np.float32),
+        (new_center + new_extent).astype(np.float32),
+    )
+
+
+def ray_aabb(
+    origins: np.ndarray,
+    directions: np.ndarray,
+    mins: np.ndarray,
+    maxs: np.ndarray,
+) -> np.ndarray:
+    """Slab test, broadcasting (..., 3) rays against (..., 3) boxes. Returns
+    the entry distance along the ray or inf for misses. Rays starting inside
+    a box hit it at 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / directions
+        t1 = (mins - origins) * inverse
+        t2 = (maxs - origins) * inverse
+    # fmin/fmax skip the NaNs of rays lying exactly on a slab plane
+    near = np.fmax.reduce(np.fmin(t1, t2), axis=-1)
+    far = np.fmin.reduce(np.fmax(t1, t2), axis=-1)
+    near = np.maximum(near, 0.0)
+    return np.where(far >= near, near, np.inf)
+
+
+class AABBIndex:
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray, ids: np.ndarray | None = None):
+        self.mins = np.ascontiguousarray(mins, dtype=np.float32).reshape(-1, 3)
+        self.maxs = np.ascontiguousarray(maxs, dtype=np.float32).reshape(-1, 3)
+        # caller defined id of every box, e.g. (instance, hitbox) packed
+        self.ids = np.arange(len(self.mins)) if ids is None else np.asarray(ids)
+
+    def __len__(self) -> int:
+        return len(self.mins)
+
+    @classmethod
+    def concatenate(cls, indices: list["AABBIndex"]) -> "AABBIndex":
+        return cls(
+            np.concatenate([index.mins for index in indices]),
+            np.concatenate([index.maxs for index in indices]),
+            np.concatenate([index.ids for index in indices]),
+        )
+
+    def transformed(self, matrix: np.ndarray, ids: np.ndarray | None = None) -> "AABBIndex":
+        """Index of the same boxes moved by one (3, 4) matrix"""
+        mins, maxs = transform_aabbs(self.mins, self.maxs, matrix)
+        return AABBIndex(mins, maxs, self.ids if ids is None else ids)
+
+    @property
+    def bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.mins.min(axis=0), self.maxs.max(axis=0)
+
+    def ray_distances(
+        self, origins: np.ndarray, directions: np.ndarray
+    ) -> np.ndarray:
+        """(rays, boxes) entry distances, inf where a ray misses"""
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        return ray_aabb(
+            origins[:, None], directions[:, None], self.mins[None], self.maxs[None]
+        )
+
+    def ray_query(
+        self,
+        origins: np.ndarray,
+        directions: np.ndarray,
+        max_distance: float = np.inf,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest box hit by each ray: (ids, distances), id -1 and distance
+        inf where nothing is hit within `max_distance`"""
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        nearest = np.full(len(origins), -1, dtype=np.int64)
+        distances = np.full(len(origins), np.inf, dtype=np.float32)
+        if len(self) == 0:
+            return nearest, distances
+        step = max(1, QUERY_CHUNK // len(self))
+        for start in range(0, len(origins), step):
+            chunk = self.ray_distances(
+                origins[start : start + step], directions[start : start + step]
+            )
+            best = np.argmin(chunk, axis=1)
+            best_distance = chunk[np.arange(len(chunk)), best]
+            hit = np.isfinite(best_distance) & (best_distance <= max_distance)
+            nearest[start : start + step][hit] = best[hit]
+            distances[start : start + step][hit] = best_distance[hit]
+        ids = np.where(nearest >= 0, self.ids[np.maximum(nearest, 0)], -1)
+        return ids, distances
+
+    def box_query(self, box_min: np.ndarray, box_max: np.ndarray) -> np.ndarray:
+        """ids of the boxes overlapping the query box"""
+        overlap = np.all(
+            (self.mins <= np.asarray(box_max)) & (self.maxs >= np.asarray(box_min)),
+            axis=1,
+        )
+        return self.ids[overlap]
+
+    def point_query(self, point: np.ndarray) -> np.ndarray:
+        return self.box_query(point, point)
+
+    def overlapping_pairs(self) -> np.ndarray:
+        """(P, 2) row pairs (i < j) of overlapping boxes. Sweep and prune on
+        x: every box is only tested against the boxes starting inside its
+        x extent."""
+        order = np.argsort(self.mins[:, 0], kind="stable")
+        starts = self.mins[order, 0]
+        # boxes after position i in x order starting at or before its max x
+        ends = np.searchsorted(starts, self.maxs[order, 0], side="right")
+        first = np.arange(1, len(order) + 1)
+        counts = np.maximum(ends - first, 0)
+        a = np.repeat(order, counts)
+        b = order[concat_ranges(first, counts)]
+        overlap = np.all(
+            (self.mins[a, 1:] <= self.maxs[b, 1:])
+            & (self.maxs[a, 1:] >= self.mins[b, 1:]),
+            axis=1,
+        )
+        return np.sort(np.stack([a[overlap], b[overlap]], axis=1), axis=1)
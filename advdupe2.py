@@ -1,185 +1,439 @@
 """Reference: 
 https://github.com/wiremod/advdupe2/blob/master/lua/advdupe2/sh_codec.lua"""
 
-from lzma import decompress
-from struct import unpack
+import gc
+import struct
+from lzma import LZMADecompressor, decompress
+from typing import Any, Iterable, Iterator, NamedTuple
+
+# type codes, shared by revisions 4 and 5
+TABLE = 255
+ARRAY = 254
+TRUE = 253
+FALSE = 252
+NUMBER = 251
+VECTOR = 250
+ANGLE = 249
+# revision 4: null terminated, revision 5: 32 bit length prefixed
+STRING = 248
+REFERENCE = 247
+# revision 5 only, ends tables like the empty string
+NIL = 246
+
+_NUMBER = struct.Struct("<d")
+_VECTOR = struct.Struct("<ddd")
+_SHORT = struct.Struct("<h")
+_LENGTH = struct.Struct("<L")
+# key slot of a table frame that is waiting for its next key
+_NO_KEY = object()
+
+
+def _decode_reference(context: "ReaderContext", pos: int):
+    # the Lua reader counts references as tables too
+    context.reference += 1
+    return context.tables[_SHORT.unpack_from(context.view, pos)[0]], pos + 2
+
+
+def _decode_terminated_string(context: "ReaderContext", pos: int):
+    end = context.buf.find(b"\0", pos)
+    if end == -1:
+        raise RuntimeError("Unterminated string in dupe")
+    return context.buf[pos:end].decode("latin-1"), end + 1
+
+
+def _decode_long_string(context: "ReaderContext", pos: int):
+    length = _LENGTH.unpack_from(context.view, pos)[0]
+    pos += 4
+    return context.buf[pos : pos + length].decode("ascii"), pos + length
+
+
+def _decode_nil(context: "ReaderContext", pos: int):
+    return None, pos
+
+
+class ReaderContext:
+    # decoders of the type codes that _read() doesn't handle inline
+    DECODERS: dict = {}
+    # codes below this are short strings of that length
+    FIRST_TYPE_CODE = REFERENCE
 
-class ReaderContextVersion4:
     def __init__(self, buff: bytes):
         self.buf = buff
+        self.view = memoryview(buff)
         self.buf_index = 0
         self.reference = 0
         self.tables: dict[int, dict | list] = {}
 
-    def decode(self, code: int):
-        if code == 255:
-            t = {}
-            self.reference += 1
-            ref = self.reference
-            k = self.read()
-            while k != '':
-                r = self.read()
-                t[k] = r
-                k = self.read()
-            self.tables[ref] = t
-            return t
-
-        if code == 254:
-            l = []
-            self.reference += 1
-            ref = self.reference
-            v = self.read()
-            while v != '':
-                l.append(v)
-                v = self.read()
-            self.tables[ref] = l
-            return l
-
-        if code == 253:
-            return True
-
-        if code == 252:
-            return False
-
-        if code == 251:
-            double = unpack("<d", self.buf[self.buf_index:self.buf_index+8])[0]
-            self.buf_index += 8
-            return double
-
-        if code == 250:
-            vector = unpack("<ddd", self.buf[self.buf_index:self.buf_index+24])
-            self.buf_index += 24
-            return vector
-
-        if code == 249:
-            angle = unpack("<ddd", self.buf[self.buf_index:self.buf_index+24])
-            self.buf_index += 24
-            return angle
-
-        if code == 248: # ascii, null terminated
-            string = ""
-            byte = self.read_bytes(1)[0]
-            
-            while byte != 0:
-                string += chr(byte)
-                byte = self.read_bytes(1)[0]
-
-            return string
-
-        if code == 247:
-            self.reference += 1
-            short = unpack("<h", self.buf[self.buf_index:self.buf_index+2])[0]
-            self.buf_index += 2
-            return self.tables[short]
-        
-        # maybe strings length < 247 (see v5)
-        a = self.read_bytes(code).decode("ascii")
-        return a
-
-    def read(self) -> dict:
-        code = self.buf[self.buf_index]
-        self.buf_index += 1
-        return self.decode(code)
-
-    def read_bytes(self, length: int) -> bytes:
-        self.buf_index += length
-        return self.buf[self.buf_index-length: self.buf_index]
-
-class ReaderContextVersion5:
-    def __init__(self, buff: bytes):
-        self.buf = buff
-        self.buf_index = 0
-        self.reference = 0
-        self.tables: dict[int, dict | list] = {}
-
-    def decode(self, code: int):
-        if code == 255:
-            t = {}
-            self.reference += 1
-            ref = self.reference
-            k = self.read()
-            while k != '' and k is not None:
-                r = self.read()
-                t[k] = r
-                k = self.read()
-            self.tables[ref] = t
-            return t
-
-        if code == 254:
-            l = []
-            self.reference += 1
-            ref = self.reference
-            v = self.read()
-            while v != '' and v is not None:
-                l.append(v)
-                v = self.read()
-            self.tables[ref] = l
-            return l
-
-        if code == 253:
-            return True
-
-        if code == 252:
-            return False
-
-        if code == 251:
-            double = unpack("<d", self.buf[self.buf_index:self.buf_index+8])[0]
-            self.buf_index += 8
-            return double
-
-        if code == 250:
-            vector = unpack("<ddd", self.buf[self.buf_index:self.buf_index+24])
-            self.buf_index += 24
-            return vector
-
-        if code == 249:
-            angle = unpack("<ddd", self.buf[self.buf_index:self.buf_index+24])
-            self.buf_index += 24
-            return angle
-
-        if code == 248: # Length>246 string
-            length = unpack("<L", self.buf[self.buf_index:self.buf_index+4])[0]
-            self.buf_index += 4
-            string = self.read_bytes(length).decode("ascii")
-            return string
-
-        if code == 247:
-            self.reference += 1
-            short = unpack("<h", self.buf[self.buf_index:self.buf_index+2])[0]
-            self.buf_index += 2
-            return self.tables[short]
-        
-        if code == 246:
-            return None
-
-        if code == 0:
-            return ""
-
-        # ascii strings with length < 246
-        a = self.read_bytes(code).decode("ascii")
-        return a
-
-    def read(self) -> dict:
-        code = self.buf[self.buf_index]
-        self.buf_index += 1
-        return self.decode(code)
-
-    def read_bytes(self, length: int) -> bytes:
-        self.buf_index += length
-        return self.buf[self.buf_index-length: self.buf_index]
+    def read(self, pause_gc: bool = False):
+        """Decodes the value at buf_index. Tables are filled from an
+        explicit stack, so nesting depth is only limited by memory.
+
+        Nothing built while decoding is garbage, so `pause_gc` turns the
+        cyclic garbage collector off meanwhile to save its rescans of the
+        new tables. The collector is global: don't use it while other
+        threads allocate."""
+        if not pause_gc:
+            return self._read()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._read()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _read(self):
+        """The common type codes are decoded inline, references and the
+        long strings go through DECODERS"""
+        data = self.buf
+        view = self.view
+        decoders = self.DECODERS
+        first_type_code = self.FIRST_TYPE_CODE
+        unpack_number = _NUMBER.unpack_from
+        unpack_vector = _VECTOR.unpack_from
+        tables = self.tables
+        reference = self.reference
+        pos = self.buf_index
+        # the innermost open table and its pending key, the outer ones
+        # wait on the stack
+        table: dict | list | None = None
+        key = _NO_KEY
+        stack: list[tuple] = []
+        while True:
+            code = data[pos]
+            pos += 1
+            if code < first_type_code:
+                value = data[pos : pos + code].decode("ascii")
+                pos += code
+            elif code == TABLE or code == ARRAY:
+                stack.append((table, key))
+                reference += 1
+                table = tables[reference] = {} if code == TABLE else []
+                key = _NO_KEY
+                continue
+            elif code == NUMBER:
+                value = unpack_number(view, pos)[0]
+                pos += 8
+            elif code == VECTOR or code == ANGLE:
+                value = unpack_vector(view, pos)
+                pos += 24
+            elif code == TRUE:
+                value = True
+            elif code == FALSE:
+                value = False
+            else:
+                decoder = decoders.get(code)
+                if decoder is None:
+                    raise RuntimeError(f"Unknown type code {code} in dupe")
+                self.reference = reference
+                value, pos = decoder(self, pos)
+                reference = self.reference
+
+            # a finished table is in turn the value of the table around it
+            while True:
+                if table is None:
+                    self.buf_index = pos
+                    self.reference = reference
+                    return value
+                if key is not _NO_KEY:
+                    table[key] = value
+                    key = _NO_KEY
+                elif value is None or (value.__class__ is str and not value):
+                    # end marker where a key or list item would be
+                    value = table
+                    table, key = stack.pop()
+                    continue
+                elif table.__class__ is dict:
+                    key = value
+                else:
+                    table.append(value)
+                break
+
+
+class ReaderContextVersion4(ReaderContext):
+    DECODERS = {REFERENCE: _decode_reference, STRING: _decode_terminated_string}
+
+
+class ReaderContextVersion5(ReaderContext):
+    DECODERS = {
+        REFERENCE: _decode_reference,
+        STRING: _decode_long_string,
+        NIL: _decode_nil,
+    }
+    FIRST_TYPE_CODE = NIL
+
+
+def _revision(dupe: bytes) -> int:
+    """Checked codec revision from the start of a dupe file"""
+    max_supported_revision = 5
+    sig = dupe[:4]
+    if sig != b"AD2F":
+        if sig == b"[Inf":
+            raise NotImplementedError("Adv.Dupe 1 not supported")
+        raise RuntimeError("Corrupted file")
+    if len(dupe) < 5:
+        raise RuntimeError("Corrupted file")
+    rev = int(dupe[4])
+    if rev > max_supported_revision:
+        raise RuntimeError("Version is not supported")
+    if rev < 1:
+        raise RuntimeError("Invalid revision")
+    return rev
+
+
+# events of iter_events()
+START_TABLE = "start-table"
+START_ARRAY = "start-array"
+KEY = "key"
+VALUE = "value"
+END_TABLE = "end-table"
+
+# compressed bytes read from the file at once when streaming
+READ_CHUNK = 1 << 16
+# most decompressed bytes handed to the event parser at once
+DECOMPRESS_CHUNK = 1 << 18
+
+
+class Reference(NamedTuple):
+    """A table seen earlier in the stream, by the id of its start event"""
+
+    table: int
+
+
+def decompress_stream(file, data: bytes = b"") -> Iterator[bytes]:
+    """Decompressed pieces of the LZMA stream made of `data` and the rest
+    of `file`, never more than DECOMPRESS_CHUNK bytes at once"""
+    decompressor = LZMADecompressor()
+    while not decompressor.eof:
+        if decompressor.needs_input:
+            data = data or file.read(READ_CHUNK)
+            if not data:
+                raise RuntimeError("Dupe ended in the middle of the compressed data")
+        chunk = decompressor.decompress(data, DECOMPRESS_CHUNK)
+        data = b""
+        if chunk:
+            yield chunk
+
+
+def iter_events(chunks: Iterable[bytes], revision: int) -> Iterator[tuple[str, Any]]:
+    """Parses one serialized value from the decompressed `chunks` as they
+    arrive. Yields (START_TABLE or START_ARRAY, table id), (KEY, value),
+    (VALUE, value) and (END_TABLE, None); references to earlier tables are
+    Reference values. Only the unparsed rest of a chunk is kept."""
+    if revision not in (4, 5):
+        raise NotImplementedError(f"Streaming of revision {revision} not supported")
+    first_type_code = REFERENCE if revision == 4 else NIL
+    chunks = iter(chunks)
+    buf = bytearray()
+    pos = 0
+
+    def need(size: int):
+        while len(buf) - pos < size:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise RuntimeError("Dupe ended in the middle of a value")
+            buf.extend(chunk)
+
+    reference = 0
+    # per open table: True while it waits for a key, False for a value,
+    # None for arrays
+    stack: list[bool | None] = []
+    while True:
+        if pos >= READ_CHUNK:
+            del buf[:pos]
+            pos = 0
+        need(1)
+        code = buf[pos]
+        if code == TABLE or code == ARRAY:
+            pos += 1
+            reference += 1
+            if stack and stack[-1] is not None:
+                stack[-1] = not stack[-1]
+            yield (START_TABLE if code == TABLE else START_ARRAY), reference
+            stack.append(True if code == TABLE else None)
+            continue
+
+        if code < first_type_code:
+            need(1 + code)
+            value = buf[pos + 1 : pos + 1 + code].decode("ascii")
+            pos += 1 + code
+        elif code == NUMBER:
+            need(9)
+            value = _NUMBER.unpack_from(buf, pos + 1)[0]
+            pos += 9
+        elif code == VECTOR or code == ANGLE:
+            need(25)
+            value = _VECTOR.unpack_from(buf, pos + 1)
+            pos += 25
+        elif code == TRUE or code == FALSE:
+            value = code == TRUE
+            pos += 1
+        elif code == REFERENCE:
+            need(3)
+            # the Lua reader counts references as tables too
+            reference += 1
+            value = Reference(_SHORT.unpack_from(buf, pos + 1)[0])
+            pos += 3
+        elif code == STRING and revision == 4:
+            searched = pos + 1
+            end = buf.find(b"\0", searched)
+            while end == -1:
+                searched = len(buf)
+                need(len(buf) - pos + 1)
+                end = buf.find(b"\0", searched)
+            value = buf[pos + 1 : end].decode("latin-1")
+            pos = end + 1
+        elif code == STRING:
+            need(5)
+            length = _LENGTH.unpack_from(buf, pos + 1)[0]
+            need(5 + length)
+            value = buf[pos + 5 : pos + 5 + length].decode("ascii")
+            pos += 5 + length
+        else:
+            value = None
+            pos += 1
+
+        if not stack:
+            yield VALUE, value
+            return
+        if stack[-1] is False:
+            stack[-1] = True
+            yield VALUE, value
+        elif value is None or value == "":
+            # end marker where a key or array item would be
+            stack.pop()
+            yield END_TABLE, None
+            if not stack:
+                return
+        elif stack[-1] is True:
+            stack[-1] = False
+            yield KEY, value
+        else:
+            yield VALUE, value
+
+
+def build_value(
+    events: Iterator[tuple[str, Any]],
+    event: tuple[str, Any],
+    tables: dict[int, dict | list],
+):
+    """The value that starts with `event`, pulling the rest of it from
+    `events`. Tables built are registered in `tables` by id so later
+    references resolve."""
+    kind, value = event
+    if kind != START_TABLE and kind != START_ARRAY:
+        return _resolve(value, tables)
+    root: dict | list = {} if kind == START_TABLE else []
+    tables[value] = root
+    # [table, pending key] per open table
+    stack: list[list] = [[root, _NO_KEY]]
+    for kind, value in events:
+        frame = stack[-1]
+        table, key = frame
+        if kind == END_TABLE:
+            stack.pop()
+            if not stack:
+                return root
+            continue
+        if kind == START_TABLE or kind == START_ARRAY:
+            table_id = value
+            value = {} if kind == START_TABLE else []
+            tables[table_id] = value
+            stack.append([value, _NO_KEY])
+        else:
+            value = _resolve(value, tables)
+        if kind == KEY:
+            frame[1] = value
+        elif table.__class__ is list:
+            table.append(value)
+        elif key is _NO_KEY:
+            # a table used as a key
+            frame[1] = value
+        else:
+            table[key] = value
+            frame[1] = _NO_KEY
+    raise RuntimeError("Dupe ended in the middle of a table")
+
+
+def _resolve(value, tables: dict[int, dict | list]):
+    if value.__class__ is not Reference:
+        return value
+    try:
+        return tables[value.table]
+    except KeyError:
+        raise RuntimeError(f"Reference to table {value.table} that wasn't built") from None
+
+
+def skip_value(events: Iterator[tuple[str, Any]], event: tuple[str, Any]):
+    """Consumes the value that starts with `event` without building it"""
+    depth = int(event[0] == START_TABLE or event[0] == START_ARRAY)
+    while depth:
+        kind, _ = next(events)
+        if kind == START_TABLE or kind == START_ARRAY:
+            depth += 1
+        elif kind == END_TABLE:
+            depth -= 1
+
+
+def open_events(file) -> tuple[dict, Iterator[tuple[str, Any]]]:
+    """Info block and the event stream of an open dupe file. Only the
+    compressed bytes not parsed yet and one decompressed chunk are held
+    in memory."""
+    head = file.read(READ_CHUNK)
+    while head.find(b"\2", 6) == -1:
+        more = file.read(READ_CHUNK)
+        if not more:
+            break
+        head += more
+    revision = _revision(head)
+    if revision not in (4, 5):
+        raise NotImplementedError(f"Streaming of revision {revision} not supported")
+    info, rest = AdvDupe2._get_info(head[6:])
+    return info, iter_events(decompress_stream(file, rest), revision)
+
+
+def iter_entities(dupe_path: str) -> Iterator[tuple[Any, dict]]:
+    """(key, entity table) of every entity of a dupe, decompressed and
+    parsed while iterating so only one entity is built at a time.
+    References only resolve within an entity."""
+    with open(dupe_path, "rb") as file:
+        _, events = open_events(file)
+        kind, _ = next(events)
+        if kind != START_TABLE:
+            raise RuntimeError("Dupe is not a table")
+        for kind, key in events:
+            if kind == END_TABLE:
+                return
+            event = next(events)
+            if key != "Entities":
+                skip_value(events, event)
+                continue
+            if event[0] != START_TABLE:
+                raise RuntimeError("Entities is not a table")
+            for kind, entity_key in events:
+                if kind == END_TABLE:
+                    break
+                yield entity_key, build_value(events, next(events), {})
 
 
 def error_nodeserializer():
     raise RuntimeError("No deserializer")
 
 class AdvDupe2:
-    def __init__(self, dupe_path: str):
+    def __init__(self, dupe_path: str, streaming: bool = False):
+        """`streaming` decompresses and parses the file piece by piece
+        instead of holding all of the decompressed data at once"""
         self.dupe: dict
         with open(dupe_path, "rb") as file:
-            self.dupe, self.info = self._decode(file.read())
+            if streaming:
+                self.info, events = open_events(file)
+                self.dupe = build_value(events, next(events), {})
+            else:
+                self.dupe, self.info = self._decode(file.read())
         self._check_valid_dupe()
 
-    def _get_info(self, dupe: bytes) -> tuple[dict, bytes]:
+    @staticmethod
+    def _get_info(dupe: bytes) -> tuple[dict, bytes]:
         last = dupe.find(b"\2")
         if last == -1:
             raise RuntimeError("Attempt to read AD2 file with malformed info block!")
@@ -198,7 +452,7 @@ class AdvDupe2:
 
         return (info, dupe[last + 2 :])
 
-    def _deserialize(self, reader_context: ReaderContextVersion4 | ReaderContextVersion5) -> dict:
+    def _deserialize(self, reader_context: ReaderContext) -> dict:
         tbl = reader_context.read()
         return tbl
 
@@ -220,17 +474,7 @@ class AdvDupe2:
         return self._deserialize(ReaderContextVersion5(decompress(dupestring))), info
 
     def _decode(self, dupe: bytes) -> tuple[dict, dict]:
-        max_supported_revision = 5
-        sig = dupe[:4]
-        rev = int(dupe[4])
-        if sig != b"AD2F":
-            if sig == b"[Inf":
-                raise NotImplementedError("Adv.Dupe 1 not supported")
-            raise RuntimeError("Corrupted file")
-        if rev > max_supported_revision:
-            raise RuntimeError("Version is not supported")
-        if rev < 1:
-            raise RuntimeError("Invalid revision")
+        rev = _revision(dupe)
         if rev == 1:
             return self._decode_1(dupe)
         if rev == 2:
@@ -0,0 +1,233 @@
+"""Decoding of compressed mstudioanim_t tracks into dense per-frame arrays
+and batched pose evaluation.
+Reference: CalcBoneQuaternion/CalcBonePosition in
+https://github.com/ValveSoftware/source-sdk-2013/blob/0d8dceea4310fde5706b3ce1c70609d72a38efdf/sp/src/public/bone_setup.cpp
+"""
+import ctypes
+
+import numpy as np
+from numpy.lib import recfunctions
+
+from gmod.misc import struct_array
+from gmod.mdl_structs import (
+    mstudioanim_t,
+    mstudioanim_valueptr_t,
+    mstudioanimdesc_t,
+    mstudioanimsections_t,
+)
+from gmod.skeleton import Skeleton, angle_quaternion, compose, slerp
+
+# mstudioanimdesc_t.flags
+STUDIO_LOOPING = 0x0001
+STUDIO_DELTA = 0x0004
+
+# mstudioanim_t.flags
+STUDIO_ANIM_RAWPOS = 0x01
+STUDIO_ANIM_RAWROT = 0x02
+STUDIO_ANIM_ANIMPOS = 0x04
+STUDIO_ANIM_ANIMROT = 0x08
+STUDIO_ANIM_DELTA = 0x10
+STUDIO_ANIM_RAWROT2 = 0x20
+
+
+def decode_anim_values(buf, offset: int, num_frames: int) -> np.ndarray:
+    """Run-length encoded mstudioanimvalue_t track to int16 (num_frames,)"""
+    values = np.zeros(num_frames, dtype=np.int16)
+    frame = 0
+    while frame < num_frames:
+        valid, total = buf[offset], buf[offset + 1]
+        if total == 0:
+            break
+        run = np.frombuffer(buf, "<i2", valid + 1, offset)
+        count = min(total, num_frames - frame)
+        stored = min(valid, count)
+        values[frame : frame + stored] = run[1 : stored + 1]
+        # frames past the stored ones repeat the last stored value
+        values[frame + stored : frame + count] = run[valid]
+        frame += total
+        offset += (valid + 1) * 2
+    return values
+
+
+def decode_quaternion48(buf, offset: int) -> np.ndarray:
+    x, y, zw = np.frombuffer(buf, "<u2", 3, offset).astype(np.int64)
+    quaternion = np.array(
+        [
+            (x - 32768) / 32768.0,
+            (y - 32768) / 32768.0,
+            ((zw & 0x7FFF) - 16384) / 16384.0,
+            0.0,
+        ]
+    )
+    quaternion[3] = np.sqrt(max(0.0, 1.0 - np.dot(quaternion, quaternion)))
+    if zw >> 15:
+        quaternion[3] = -quaternion[3]
+    return quaternion.astype(np.float32)
+
+
+def decode_quaternion64(buf, offset: int) -> np.ndarray:
+    packed = int(np.frombuffer(buf, "<u8", 1, offset)[0])
+    quaternion = np.array(
+        [((packed >> shift) & 0x1FFFFF) - 1048576 for shift in (0, 21, 42)] + [0],
+        dtype=np.float64,
+    )
+    quaternion[:3] /= 1048576.5
+    quaternion[3] = np.sqrt(max(0.0, 1.0 - np.dot(quaternion, quaternion)))
+    if packed >> 63:
+        quaternion[3] = -quaternion[3]
+    return quaternion.astype(np.float32)
+
+
+def decode_vector48(buf, offset: int) -> np.ndarray:
+    return np.frombuffer(buf, "<f2", 3, offset).astype(np.float32)
+
+
+def _decode_value_ptr(buf, offset: int, num_frames: int) -> np.ndarray:
+    """float32 (num_frames, 3), unused channels (offset 0) stay zero"""
+    value_ptr = mstudioanim_valueptr_t.from_buffer_copy(buf, offset)
+    channels = np.zeros((num_frames, 3), dtype=np.float32)
+    for axis, channel_offset in enumerate(value_ptr.offset):
+        if channel_offset:
+            channels[:, axis] = decode_anim_values(
+                buf, offset + channel_offset, num_frames
+            )
+    return channels
+
+
+def _animation_sections(
+    buf, desc_offset: int, desc: mstudioanimdesc_t
+) -> list[tuple[int, np.ndarray]]:
+    """(offset of the first mstudioanim_t, frames stored in it) per section"""
+    if desc.sectionframes == 0:
+        if desc.animblock != 0:
+            raise NotImplementedError("Animations in .ani blocks are not supported")
+        return [(desc_offset + desc.animindex, np.arange(desc.numframes))]
+
+    frames = np.arange(desc.numframes)
+    section = frames // desc.sectionframes
+    if desc.numframes > desc.sectionframes:
+        # the last frame has a section of its own (mstudioanimdesc_t::pAnim)
+        section[-1] = desc.numframes // desc.sectionframes + 1
+    table = struct_array(
+        buf,
+        mstudioanimsections_t,
+        desc_offset + desc.sectionindex,
+        section.max(initial=-1) + 1,
+    )
+    if np.any(table["animblock"][np.unique(section)] != 0):
+        raise NotImplementedError("Animations in .ani blocks are not supported")
+    return [
+        (desc_offset + int(table["animindex"][index]), frames[section == index])
+        for index in np.unique(section)
+    ]
+
+
+def decode_animation(
+    buf, desc_offset: int, desc: mstudioanimdesc_t, bones: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Dense (frames, bones, 3) positions and (frames, bones, 4) quaternions
+    of one mstudioanimdesc_t, `bones` is the mstudiobone_t structured array"""
+    num_frames = desc.numframes
+    bone_pos = recfunctions.structured_to_unstructured(bones["pos"])
+    bone_quat = recfunctions.structured_to_unstructured(bones["quat"])
+    bone_rot = recfunctions.structured_to_unstructured(bones["rot"])
+    pos_scale = recfunctions.structured_to_unstructured(bones["posscale"])
+    rot_scale = recfunctions.structured_to_unstructured(bones["rotscale"])
+
+    positions = np.zeros((num_frames, len(bones), 3), dtype=np.float32)
+    quaternions = np.zeros((num_frames, len(bones), 4), dtype=np.float32)
+    if desc.flags & STUDIO_DELTA:
+        quaternions[..., 3] = 1.0
+    else:
+        positions[:] = bone_pos
+        quaternions[:] = bone_quat
+
+    for anim_offset, frames in _animation_sections(buf, desc_offset, desc):
+        count = len(frames)
+        while True:
+            anim = mstudioanim_t.from_buffer_copy(buf, anim_offset)
+            bone = anim.bone
+            data = anim_offset + ctypes.sizeof(mstudioanim_t)
+            delta = anim.flags & STUDIO_ANIM_DELTA
+            if anim.flags & STUDIO_ANIM_RAWROT:
+                quaternions[frames, bone] = decode_quaternion48(buf, data)
+                data += 6
+            elif anim.flags & STUDIO_ANIM_RAWROT2:
+                quaternions[frames, bone] = decode_quaternion64(buf, data)
+                data += 8
+            elif anim.flags & STUDIO_ANIM_ANIMROT:
+                angles = _decode_value_ptr(buf, data, count) * rot_scale[bone]
+                if not delta:
+                    angles += bone_rot[bone]
+                quaternions[frames, bone] = angle_quaternion(angles)
+                data += ctypes.sizeof(mstudioanim_valueptr_t)
+
+            if anim.flags & STUDIO_ANIM_RAWPOS:
+                positions[frames, bone] = decode_vector48(buf, data)
+            elif anim.flags & STUDIO_ANIM_ANIMPOS:
+                position = _decode_value_ptr(buf, data, count) * pos_scale[bone]
+                if not delta:
+                    position += bone_pos[bone]
+                positions[frames, bone] = position
+
+            if anim.nextoffset == 0:
+                break
+            anim_offset += anim.nextoffset
+    return positions, quaternions
+
+
+class Animation:
+    def __init__(
+        self,
+        name: str,
+        fps: float,
+        flags: int,
+        positions: np.ndarray,
+        quaternions: np.ndarray,
+    ):
+        self.name = name
+        self.fps = fps
+        self.flags = flags
+        self.positions = positions
+        self.quaternions = quaternions
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.positions)
+
+    @property
+    def looping(self) -> bool:
+        return bool(self.flags & STUDIO_LOOPING)
+
+    def frames_at(self, seconds: np.ndarray) -> np.ndarray:
+        return np.asarray(seconds, dtype=np.float32) * self.fps
+
+    def sample(self, frames: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Local positions (..., bones, 3) and quaternions (..., bones, 4) at
+        fractional `frames` of any shape (frames, instances...), frames are
+        interpolated with lerp/slerp"""
+        frames = np.asarray(frames, dtype=np.float32)
+        last = self.num_frames - 1
+        if self.looping and last > 0:
+            frames = np.mod(frames, last)
+        frames = np.clip(frames, 0, last)
+        first = np.floor(frames).astype(np.int64)
+        second = np.minimum(first + 1, last)
+        t = frames - first
+        positions = self.positions[first] + t[..., None, None] * (
+            self.positions[second] - self.positions[first]
+        )
+        quaternions = slerp(
+            self.quaternions[first],
+            self.quaternions[second],
+            np.broadcast_to(t[..., None], t.shape + (self.quaternions.shape[1],)),
+        )
+        return positions, quaternions
+
+    def local_matrices(self, frames: np.ndarray) -> np.ndarray:
+        return compose(*self.sample(frames))
+
+    def poses(self, skeleton: Skeleton, frames: np.ndarray) -> np.ndarray:
+        """Bone-to-model matrices (..., bones, 3, 4) for every entry of
+        `frames`, e.g. one frame per instance of an animated prop"""
+        return skeleton.world_matrices(self.local_matrices(frames))
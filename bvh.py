@@ -0,0 +1,384 @@
+"""Bounding volume hierarchy over the triangles of a mesh.
+
+Nodes live in flat arrays: children of an inner node are `left` and
+`left + 1`, leaves (count > 0) own order[start:start + count]. Queries
+traverse breadth-first for a whole batch at once, every step works on all
+(query, node) pairs still alive.
+"""
+import numpy as np
+
+from gmod.aabb import ray_aabb
+from gmod.misc import concat_ranges
+
+# queries traversed together, bounds the size of the (query, node) frontier
+QUERY_BATCH = 4096
+SAH_BINS = 16
+# cost of visiting a node relative to intersecting one triangle
+TRAVERSAL_COST = 1.0
+
+
+def ray_triangles(
+    origins: np.ndarray,
+    directions: np.ndarray,
+    v0: np.ndarray,
+    v1: np.ndarray,
+    v2: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Two sided Moller-Trumbore for (..., 3) rays against (..., 3) triangle
+    corners. Returns (t, u, v), t is inf where the ray misses."""
+    edge1 = v1 - v0
+    edge2 = v2 - v0
+    p = np.cross(directions, edge2)
+    det = np.einsum("...i,...i->...", edge1, p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inverse = 1.0 / det
+        s = origins - v0
+        u = np.einsum("...i,...i->...", s, p) * inverse
+        q = np.cross(s, edge1)
+        v = np.einsum("...i,...i->...", directions, q) * inverse
+        t = np.einsum("...i,...i->...", edge2, q) * inverse
+        hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf), u, v
+
+
+def closest_point_triangles(
+    points: np.ndarray, a: np.ndarray, b: np.ndarray, c: np.ndarray
+) -> np.ndarray:
+    """Closest points on (..., 3) triangles to (..., 3) points, Voronoi
+    region test from Ericson's Real-Time Collision Detection 5.1.5"""
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = np.einsum("...i,...i->...", ab, ap)
+    d2 = np.einsum("...i,...i->...", ac, ap)
+    d3 = np.einsum("...i,...i->...", ab, bp)
+    d4 = np.einsum("...i,...i->...", ac, bp)
+    d5 = np.einsum("...i,...i->...", ab, cp)
+    d6 = np.einsum("...i,...i->...", ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = 1.0 / (va + vb + vc)
+        closest = a + ab * (vb * denom)[..., None] + ac * (vc * denom)[..., None]
+        # regions are applied from the lowest to the highest priority
+        regions = (
+            (
+                (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0),
+                b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))[..., None],
+            ),
+            ((vb <= 0) & (d2 >= 0) & (d6 <= 0), a + ac * (d2 / (d2 - d6))[..., None]),
+            ((d6 >= 0) & (d5 <= d6), c),
+            ((vc <= 0) & (d1 >= 0) & (d3 <= 0), a + ab * (d1 / (d1 - d3))[..., None]),
+            ((d3 >= 0) & (d4 <= d3), b),
+            ((d1 <= 0) & (d2 <= 0), a),
+        )
+        for mask, point in regions:
+            closest = np.where(mask[..., None], point, closest)
+    return closest
+
+
+def box_distance_squared(
+    points: np.ndarray, mins: np.ndarray, maxs: np.ndarray
+) -> np.ndarray:
+    delta = np.maximum(np.maximum(mins - points, points - maxs), 0.0)
+    return np.einsum("...i,...i->...", delta, delta)
+
+
+def _surface_area(mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+    size = maxs - mins
+    x, y, z = size[..., 0], size[..., 1], size[..., 2]
+    return x * y + y * z + z * x
+
+
+class TriangleBVH:
+    def __init__(
+        self,
+        vertices: np.ndarray,
+        triangles: np.ndarray,
+        leaf_size: int = 4,
+        split: str = "sah",
+    ):
+        """`vertices` (N, 3) positions, `triangles` (T, 3) vertex indices.
+        `split` is "sah" (binned surface area heuristic) or "median"."""
+        if split not in ("sah", "median"):
+            raise ValueError(f"Unknown split method {split}")
+        self.vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.triangles = np.ascontiguousarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.leaf_size = leaf_size
+        self.split = split
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.triangles)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_min)
+
+    def _build(self):
+        corners = self.vertices[self.triangles]
+        tri_min = corners.min(axis=1)
+        tri_max = corners.max(axis=1)
+        centroids = (tri_min + tri_max) * 0.5
+
+        num_triangles = len(self.triangles)
+        # a binary tree with leaves of at least one triangle
+        capacity = max(1, 2 * num_triangles - 1)
+        node_min = np.zeros((capacity, 3), dtype=np.float32)
+        node_max = np.zeros((capacity, 3), dtype=np.float32)
+        node_left = np.full(capacity, -1, dtype=np.int32)
+        node_start = np.zeros(capacity, dtype=np.int32)
+        node_count = np.zeros(capacity, dtype=np.int32)
+        order = np.arange(num_triangles, dtype=np.int64)
+
+        num_nodes = 1
+        stack = [(0, 0, num_triangles)]
+        while stack:
+            node, start, end = stack.pop()
+            members = order[start:end]
+            if len(members):
+                node_min[node] = tri_min[members].min(axis=0)
+                node_max[node] = tri_max[members].max(axis=0)
+            mid = (
+                self._split(members, centroids, tri_min, tri_max)
+                if len(members) > self.leaf_size
+                else None
+            )
+            if mid is None:
+                node_start[node] = start
+                node_count[node] = len(members)
+                continue
+            order[start:end] = members[mid[1]]
+            node_left[node] = num_nodes
+            stack.append((num_nodes, start, start + mid[0]))
+            stack.append((num_nodes + 1, start + mid[0], end))
+            num_nodes += 2
+
+        self.node_min = node_min[:num_nodes]
+        self.node_max = node_max[:num_nodes]
+        self.node_left = node_left[:num_nodes]
+        self.node_start = node_start[:num_nodes]
+        self.node_count = node_count[:num_nodes]
+        self.order = order
+
+    def _split(
+        self,
+        members: np.ndarray,
+        centroids: np.ndarray,
+        tri_min: np.ndarray,
+        tri_max: np.ndarray,
+    ) -> tuple[int, np.ndarray] | None:
+        """(size of the left half, permutation of `members`) or None to make
+        a leaf"""
+        points = centroids[members]
+        low = points.min(axis=0)
+        extent = points.max(axis=0) - low
+        if not np.any(extent > 0):
+            # every centroid in one spot, no plane separates them
+            return None
+
+        if self.split == "median":
+            axis = int(np.argmax(extent))
+            half = len(members) // 2
+            return half, np.argpartition(points[:, axis], half)
+
+        scale = SAH_BINS / np.where(extent > 0, extent, 1.0)
+        bins = np.minimum(((points - low) * scale).astype(np.int64), SAH_BINS - 1)
+        best_cost, best_axis, best_plane = np.inf, -1, -1
+        for axis in np.flatnonzero(extent > 0):
+            counts = np.bincount(bins[:, axis], minlength=SAH_BINS)
+            bin_min = np.full((SAH_BINS, 3), np.inf, dtype=np.float32)
+            bin_max = np.full((SAH_BINS, 3), -np.inf, dtype=np.float32)
+            np.minimum.at(bin_min, bins[:, axis], tri_min[members])
+            np.maximum.at(bin_max, bins[:, axis], tri_max[members])
+            # cost of every plane between bin i and bin i + 1
+            left_count = np.cumsum(counts)[:-1]
+            right_count = np.cumsum(counts[::-1])[::-1][1:]
+            left_area = _surface_area(
+                np.minimum.accumulate(bin_min)[:-1],
+                np.maximum.accumulate(bin_max)[:-1],
+            )
+            right_area = _surface_area(
+                np.minimum.accumulate(bin_min[::-1])[::-1][1:],
+                np.maximum.accumulate(bin_max[::-1])[::-1][1:],
+            )
+            with np.errstate(invalid="ignore"):
+                cost = np.where(
+                    (left_count > 0) & (right_count > 0),
+                    left_count * left_area + right_count * right_area,
+                    np.inf,
+                )
+            plane = int(np.argmin(cost))
+            if cost[plane] < best_cost:
+                best_cost, best_axis, best_plane = cost[plane], axis, plane
+
+        node_area = _surface_area(
+            tri_min[members].min(axis=0), tri_max[members].max(axis=0)
+        )
+        leaf_cost = len(members)
+        split_cost = TRAVERSAL_COST + best_cost / max(node_area, 1e-30)
+        if best_axis < 0 or (
+            split_cost >= leaf_cost and len(members) <= 4 * self.leaf_size
+        ):
+            return None
+        left = bins[:, best_axis] <= best_plane
+        permutation = np.argsort(~left, kind="stable")
+        return int(np.count_nonzero(left)), permutation
+
+    def _leaf_pairs(
+        self, queries: np.ndarray, nodes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(query, triangle) pairs of every (query, leaf) pair"""
+        counts = self.node_count[nodes]
+        return (
+            np.repeat(queries, counts),
+            self.order[concat_ranges(self.node_start[nodes], counts)],
+        )
+
+    def _descend(
+        self, queries: np.ndarray, nodes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        left = self.node_left[nodes]
+        return (
+            np.repeat(queries, 2),
+            np.stack([left, left + 1], axis=1).reshape(-1),
+        )
+
+    def ray_query(
+        self,
+        origins: np.ndarray,
+        directions: np.ndarray,
+        max_distance: float = np.inf,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Nearest triangle hit by each ray. Returns (triangles, distances,
+        barycentrics): triangle -1 and distance inf on a miss, distances are
+        in units of the direction length, barycentrics (rays, 2) are (u, v)
+        of the hit point v0 + u * (v1 - v0) + v * (v2 - v0)."""
+        origins = np.asarray(origins, dtype=np.float32).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float32).reshape(-1, 3)
+        hit_triangles = np.full(len(origins), -1, dtype=np.int64)
+        barycentrics = np.zeros((len(origins), 2), dtype=np.float32)
+        if len(self) == 0:
+            return hit_triangles, np.full(len(origins), np.inf), barycentrics
+
+        best = np.full(len(origins), max_distance, dtype=np.float32)
+        for batch_start in range(0, len(origins), QUERY_BATCH):
+            batch_end = min(batch_start + QUERY_BATCH, len(origins))
+            rays = np.arange(batch_start, batch_end)
+            nodes = np.zeros(len(rays), dtype=np.int64)
+            while len(rays):
+                near = ray_aabb(
+                    origins[rays],
+                    directions[rays],
+                    self.node_min[nodes],
+                    self.node_max[nodes],
+                )
+                alive = np.isfinite(near) & (near <= best[rays])
+                rays, nodes = rays[alive], nodes[alive]
+                leaf = self.node_count[nodes] > 0
+
+                pair_rays, pair_triangles = self._leaf_pairs(rays[leaf], nodes[leaf])
+                corners = self.vertices[self.triangles[pair_triangles]]
+                t, u, v = ray_triangles(
+                    origins[pair_rays],
+                    directions[pair_rays],
+                    corners[:, 0],
+                    corners[:, 1],
+                    corners[:, 2],
+                )
+                closer = np.isfinite(t) & (t <= best[pair_rays])
+                np.minimum.at(best, pair_rays[closer], t[closer])
+                # several triangles can tie, the last write wins
+                won = closer & (t == best[pair_rays])
+                hit_triangles[pair_rays[won]] = pair_triangles[won]
+                barycentrics[pair_rays[won], 0] = u[won]
+                barycentrics[pair_rays[won], 1] = v[won]
+
+                rays, nodes = self._descend(rays[~leaf], nodes[~leaf])
+        distances = np.where(hit_triangles >= 0, best, np.inf).astype(np.float32)
+        return hit_triangles, distances, barycentrics
+
+    def segment_query(
+        self, starts: np.ndarray, ends: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ray_query() limited to the segments, distances are fractions of
+        the segment from its start"""
+        starts = np.asarray(starts, dtype=np.float32).reshape(-1, 3)
+        ends = np.asarray(ends, dtype=np.float32).reshape(-1, 3)
+        return self.ray_query(starts, ends - starts, max_distance=1.0)
+
+    def closest_point(
+        self, points: np.ndarray, max_distance: float = np.inf
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Closest point on the mesh to each point. Returns (triangles,
+        closest points, distances), triangle -1 where nothing is within
+        `max_distance`."""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        nearest = np.full(len(points), -1, dtype=np.int64)
+        closest = np.zeros((len(points), 3), dtype=np.float32)
+        best = np.full(len(points), np.float32(max_distance) ** 2, dtype=np.float32)
+        if len(self) == 0:
+            return nearest, closest, np.sqrt(best)
+
+        def visit_leaves(queries: np.ndarray, leaves: np.ndarray):
+            pair_points, pair_triangles = self._leaf_pairs(queries, leaves)
+            corners = self.vertices[self.triangles[pair_triangles]]
+            candidates = closest_point_triangles(
+                points[pair_points], corners[:, 0], corners[:, 1], corners[:, 2]
+            )
+            delta = candidates - points[pair_points]
+            distance = np.einsum("ij,ij->i", delta, delta)
+            closer = distance <= best[pair_points]
+            np.minimum.at(best, pair_points[closer], distance[closer])
+            won = closer & (distance == best[pair_points])
+            nearest[pair_points[won]] = pair_triangles[won]
+            closest[pair_points[won]] = candidates[won]
+
+        for batch_start in range(0, len(points), QUERY_BATCH):
+            queries = np.arange(
+                batch_start, min(batch_start + QUERY_BATCH, len(points))
+            )
+            # greedy descent into the nearer child gives every point an upper
+            # bound that prunes most of the breadth-first pass below
+            nodes = np.zeros(len(queries), dtype=np.int64)
+            inner = self.node_count[nodes] == 0
+            while np.any(inner):
+                left = self.node_left[nodes[inner]]
+                to_left = box_distance_squared(
+                    points[queries[inner]], self.node_min[left], self.node_max[left]
+                )
+                to_right = box_distance_squared(
+                    points[queries[inner]],
+                    self.node_min[left + 1],
+                    self.node_max[left + 1],
+                )
+                nodes[inner] = np.where(to_left <= to_right, left, left + 1)
+                inner = self.node_count[nodes] == 0
+            visit_leaves(queries, nodes)
+
+            nodes = np.zeros(len(queries), dtype=np.int64)
+            while len(queries):
+                distance = box_distance_squared(
+                    points[queries], self.node_min[nodes], self.node_max[nodes]
+                )
+                alive = distance <= best[queries]
+                queries, nodes = queries[alive], nodes[alive]
+                leaf = self.node_count[nodes] > 0
+                visit_leaves(queries[leaf], nodes[leaf])
+                queries, nodes = self._descend(queries[~leaf], nodes[~leaf])
+        return nearest, closest, np.sqrt(best)
+
+    def snap_vertices(
+        self, points: np.ndarray, max_distance: float = np.inf
+    ) -> np.ndarray:
+        """Nearest corner of the closest triangle to each point, -1 where
+        nothing is within `max_distance`"""
+        nearest, closest, _ = self.closest_point(points, max_distance)
+        corners = self.triangles[np.maximum(nearest, 0)]
+        distance = np.linalg.norm(self.vertices[corners] - closest[:, None], axis=2)
+        vertices = corners[np.arange(len(corners)), np.argmin(distance, axis=1)]
+        return np.where(nearest >= 0, vertices, -1)
@@ -0,0 +1,192 @@
+"""Header-only index of every .mdl under a directory.
+
+Only studiohdr_t, the texture table and the texture name strings are read,
+with a few small reads per model; VVD and VTX files are never opened.
+"""
+import ctypes
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from gmod.misc import struct_array
+from gmod.mdl_structs import mstudiotexture_t, studiohdr_t
+
+STUDIO_FILE_ID = int.from_bytes(b"IDST", "little")
+# longest texture name read, names are MAX_PATH bounded in studiomdl
+MAX_NAME_LENGTH = 260
+# texture names further apart than this are read one by one
+MAX_NAME_SPAN = 1 << 16
+# paths handed to a worker at once
+SCAN_CHUNK = 256
+
+CATALOG_DTYPE = np.dtype(
+    [
+        ("name", "U64"),
+        ("checksum", np.int32),
+        ("flags", np.int32),
+        ("hull_min", np.float32, 3),
+        ("hull_max", np.float32, 3),
+        ("view_bbmin", np.float32, 3),
+        ("view_bbmax", np.float32, 3),
+        ("bone_count", np.int32),
+        ("texture_count", np.int32),
+        ("bodypart_count", np.int32),
+        ("texture_start", np.int64),
+    ]
+)
+
+
+class Catalog(NamedTuple):
+    """`entries` (CATALOG_DTYPE) of every model, entry i was read from
+    paths[i] and its texture names are
+    texture_names[texture_start:texture_start + texture_count]. Both string
+    tables are as wide as their longest string, so nothing is cut short."""
+
+    entries: np.ndarray
+    texture_names: np.ndarray
+    paths: np.ndarray
+
+    def textures(self, row: int) -> list[str]:
+        start = self.entries["texture_start"][row]
+        return self.texture_names[
+            start : start + self.entries["texture_count"][row]
+        ].tolist()
+
+    def find(self, path: str) -> int:
+        rows = np.flatnonzero(self.paths == path)
+        if len(rows) == 0:
+            raise KeyError(path)
+        return int(rows[0])
+
+
+def _vector(vector) -> tuple[float, float, float]:
+    return (vector.x, vector.y, vector.z)
+
+
+def _cstring(data: bytes, offset: int) -> str:
+    end = data.find(b"\0", offset)
+    return data[offset : end if end >= 0 else len(data)].decode("ascii", "replace")
+
+
+def _read_at(file, size: int, offset: int) -> bytes:
+    file.seek(offset)
+    return file.read(size)
+
+
+def read_header(path: str) -> tuple[tuple, list[str]]:
+    """One CATALOG_DTYPE row (texture_start left at 0) and the texture
+    names"""
+    with open(path, "rb") as file:
+        data = _read_at(file, ctypes.sizeof(studiohdr_t), 0)
+        if len(data) < ctypes.sizeof(studiohdr_t):
+            raise RuntimeError(f"{path} is too short for a studiohdr_t")
+        header = studiohdr_t.from_buffer_copy(data)
+        if header.id != STUDIO_FILE_ID:
+            raise RuntimeError(f"{path} is not a studio model (id {header.id:#x})")
+
+        count = max(header.texture_count, 0)
+        table = _read_at(
+            file, count * ctypes.sizeof(mstudiotexture_t), header.texture_offset
+        )
+        textures = struct_array(
+            table, mstudiotexture_t, 0, len(table) // ctypes.sizeof(mstudiotexture_t)
+        )
+        name_offsets = (
+            header.texture_offset
+            + np.arange(len(textures), dtype=np.int64)
+            * ctypes.sizeof(mstudiotexture_t)
+            + textures["name_offset"]
+        )
+        names = []
+        if len(name_offsets):
+            # studiomdl writes every string into one table, usually one read
+            first = int(name_offsets.min())
+            span = int(name_offsets.max()) - first + MAX_NAME_LENGTH
+            if span <= MAX_NAME_SPAN:
+                strings = _read_at(file, span, first)
+                names = [
+                    _cstring(strings, int(offset) - first) for offset in name_offsets
+                ]
+            else:
+                names = [
+                    _cstring(_read_at(file, MAX_NAME_LENGTH, int(offset)), 0)
+                    for offset in name_offsets
+                ]
+
+    row = (
+        header.name.decode("ascii", "replace"),
+        header.checksum,
+        header.flags,
+        _vector(header.hull_min),
+        _vector(header.hull_max),
+        _vector(header.view_bbmin),
+        _vector(header.view_bbmax),
+        header.bone_count,
+        len(names),
+        header.bodypart_count,
+        0,
+    )
+    return row, names
+
+
+def _read_headers(
+    paths: list[str],
+) -> list[tuple[str, tuple, list[str]] | str]:
+    """Worker side: rows of the readable models, error messages otherwise"""
+    results: list[tuple[str, tuple, list[str]] | str] = []
+    for path in paths:
+        try:
+            results.append((path, *read_header(path)))
+        except (OSError, RuntimeError, ValueError) as error:
+            results.append(f"Skipping {path}: {error}")
+    return results
+
+
+def iter_models(root: str) -> Iterator[str]:
+    for directory, _, files in os.walk(root):
+        for file in files:
+            if file.lower().endswith(".mdl"):
+                yield os.path.join(directory, file)
+
+
+def scan_models(
+    root_or_paths: str | list[str], workers: int | None = None
+) -> Catalog:
+    """Catalog of every .mdl under a directory (or of a list of paths),
+    headers are read on `workers` processes (default: all cores, 1 reads
+    in this process)"""
+    paths = (
+        sorted(iter_models(root_or_paths))
+        if isinstance(root_or_paths, str)
+        else list(root_or_paths)
+    )
+    chunks = [paths[i : i + SCAN_CHUNK] for i in range(0, len(paths), SCAN_CHUNK)]
+    if workers == 1 or len(chunks) <= 1:
+        results = [result for chunk in chunks for result in _read_headers(chunk)]
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = [
+                result
+                for chunk_results in executor.map(_read_headers, chunks)
+                for result in chunk_results
+            ]
+
+    rows = []
+    model_paths: list[str] = []
+    texture_names: list[str] = []
+    for result in results:
+        if isinstance(result, str):
+            warnings.warn(result)
+            continue
+        path, row, names = result
+        rows.append(row[:-1] + (len(texture_names),))
+        model_paths.append(path)
+        texture_names.extend(names)
+    return Catalog(
+        np.array(rows, dtype=CATALOG_DTYPE),
+        np.array(texture_names, dtype=str),
+        np.array(model_paths, dtype=str),
+    )
@@ -0,0 +1,217 @@
+"""Props of an AdvDupe2 contraption as flat arrays for scene export.
+
+Every entity with a model becomes one row; transforms come from its first
+physics object, relative to the dupe's head entity like in the file.
+"""
+import warnings
+from typing import Iterator, NamedTuple
+
+import numpy as np
+
+from gmod.advdupe2 import AdvDupe2
+from gmod.lod import compact_vertices
+from gmod.mdl import Bodygroups
+from gmod.mesh_optimize import optimize_mesh
+from gmod.misc import concat_ranges
+from gmod.model_repository import ModelRepository
+from gmod.skeleton import compose, qangle_quaternion
+
+
+class DupeProps(NamedTuple):
+    """`model` indexes `models` per prop, `bodygroups` holds the BodyG
+    table ({bodypart: choice}) of every prop"""
+
+    models: list[str]
+    model: np.ndarray
+    entity: np.ndarray
+    positions: np.ndarray
+    angles: np.ndarray
+    skin: np.ndarray
+    bodygroups: list[dict[int, int]]
+
+    def __len__(self) -> int:
+        return len(self.model)
+
+    @property
+    def quaternions(self) -> np.ndarray:
+        return qangle_quaternion(self.angles)
+
+    @property
+    def matrices(self) -> np.ndarray:
+        """(P, 3, 4) prop to dupe transforms"""
+        return compose(self.positions, self.quaternions)
+
+    def body_values(self, rows: np.ndarray, bodygroups: Bodygroups) -> np.ndarray:
+        """Bodygroup value of each of `rows` for a model's bodygroups,
+        invalid BodyG tables fall back to 0 like the engine does"""
+        values = np.zeros(len(rows), dtype=np.int64)
+        for i, row in enumerate(rows.tolist()):
+            table = self.bodygroups[row]
+            if not table:
+                continue
+            choices = np.zeros(len(bodygroups.bases), dtype=np.int64)
+            try:
+                for bodypart, choice in table.items():
+                    choices[int(bodypart)] = int(choice)
+                values[i] = bodygroups.body_value(choices)
+            except (IndexError, ValueError):
+                warnings.warn(f"Invalid bodygroups {table} of entity {self.entity[row]}")
+        return values
+
+    def variants(
+        self, rows: np.ndarray, bodygroups: Bodygroups
+    ) -> Iterator[tuple[int, int, np.ndarray]]:
+        """(skin, body value, rows) of the props of one model that look the
+        same"""
+        keys, inverse = np.unique(
+            np.stack([self.skin[rows], self.body_values(rows, bodygroups)], axis=1),
+            axis=0,
+            return_inverse=True,
+        )
+        for variant, (skin, body) in enumerate(keys.tolist()):
+            yield skin, body, rows[inverse.reshape(-1) == variant]
+
+    def groups(self) -> Iterator[tuple[str, np.ndarray]]:
+        """(model path, prop rows) for every unique model"""
+        order = np.argsort(self.model, kind="stable")
+        splits = np.flatnonzero(np.diff(self.model[order])) + 1
+        for rows in np.split(order, splits) if len(order) else []:
+            yield self.models[int(self.model[rows[0]])], rows
+
+
+def dupe_props(dupe: AdvDupe2 | dict) -> DupeProps:
+    """Props of a decoded dupe (AdvDupe2 or its `dupe` dict), entities
+    without a model or transform are skipped with a warning"""
+    entities = (dupe.dupe if isinstance(dupe, AdvDupe2) else dupe)["Entities"]
+    model_ids: dict[str, int] = {}
+    models: list[str] = []
+    rows = []
+    for key, entity in entities.items():
+        model = entity.get("Model")
+        if not model:
+            continue
+        physics_objects = entity.get("PhysicsObjects") or {}
+        if isinstance(physics_objects, list):
+            physics_objects = dict(enumerate(physics_objects))
+        physics = physics_objects.get(0) or entity
+        if not physics.get("Pos") or not physics.get("Angle"):
+            warnings.warn(f"Entity {key} ({model}) has no position, skipping it")
+            continue
+        # the spelling is kept for case sensitive file systems, props are
+        # grouped case insensitively like the engine does
+        model = model.replace("\\", "/")
+        model_id = model_ids.setdefault(model.lower(), len(model_ids))
+        if model_id == len(models):
+            models.append(model)
+        bodygroups = entity.get("BodyG") or {}
+        if isinstance(bodygroups, list):
+            # sequences decode as lists, Lua indices start at 1
+            bodygroups = dict(enumerate(bodygroups, 1))
+        rows.append(
+            (
+                model_id,
+                int(key),
+                physics["Pos"],
+                physics["Angle"],
+                int(entity.get("Skin") or 0),
+                dict(bodygroups),
+            )
+        )
+
+    return DupeProps(
+        models,
+        np.array([row[0] for row in rows], dtype=np.int64),
+        np.array([row[1] for row in rows], dtype=np.int64),
+        np.array([row[2] for row in rows], dtype=np.float64).reshape(-1, 3),
+        np.array([row[3] for row in rows], dtype=np.float64).reshape(-1, 3),
+        np.array([row[4] for row in rows], dtype=np.int64),
+        [row[5] for row in rows],
+    )
+
+
+class Batch(NamedTuple):
+    """Every triangle of one material in dupe space: (N, 8) vertices and a
+    triangle list into them. `texture_dirs` are the $cdmaterials of the
+    model the material came from first."""
+
+    material: str
+    texture_dirs: list[str]
+    vertices: np.ndarray
+    indices: np.ndarray
+
+
+def transform_vertices(vertices: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """(N, 8) vertices placed by each of (P, 3, 4) rigid matrices, (P * N, 8)
+    with the copies in matrix order"""
+    rotation = matrices[:, :, :3].astype(np.float32)
+    out = np.empty((len(matrices), len(vertices), 8), dtype=np.float32)
+    out[:, :, :3] = np.einsum("pij,nj->pni", rotation, vertices[:, :3])
+    out[:, :, :3] += matrices[:, None, :, 3]
+    out[:, :, 3:6] = np.einsum("pij,nj->pni", rotation, vertices[:, 3:6])
+    out[:, :, 6:8] = vertices[:, 6:8]
+    return out.reshape(-1, 8)
+
+
+def _merge(
+    parts: list[tuple[np.ndarray, np.ndarray]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenated vertices and triangle lists, indices rebased by the
+    vertex count of the parts before them"""
+    counts = np.array([len(vertices) for vertices, _ in parts], dtype=np.int64)
+    bases = np.cumsum(counts) - counts
+    index_counts = [len(indices) for _, indices in parts]
+    vertices = np.concatenate([vertices for vertices, _ in parts])
+    index_dtype = np.uint16 if len(vertices) <= 0x10000 else np.uint32
+    indices = np.concatenate([indices for _, indices in parts]).astype(np.int64)
+    indices += np.repeat(bases, index_counts)
+    return vertices, indices.astype(index_dtype)
+
+
+def batch_props(
+    props: DupeProps, repository: ModelRepository, lod: int = 0, optimize: bool = True
+) -> list[Batch]:
+    """Static batches of a dupe, one per material: the geometry of every
+    (model, skin, bodygroup) is placed by all its props' matrices at once
+    and merged with the other models using the same material. `optimize`
+    welds and cache orders each model's part first (see mesh_optimize)."""
+    matrices = props.matrices
+    parts: dict[str, list[tuple[np.ndarray, np.ndarray]]] = {}
+    names: dict[str, tuple[str, list[str]]] = {}
+    for model_path, model_rows in props.groups():
+        try:
+            handle = repository.acquire(model_path)
+        except (OSError, RuntimeError, NotImplementedError) as error:
+            warnings.warn(
+                f"Skipping {len(model_rows)} props of {model_path}: {error}"
+            )
+            continue
+        with handle:
+            model = handle.model
+            for skin, body, rows in props.variants(model_rows, model.bodygroups):
+                mesh = model.assemble(body, lod)
+                materials = model.skins.mesh_materials(mesh.meshes, skin)
+                for material in np.unique(materials).tolist():
+                    meshes = mesh.meshes[materials == material]
+                    vertices, indices = compact_vertices(
+                        mesh.vertices,
+                        mesh.indices[
+                            concat_ranges(meshes["index_start"], meshes["index_count"])
+                        ],
+                    )
+                    if optimize:
+                        vertices, indices, _ = optimize_mesh(vertices, indices)
+                    placed = transform_vertices(vertices, matrices[rows])
+                    copies = (
+                        indices.astype(np.int64)[None]
+                        + np.arange(len(rows), dtype=np.int64)[:, None] * len(vertices)
+                    )
+                    name = model.skins.material_names[material]
+                    key = "/".join(model.texture_dirs[:1] + [name])
+                    key = key.replace("\\", "/").lower()
+                    names.setdefault(key, (name, list(model.texture_dirs)))
+                    parts.setdefault(key, []).append((placed, copies.reshape(-1)))
+
+    return [
+        Batch(*names[key], *_merge(material_parts))
+        for key, material_parts in parts.items()
+    ]
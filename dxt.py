@@ -1,6 +1,8 @@
 """
 Taken from https://github.com/Benjamin-Dobell/s3tc-dxt-decompression/blob/master/s3tc.cpp
 """
+import numpy as np
+
 def dxt1(data: bytes, width: int, height: int) -> bytearray:
     "dxt1 to raw"
     print(width, height)
@@ -160,6 +162,81 @@ def block_decompress_image_dxt5(width: int, height: int, blockStorage: bytes) ->
     print("xuy2", len(image))
     return image
 
+
+def _expand_565(colors: np.ndarray) -> np.ndarray:
+    """(...,) RGB565 to (..., 3) int32 RGB888, rounded like the functions above"""
+    colors = colors.astype(np.int32)
+    r = (colors >> 11) * 255 + 16
+    g = ((colors & 0x07E0) >> 5) * 255 + 32
+    b = (colors & 0x001F) * 255 + 16
+    return np.stack([(r // 32 + r) // 32, (g // 64 + g) // 64, (b // 32 + b) // 32], axis=-1)
+
+
+def _color_blocks(blocks: np.ndarray, four_color: bool) -> np.ndarray:
+    """(N, 8) uint8 color blocks to (N, 16, 4) RGBA texels"""
+    color0 = blocks[:, 0:2].copy().view("<u2")[:, 0]
+    color1 = blocks[:, 2:4].copy().view("<u2")[:, 0]
+    code = blocks[:, 4:8].copy().view("<u4")[:, 0]
+    c0 = _expand_565(color0)
+    c1 = _expand_565(color1)
+
+    palette = np.empty((len(blocks), 4, 4), dtype=np.int32)
+    palette[:, :, 3] = 255
+    palette[:, 0, :3] = c0
+    palette[:, 1, :3] = c1
+    # DXT5 color blocks always use the 4 color mode
+    opaque = (color0 > color1)[:, None] | four_color
+    palette[:, 2, :3] = np.where(opaque, (2 * c0 + c1) // 3, (c0 + c1) // 2)
+    palette[:, 3, :3] = np.where(opaque, (c0 + 2 * c1) // 3, 0)
+    palette[:, 3, 3] = np.where(opaque[:, 0], 255, 0)
+
+    selectors = (code[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 0x03
+    return np.take_along_axis(palette, selectors[:, :, None].astype(np.intp), axis=1)
+
+
+def _alpha_blocks(blocks: np.ndarray) -> np.ndarray:
+    """(N, 8) uint8 DXT5 alpha blocks to (N, 16) alpha values"""
+    alpha0 = blocks[:, 0].astype(np.int32)[:, None]
+    alpha1 = blocks[:, 1].astype(np.int32)[:, None]
+    bits = np.zeros((len(blocks), 8), dtype=np.uint8)
+    bits[:, :6] = blocks[:, 2:8]
+    code = bits.view("<u8")[:, 0]
+    selectors = ((code[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & 0x07).astype(np.int32)
+
+    i = np.arange(8, dtype=np.int32)
+    eight = ((8 - i) * alpha0 + (i - 1) * alpha1) // 7
+    six = np.where(i == 6, 0, np.where(i == 7, 255, ((6 - i) * alpha0 + (i - 1) * alpha1) // 5))
+    palette = np.where(alpha0 > alpha1, eight, six)
+    palette[:, 0] = alpha0[:, 0]
+    palette[:, 1] = alpha1[:, 0]
+    return np.take_along_axis(palette, selectors, axis=1)
+
+
+def _blocks_to_image(texels: np.ndarray, width: int, height: int) -> np.ndarray:
+    """(N, 16, 4) texels of row-major 4x4 blocks to an (height, width, 4) image"""
+    blocks_x = (width + 3) // 4
+    blocks_y = (height + 3) // 4
+    image = texels.reshape(blocks_y, blocks_x, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    image = image.reshape(blocks_y * 4, blocks_x * 4, 4)
+    return np.ascontiguousarray(image[:height, :width]).astype(np.uint8)
+
+
+def decompress_dxt1(data: bytes, width: int, height: int) -> np.ndarray:
+    """Whole DXT1 image to (height, width, 4) uint8 RGBA"""
+    count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(data, np.uint8, count * 8).reshape(-1, 8)
+    return _blocks_to_image(_color_blocks(blocks, False), width, height)
+
+
+def decompress_dxt5(data: bytes, width: int, height: int) -> np.ndarray:
+    """Whole DXT5 image to (height, width, 4) uint8 RGBA"""
+    count = ((width + 3) // 4) * ((height + 3) // 4)
+    blocks = np.frombuffer(data, np.uint8, count * 16).reshape(-1, 16)
+    texels = _color_blocks(blocks[:, 8:], True)
+    texels[:, :, 3] = _alpha_blocks(blocks[:, :8])
+    return _blocks_to_image(texels, width, height)
+
+
 def main():
     with open(r"C:\Users\megaz\Downloads\tracks_wood1688954074.dxt5", "rb") as file:
         compressed = file.read()
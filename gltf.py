@@ -0,0 +1,734 @@
+"""Binary glTF 2.0 (.glb) export.
+
+Buffers are written straight from numpy arrays into a temporary file while
+the JSON is built, the .glb is then assembled by copying that file in
+blocks, so large models need little memory beyond their own arrays.
+Source models are Z up and in inches, the root node turns them into glTF's
+Y up meters, the vertex data itself is written unchanged.
+"""
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import warnings
+import zlib
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from gmod.dupe_scene import Batch, DupeProps
+from gmod.dxt import decompress_dxt1, decompress_dxt5
+from gmod.mdl import BoneWeights, SourceModel
+from gmod.mesh_optimize import WELD_STEPS, optimize_mesh
+from gmod.misc import concat_ranges
+from gmod.model_repository import ModelRepository
+from gmod.vmt import VMT, VMTParseError
+from gmod.vtf import VTF, ImageFormat
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+COMPONENT_TYPES = {
+    np.dtype(np.int8): 5120,
+    np.dtype(np.uint8): 5121,
+    np.dtype(np.int16): 5122,
+    np.dtype(np.uint16): 5123,
+    np.dtype(np.uint32): 5125,
+    np.dtype(np.float32): 5126,
+}
+ACCESSOR_TYPES = {1: "SCALAR", 2: "VEC2", 3: "VEC3", 4: "VEC4", 16: "MAT4"}
+
+INCHES_TO_METERS = 0.0254
+# -90 degrees around x: Source's +z becomes glTF's +y
+Z_UP_TO_Y_UP = [-math.sqrt(0.5), 0.0, 0.0, math.sqrt(0.5)]
+# vertices or triangles gathered and written at once
+EXPORT_CHUNK = 1 << 16
+# bytes copied from the temporary buffer file at once
+COPY_CHUNK = 1 << 20
+
+
+def _pad(length: int, alignment: int = 4) -> int:
+    return -length % alignment
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    )
+
+
+def png_chunks(rgba: np.ndarray) -> Iterator[bytes]:
+    """(height, width, 4) uint8 image as PNG pieces, rows are compressed a
+    block at a time so the whole file never sits in memory"""
+    height, width = rgba.shape[:2]
+    yield b"\x89PNG\r\n\x1a\n"
+    yield _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+    compressor = zlib.compressobj()
+    rows_per_block = max(1, EXPORT_CHUNK // max(1, width))
+    for start in range(0, height, rows_per_block):
+        rows = rgba[start : start + rows_per_block]
+        # filter type 0 in front of every row
+        filtered = np.zeros((len(rows), width * 4 + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(len(rows), -1)
+        data = compressor.compress(filtered)
+        if data:
+            yield _png_chunk(b"IDAT", data)
+    yield _png_chunk(b"IDAT", compressor.flush())
+    yield _png_chunk(b"IEND", b"")
+
+
+class GLBWriter:
+    def __init__(self, generator: str = "gmod"):
+        self.gltf: dict = {
+            "asset": {"version": "2.0", "generator": generator},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+        }
+        self._binary = tempfile.TemporaryFile()
+        self._length = 0
+
+    def add(self, kind: str, item: dict) -> int:
+        """Appends `item` to the top level array `kind`, returns its index"""
+        items = self.gltf.setdefault(kind, [])
+        items.append(item)
+        return len(items) - 1
+
+    def add_view(
+        self,
+        chunks: Iterable,
+        target: int | None = None,
+        byte_stride: int | None = None,
+    ) -> int:
+        """Buffer view of the concatenated `chunks` (arrays or bytes-like),
+        each written to the binary chunk as it comes"""
+        padding = _pad(self._length)
+        self._binary.write(bytes(padding))
+        start = self._length = self._length + padding
+        for chunk in chunks:
+            if isinstance(chunk, np.ndarray):
+                chunk = np.ascontiguousarray(chunk)
+            view = memoryview(chunk)
+            self._binary.write(view)
+            self._length += view.nbytes
+        view = {"buffer": 0, "byteOffset": start, "byteLength": self._length - start}
+        if target is not None:
+            view["target"] = target
+        if byte_stride is not None:
+            view["byteStride"] = byte_stride
+        return self.add("bufferViews", view)
+
+    def add_accessor(
+        self,
+        view: int,
+        dtype: np.dtype,
+        count: int,
+        components: int,
+        byte_offset: int = 0,
+        normalized: bool = False,
+        bounds: tuple[np.ndarray, np.ndarray] | None = None,
+    ) -> int:
+        accessor = {
+            "bufferView": view,
+            "componentType": COMPONENT_TYPES[np.dtype(dtype)],
+            "count": int(count),
+            "type": ACCESSOR_TYPES[components],
+        }
+        if byte_offset:
+            accessor["byteOffset"] = int(byte_offset)
+        if normalized:
+            accessor["normalized"] = True
+        if bounds is not None:
+            accessor["min"] = np.asarray(bounds[0]).reshape(-1).tolist()
+            accessor["max"] = np.asarray(bounds[1]).reshape(-1).tolist()
+        return self.add("accessors", accessor)
+
+    def add_array(
+        self, array: np.ndarray, target: int | None = None, normalized: bool = False
+    ) -> int:
+        """Accessor over a whole (N,) or (N, k) array in its own view"""
+        array = np.asarray(array)
+        components = 1 if array.ndim == 1 else int(np.prod(array.shape[1:]))
+        view = self.add_view((array,), target)
+        return self.add_accessor(
+            view, array.dtype, len(array), components, normalized=normalized
+        )
+
+    def add_node(self, node: dict, parent: int | None = None) -> int:
+        """Adds a node under `parent`, or to the scene without one"""
+        index = self.add("nodes", node)
+        if parent is None:
+            self.gltf["scenes"][0]["nodes"].append(index)
+        else:
+            self.gltf["nodes"][parent].setdefault("children", []).append(index)
+        return index
+
+    def add_image(self, rgba: np.ndarray) -> int:
+        view = self.add_view(png_chunks(rgba))
+        return self.add("images", {"bufferView": view, "mimeType": "image/png"})
+
+    def save(self, path: str):
+        """Writes the .glb and drops the temporary buffer"""
+        if self._length:
+            self.gltf["buffers"] = [{"byteLength": self._length}]
+        content = json.dumps(self.gltf, separators=(",", ":")).encode("utf-8")
+        content += b" " * _pad(len(content))
+        binary_padding = _pad(self._length)
+        binary_length = self._length + binary_padding
+        total = 12 + 8 + len(content) + (8 + binary_length if self._length else 0)
+        with open(path, "wb") as file:
+            file.write(struct.pack("<3I", GLB_MAGIC, GLB_VERSION, total))
+            file.write(struct.pack("<2I", len(content), CHUNK_JSON))
+            file.write(content)
+            if self._length:
+                file.write(struct.pack("<2I", binary_length, CHUNK_BIN))
+                self._binary.seek(0)
+                shutil.copyfileobj(self._binary, file, COPY_CHUNK)
+                file.write(bytes(binary_padding))
+        self.close()
+
+    def close(self):
+        self._binary.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _find_file(directory: str, relative: str) -> str | None:
+    """`relative` under `directory`, trying the lower case spelling too since
+    Source paths are case insensitive"""
+    relative = relative.replace("\\", "/").strip("/")
+    for spelling in (relative, relative.lower()):
+        path = os.path.join(directory, spelling)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _materials_root(texture_path: str) -> str:
+    """The materials folder $basetexture paths are relative to"""
+    path = os.path.abspath(texture_path)
+    while True:
+        if os.path.basename(path).lower() == "materials":
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return texture_path
+        path = parent
+
+
+def resolve_material(texture_path: str, name: str) -> tuple[VMT | None, str | None]:
+    """VMT of material `name` and the path of its $basetexture VTF, None
+    for whatever can't be found"""
+    vmt_path = _find_file(texture_path, name + ".vmt")
+    if vmt_path is None:
+        return None, None
+    try:
+        vmt = VMT(vmt_path)
+    except (OSError, UnicodeDecodeError, VMTParseError) as error:
+        warnings.warn(f"Couldn't read {vmt_path}: {error}")
+        return None, None
+    base_texture = vmt.params.get("$basetexture")
+    if not base_texture:
+        return vmt, None
+    base_texture = base_texture.replace("\\", "/")
+    if not base_texture.lower().endswith(".vtf"):
+        base_texture += ".vtf"
+    vtf_path = _find_file(_materials_root(texture_path), base_texture) or _find_file(
+        texture_path, os.path.basename(base_texture)
+    )
+    return vmt, vtf_path
+
+
+def decode_vtf(path: str) -> np.ndarray:
+    """Largest mipmap of a VTF as (height, width, 4) uint8 RGBA"""
+    vtf = VTF(path, os.path.basename(path))
+    data, image_format, width, height = vtf.get_high_res(0)
+    if image_format == ImageFormat.IMAGE_FORMAT_DXT1.value:
+        return decompress_dxt1(data, width, height)
+    if image_format == ImageFormat.IMAGE_FORMAT_DXT5.value:
+        return decompress_dxt5(data, width, height)
+    raise RuntimeError("Format is not supported", ImageFormat(image_format).name)
+
+
+class MaterialExporter:
+    """glTF materials of Source material names, every VMT and VTF is read
+    once per writer. Materials are looked up in `texture_paths` in order."""
+
+    def __init__(self, writer: GLBWriter, texture_paths: list[str]):
+        self.writer = writer
+        self.texture_paths = texture_paths
+        self._materials: dict[str, int] = {}
+        self._textures: dict[str, int | None] = {}
+
+    def __call__(self, name: str, texture_dirs: list[str] | None = None) -> int:
+        """Material index of `name`, looked up in every texture path joined
+        with each of `texture_dirs` (the model's $cdmaterials) and alone"""
+        candidates = [
+            os.path.join(directory, name).replace("\\", "/")
+            for directory in (texture_dirs or []) + [""]
+        ]
+        key = candidates[0].lower()
+        if key not in self._materials:
+            self._materials[key] = self._add_material(name, candidates)
+        return self._materials[key]
+
+    def _add_material(self, name: str, candidates: list[str]) -> int:
+        material: dict = {
+            "name": name,
+            "pbrMetallicRoughness": {"metallicFactor": 0.0, "roughnessFactor": 1.0},
+        }
+        if not self.texture_paths:
+            return self.writer.add("materials", material)
+        vmt = vtf_path = None
+        for texture_path in self.texture_paths:
+            for candidate in candidates:
+                vmt, vtf_path = resolve_material(texture_path, candidate)
+                if vmt is not None:
+                    break
+            if vmt is not None:
+                break
+        if vmt is None:
+            warnings.warn(f"Couldn't find material {name}")
+            return self.writer.add("materials", material)
+
+        params = vmt.params
+        if params.get("$translucent") == "1":
+            material["alphaMode"] = "BLEND"
+        elif params.get("$alphatest") == "1":
+            material["alphaMode"] = "MASK"
+            material["alphaCutoff"] = float(params.get("$alphatestreference", 0.5))
+        if params.get("$nocull") == "1":
+            material["doubleSided"] = True
+        if vtf_path is not None:
+            texture = self._texture(vtf_path)
+            if texture is not None:
+                material["pbrMetallicRoughness"]["baseColorTexture"] = {
+                    "index": texture
+                }
+        return self.writer.add("materials", material)
+
+    def _texture(self, vtf_path: str) -> int | None:
+        if vtf_path not in self._textures:
+            try:
+                image = self.writer.add_image(decode_vtf(vtf_path))
+            except (OSError, RuntimeError, ValueError) as error:
+                warnings.warn(f"Couldn't decode {vtf_path}: {error}")
+                self._textures[vtf_path] = None
+            else:
+                self._textures[vtf_path] = self.writer.add(
+                    "textures", {"source": image}
+                )
+        return self._textures[vtf_path]
+
+
+def _write_skeleton(writer: GLBWriter, model: SourceModel, parent: int) -> int:
+    """Bone nodes under `parent` and the skin using them"""
+    skeleton = model.skeleton
+    first = len(writer.gltf.get("nodes", []))
+    for bone, name in enumerate(skeleton.names):
+        bone_parent = int(skeleton.parents[bone])
+        writer.add_node(
+            {
+                "name": name,
+                "translation": skeleton.positions[bone].tolist(),
+                "rotation": skeleton.quaternions[bone].tolist(),
+            },
+            parent if bone_parent < 0 else first + bone_parent,
+        )
+    # poseToBone is the model to bone transform, glTF wants it column major
+    inverse_bind = np.zeros((len(skeleton), 4, 4), dtype=np.float32)
+    inverse_bind[:, :3] = skeleton.pose_to_bone
+    inverse_bind[:, 3, 3] = 1.0
+    return writer.add(
+        "skins",
+        {
+            "joints": list(range(first, first + len(skeleton))),
+            "inverseBindMatrices": writer.add_array(
+                inverse_bind.transpose(0, 2, 1).reshape(-1, 16)
+            ),
+        },
+    )
+
+
+def _optimized_geometry(
+    model: SourceModel, rows: np.ndarray, weights: BoneWeights | None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Welded, vertex cache and fetch ordered geometry of the mesh table
+    `rows`: (model vertex ids, indices into them, index count per row).
+    Vertices only weld when their skinning data matches too."""
+    indices = model.indices
+    meshes = indices.meshes[rows]
+    used, local = np.unique(
+        indices.indices[concat_ranges(meshes["index_start"], meshes["index_count"])],
+        return_inverse=True,
+    )
+    columns = [model.vertices[used]]
+    steps = [WELD_STEPS]
+    if weights is not None:
+        columns += [weights.weights[used], weights.bones[used]]
+        steps.append(np.ones(6))
+    # the vertex id rides along, an infinite step never splits a weld
+    columns.append(used[:, None])
+    steps.append([np.inf])
+    welded, optimized, counts = optimize_mesh(
+        np.hstack(columns).astype(np.float64),
+        local.reshape(-1),
+        meshes["index_count"],
+        np.concatenate(steps),
+    )
+    return welded[:, -1].astype(np.int64), optimized, counts
+
+
+def write_model(
+    writer: GLBWriter,
+    model: SourceModel,
+    body: int = 0,
+    lod: int = 0,
+    skin: int = 0,
+    materials: MaterialExporter | None = None,
+    skinned: bool = True,
+    optimize: bool = True,
+) -> int:
+    """Adds the geometry that bodygroup value `body` selects at one VTX LOD
+    as a glTF mesh, returns the mesh index. Unused vertices are left out.
+
+    With `optimize` identical vertices are welded and triangles and
+    vertices reordered for the vertex cache (see mesh_optimize), which
+    holds the selected geometry in memory at once. Otherwise the VTX index
+    lists are written as they are, gathered EXPORT_CHUNK at a time; the
+    used vertex table and index remap then cover the range of vertex ids
+    the selected meshes reference, so their size grows with that range,
+    not with the whole model."""
+    indices = model.indices
+    choices = model.bodygroups.choices(body)
+    lods = indices.meshes["lod"]
+    rows = np.flatnonzero(
+        (lods == min(lod, int(lods.max(initial=0))))
+        & (choices[indices.meshes["bodypart"]] == indices.meshes["model"])
+        & (indices.meshes["index_count"] > 0)
+    )
+    if len(rows) == 0:
+        raise RuntimeError(f"Body {body} has no geometry at LOD {lod}")
+    vertices = model.vertices
+    weights = None
+    if skinned and len(model.skeleton) > 1:
+        weights = model._get_bone_weights(0, np.uint8)
+
+    if optimize:
+        vertex_ids, optimized, counts = _optimized_geometry(model, rows, weights)
+        index_dtype = np.uint16 if len(vertex_ids) <= 0x10000 else np.uint32
+
+        def triangles() -> Iterator[np.ndarray]:
+            for start in range(0, len(optimized), EXPORT_CHUNK * 3):
+                chunk = optimized[start : start + EXPORT_CHUNK * 3].reshape(-1, 3)
+                # studio triangles are clockwise, glTF front faces are not
+                yield chunk[:, ::-1].astype(index_dtype)
+
+    else:
+        first = min(int(indices.mesh_indices(row).min()) for row in rows.tolist())
+        end = max(int(indices.mesh_indices(row).max()) for row in rows.tolist()) + 1
+        used = np.zeros(end - first, dtype=bool)
+        for row in rows.tolist():
+            mesh = indices.mesh_indices(row)
+            for start in range(0, len(mesh), EXPORT_CHUNK * 3):
+                used[mesh[start : start + EXPORT_CHUNK * 3] - first] = True
+        vertex_ids = np.flatnonzero(used) + first
+        remap = np.cumsum(used, dtype=np.int64) - 1
+        del used
+        counts = indices.meshes["index_count"][rows]
+        index_dtype = np.uint16 if len(vertex_ids) <= 0x10000 else np.uint32
+
+        def triangles() -> Iterator[np.ndarray]:
+            for row in rows.tolist():
+                mesh = indices.mesh_indices(row)
+                for start in range(0, len(mesh), EXPORT_CHUNK * 3):
+                    chunk = remap[mesh[start : start + EXPORT_CHUNK * 3] - first]
+                    chunk = chunk.reshape(-1, 3)
+                    # studio triangles are clockwise, glTF front faces are not
+                    yield chunk[:, ::-1].astype(index_dtype)
+
+    def gather(array: np.ndarray) -> Iterator[np.ndarray]:
+        if len(vertex_ids) == len(array) and np.all(vertex_ids[1:] > vertex_ids[:-1]):
+            yield array
+            return
+        for start in range(0, len(vertex_ids), EXPORT_CHUNK):
+            yield array[vertex_ids[start : start + EXPORT_CHUNK]]
+
+    mins: list[np.ndarray] = []
+    maxs: list[np.ndarray] = []
+
+    def measured(chunks: Iterator[np.ndarray]) -> Iterator[np.ndarray]:
+        # POSITION bounds come from the chunks on their way to the file
+        for chunk in chunks:
+            mins.append(chunk[:, :3].min(axis=0))
+            maxs.append(chunk[:, :3].max(axis=0))
+            yield chunk
+
+    # interleaved position, normal, uv exactly like the (N, 8) array
+    vertex_view = writer.add_view(measured(gather(vertices)), ARRAY_BUFFER, 32)
+    attributes = {
+        "POSITION": writer.add_accessor(
+            vertex_view,
+            np.float32,
+            len(vertex_ids),
+            3,
+            bounds=(np.min(mins, axis=0), np.max(maxs, axis=0)),
+        ),
+        "NORMAL": writer.add_accessor(vertex_view, np.float32, len(vertex_ids), 3, 12),
+        "TEXCOORD_0": writer.add_accessor(
+            vertex_view, np.float32, len(vertex_ids), 2, 24
+        ),
+    }
+
+    if weights is not None:
+        joint_dtype = np.uint8 if len(model.skeleton) <= 0x100 else np.uint16
+
+        def padded(array: np.ndarray, dtype: type) -> Iterator[np.ndarray]:
+            # glTF skinning attributes are VEC4, studio vertices have 3 slots
+            for chunk in gather(array):
+                out = np.zeros((len(chunk), 4), dtype=dtype)
+                out[:, : chunk.shape[1]] = chunk
+                yield out
+
+        attributes["JOINTS_0"] = writer.add_accessor(
+            writer.add_view(padded(weights.bones, joint_dtype), ARRAY_BUFFER),
+            joint_dtype,
+            len(vertex_ids),
+            4,
+        )
+        attributes["WEIGHTS_0"] = writer.add_accessor(
+            writer.add_view(padded(weights.weights, np.uint8), ARRAY_BUFFER),
+            np.uint8,
+            len(vertex_ids),
+            4,
+            normalized=True,
+        )
+
+    index_view = writer.add_view(triangles(), ELEMENT_ARRAY_BUFFER)
+    mesh_materials = model.skins.mesh_materials(indices.meshes[rows], skin)
+    primitives = []
+    offset = 0
+    for count, material in zip(counts.tolist(), mesh_materials.tolist()):
+        if count == 0:
+            # every triangle of the mesh was degenerate after welding
+            continue
+        primitive = {
+            "attributes": attributes,
+            "indices": writer.add_accessor(
+                index_view,
+                index_dtype,
+                count,
+                1,
+                offset * np.dtype(index_dtype).itemsize,
+            ),
+        }
+        if materials is not None:
+            primitive["material"] = materials(
+                model.skins.material_names[material], model.texture_dirs
+            )
+        primitives.append(primitive)
+        offset += count
+    return writer.add("meshes", {"name": model.mdl_name, "primitives": primitives})
+
+
+def model_root(
+    writer: GLBWriter, name: str, scale: float = INCHES_TO_METERS
+) -> int:
+    """Scene node turning Source coordinates into glTF ones"""
+    return writer.add_node(
+        {"name": name, "rotation": Z_UP_TO_Y_UP, "scale": [scale] * 3}
+    )
+
+
+def export_glb(
+    model: SourceModel,
+    path: str,
+    body: int = 0,
+    lod: int = 0,
+    skin: int = 0,
+    skinned: bool = True,
+    scale: float = INCHES_TO_METERS,
+    optimize: bool = True,
+):
+    """Writes one model to a .glb with its materials, textures come from
+    the model's texture_path. `skinned` adds the skeleton and vertex
+    weights of models with more than one bone, `optimize` welds and
+    reorders the geometry like write_model()."""
+    with GLBWriter() as writer:
+        root = model_root(writer, model.mdl_name, scale)
+        mesh = write_model(
+            writer,
+            model,
+            body,
+            lod,
+            skin,
+            MaterialExporter(writer, [model.texture_path] if model.texture_path else []),
+            skinned,
+            optimize,
+        )
+        if skinned and len(model.skeleton) > 1:
+            # skinned meshes follow their joints, their own node stays at the top
+            skin_index = _write_skeleton(writer, model, root)
+            writer.add_node({"name": model.mdl_name, "mesh": mesh, "skin": skin_index})
+        else:
+            writer.add_node({"name": model.mdl_name, "mesh": mesh}, root)
+        writer.save(path)
+
+
+def _instances(
+    writer: GLBWriter,
+    mesh: int,
+    name: str,
+    props: DupeProps,
+    rows: np.ndarray,
+    parent: int,
+):
+    """One EXT_mesh_gpu_instancing node drawing `mesh` at every prop of `rows`"""
+    writer.add_node(
+        {
+            "name": name,
+            "mesh": mesh,
+            "extensions": {
+                "EXT_mesh_gpu_instancing": {
+                    "attributes": {
+                        "TRANSLATION": writer.add_array(
+                            props.positions[rows].astype(np.float32)
+                        ),
+                        "ROTATION": writer.add_array(props.quaternions[rows]),
+                    }
+                }
+            },
+        },
+        parent,
+    )
+
+
+def export_dupe_glb(
+    props: DupeProps,
+    repository: ModelRepository,
+    path: str,
+    instancing: bool = True,
+    lod: int = 0,
+    texture_paths: list[str] | None = None,
+    scale: float = INCHES_TO_METERS,
+    optimize: bool = True,
+):
+    """Writes a dupe to a .glb with every (model, skin, bodygroup) mesh
+    written once, welded and reordered unless `optimize` is off. With `instancing` each mesh gets one node carrying the
+    transforms of all its props (EXT_mesh_gpu_instancing), otherwise every
+    prop is a node reusing the shared mesh. Models are loaded through
+    `repository`, materials are searched in `texture_paths` (default: the
+    materials folder of every repository search path)."""
+    if texture_paths is None:
+        texture_paths = [
+            os.path.join(root, "materials") for root in repository.search_paths
+        ]
+    with GLBWriter() as writer:
+        if instancing:
+            writer.gltf["extensionsUsed"] = ["EXT_mesh_gpu_instancing"]
+            writer.gltf["extensionsRequired"] = ["EXT_mesh_gpu_instancing"]
+        root = model_root(writer, "dupe", scale)
+        materials = MaterialExporter(writer, texture_paths)
+        for model_path, model_rows in props.groups():
+            try:
+                handle = repository.acquire(model_path)
+            except (OSError, RuntimeError, NotImplementedError) as error:
+                warnings.warn(
+                    f"Skipping {len(model_rows)} props of {model_path}: {error}"
+                )
+                continue
+            with handle:
+                model = handle.model
+                for skin, body, rows in props.variants(
+                    model_rows, model.bodygroups
+                ):
+                    mesh = write_model(
+                        writer,
+                        model,
+                        body,
+                        lod,
+                        skin,
+                        materials,
+                        skinned=False,
+                        optimize=optimize,
+                    )
+                    if instancing:
+                        _instances(writer, mesh, model_path, props, rows, root)
+                        continue
+                    for row in rows.tolist():
+                        writer.add_node(
+                            {
+                                "name": f"{model_path}#{props.entity[row]}",
+                                "mesh": mesh,
+                                "translation": props.positions[row].tolist(),
+                                "rotation": props.quaternions[row].tolist(),
+                            },
+                            root,
+                        )
+        writer.save(path)
+
+
+def export_batches_glb(
+    batches: list[Batch],
+    path: str,
+    texture_paths: list[str] | None = None,
+    scale: float = INCHES_TO_METERS,
+):
+    """Writes static batches (see dupe_scene.batch_props) as one mesh with a
+    primitive, and so a draw call, per material"""
+    with GLBWriter() as writer:
+        root = model_root(writer, "batches", scale)
+        materials = MaterialExporter(writer, texture_paths or [])
+        primitives = []
+        for batch in batches:
+            positions = batch.vertices[:, :3]
+            vertex_view = writer.add_view((batch.vertices,), ARRAY_BUFFER, 32)
+            count = len(batch.vertices)
+            index_view = writer.add_view(
+                (
+                    # studio triangles are clockwise, glTF front faces are not
+                    batch.indices[start : start + EXPORT_CHUNK * 3]
+                    .reshape(-1, 3)[:, ::-1]
+                    for start in range(0, len(batch.indices), EXPORT_CHUNK * 3)
+                ),
+                ELEMENT_ARRAY_BUFFER,
+            )
+            primitives.append(
+                {
+                    "attributes": {
+                        "POSITION": writer.add_accessor(
+                            vertex_view,
+                            np.float32,
+                            count,
+                            3,
+                            bounds=(positions.min(axis=0), positions.max(axis=0)),
+                        ),
+                        "NORMAL": writer.add_accessor(
+                            vertex_view, np.float32, count, 3, 12
+                        ),
+                        "TEXCOORD_0": writer.add_accessor(
+                            vertex_view, np.float32, count, 2, 24
+                        ),
+                    },
+                    "indices": writer.add_accessor(
+                        index_view, batch.indices.dtype, len(batch.indices), 1
+                    ),
+                    "material": materials(batch.material, batch.texture_dirs),
+                }
+            )
+        if primitives:
+            mesh = writer.add("meshes", {"name": "batches", "primitives": primitives})
+            writer.add_node({"name": "batches", "mesh": mesh}, root)
+        writer.save(path)
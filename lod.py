@@ -0,0 +1,109 @@
+"""Per instance LOD selection over buffers extracted once per model"""
+from typing import NamedTuple
+
+import numpy as np
+
+
+class LODMesh(NamedTuple):
+    """Self-contained buffers of one LOD: only the vertices this LOD uses
+    and a triangle list into them. `meshes` are the LOD's mesh table rows
+    (MESH_TABLE_DTYPE) with index ranges into `indices`."""
+
+    vertices: np.ndarray
+    indices: np.ndarray
+    meshes: np.ndarray
+
+    @property
+    def num_triangles(self) -> int:
+        return len(self.indices) // 3
+
+
+def compact_vertices(
+    vertices: np.ndarray, indices: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Only the vertices `indices` use, and the indices into them"""
+    used = np.unique(indices)
+    index_dtype = np.uint16 if len(used) <= 0x10000 else np.uint32
+    return (
+        np.ascontiguousarray(vertices[used]),
+        np.searchsorted(used, indices).astype(index_dtype),
+    )
+
+
+def compact_lod(
+    vertices: np.ndarray, indices: np.ndarray, meshes: np.ndarray
+) -> LODMesh:
+    """LODMesh of a triangle list that indexes a larger vertex array"""
+    return LODMesh(*compact_vertices(vertices, indices), meshes)
+
+
+class LODChain:
+    def __init__(self, lods: list[LODMesh], switch_points: np.ndarray):
+        """`switch_points[i]` is the distance from which LOD i is used,
+        like ModelLODHeader_t.switchPoint; must be ascending with 0 first"""
+        switch_points = np.asarray(switch_points, dtype=np.float32)
+        if len(lods) != len(switch_points):
+            raise ValueError("Need one switch point per LOD")
+        if (
+            len(lods) == 0
+            or switch_points[0] != 0
+            or np.any(np.diff(switch_points) < 0)
+        ):
+            raise ValueError(f"Bad LOD switch points {switch_points}")
+        self.lods = lods
+        self.switch_points = switch_points
+
+    def __len__(self) -> int:
+        return len(self.lods)
+
+    def __getitem__(self, lod: int) -> LODMesh:
+        return self.lods[lod]
+
+    @property
+    def triangle_counts(self) -> np.ndarray:
+        return np.array([lod.num_triangles for lod in self.lods], dtype=np.int64)
+
+    def select(
+        self,
+        distances: np.ndarray,
+        scale: float = 1.0,
+        min_lod: int = 0,
+        max_lod: int | None = None,
+    ) -> np.ndarray:
+        """LOD of every instance at `distances`. `scale` multiplies the
+        distance metric (e.g. for field of view or a quality setting),
+        `min_lod`/`max_lod` clamp the result like r_rootlod and r_lod."""
+        metric = np.asarray(distances, dtype=np.float32) * scale
+        lods = np.searchsorted(self.switch_points, metric, side="right") - 1
+        last = len(self.lods) - 1
+        if max_lod is not None:
+            last = min(max_lod, last)
+        return np.clip(lods, min(min_lod, last), last)
+
+    def select_from_camera(
+        self,
+        camera_position: np.ndarray,
+        instance_positions: np.ndarray,
+        scale: float = 1.0,
+        min_lod: int = 0,
+        max_lod: int | None = None,
+    ) -> np.ndarray:
+        """select() with distances from the camera to (instances, 3)
+        origins"""
+        offsets = np.asarray(instance_positions, dtype=np.float32) - np.asarray(
+            camera_position, dtype=np.float32
+        )
+        distances = np.sqrt(np.einsum("ij,ij->i", offsets, offsets))
+        return self.select(distances, scale, min_lod, max_lod)
+
+    def group(self, lods: np.ndarray) -> dict[int, np.ndarray]:
+        """Instance ids of every LOD in use, ready for one draw per LOD"""
+        order = np.argsort(lods, kind="stable")
+        used, starts = np.unique(lods[order], return_index=True)
+        return {
+            int(lod): instances
+            for lod, instances in zip(used, np.split(order, starts[1:]))
+        }
+
+    def triangles_drawn(self, lods: np.ndarray) -> int:
+        return int(self.triangle_counts[lods].sum())
@@ -1,13 +1,35 @@
 import ctypes
+import functools
+import mmap
 import os
 import struct
 import time
 import warnings
-from pprint import pprint
 
-from typing import Iterator, TypedDict
+from typing import Iterator, NamedTuple, TypedDict
 
-from gmod.misc import print_array, read_until_null
+import numpy as np
+from numpy.lib import recfunctions
+
+from gmod.misc import (
+    concat_ranges,
+    map_file,
+    print_array,
+    read_cstring,
+    read_children,
+    struct_array,
+    struct_dtype,
+)
+from gmod.model_cache import cache_key, read_model_cache, write_model_cache
+from gmod.skeleton import Skeleton
+from gmod.animation import Animation, decode_animation
+from gmod.aabb import AABBIndex, transform_aabbs
+from gmod.bvh import TriangleBVH
+from gmod.lod import LODChain, LODMesh, compact_lod
+from gmod.mesh_optimize import optimize_mesh
+from gmod.simplify import DEFAULT_LOD_RATIOS, extend_lod_chain
+from gmod.phy import CollisionModel, parse_phy
+from gmod.vertex_format import CompactVertices, decode_vertices, encode_vertices
 from gmod.mdl_structs import (
     studiohdr_t,
     studiohdr2_t,
@@ -17,6 +39,7 @@ from gmod.mdl_structs import (
     mstudiomesh_t,
     vertexFileHeader_t,
     mstudiovertex_t,
+    phyheader_t,
     FileHeader_t,
     BodyPartHeader_t,
     ModelHeader_t,
@@ -31,20 +54,268 @@ from gmod.mdl_structs import (
     mstudioseqdesc_t,
     mstudiotexture_t,
     vertexFileFixup_t,
+    MaterialReplacementHeader_t,
+    MaterialReplacementListHeader_t,
 )
 
 MODEL_VERTEX_FILE_ID = int.from_bytes(b"VSDI", "big")
 MODEL_VERTEX_FILE_VERSION = 4
 OPTIMIZED_MODEL_FILE_VERSION = 7
+MAX_NUM_BONES_PER_VERT = 3
+
+# StripHeader_t.flags
+STRIP_IS_TRILIST = 0x01
+STRIP_IS_TRISTRIP = 0x02
+
+MESH_TABLE_DTYPE = np.dtype(
+    [
+        ("bodypart", np.int32),
+        ("model", np.int32),
+        ("lod", np.int32),
+        ("mesh", np.int32),
+        ("material", np.int32),
+        ("switch_point", np.float32),
+        ("flags", np.uint8),
+        ("index_start", np.int64),
+        ("index_count", np.int64),
+        ("remap_start", np.int64),
+        ("remap_count", np.int64),
+    ]
+)
+STRIP_TABLE_DTYPE = np.dtype(
+    [
+        ("mesh", np.int64),
+        ("flags", np.uint8),
+        ("index_start", np.int64),
+        ("index_count", np.int64),
+    ]
+)
+
+
+def strips_to_lists(
+    indices: np.ndarray,
+    starts: np.ndarray,
+    counts: np.ndarray,
+    flags: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Expands the strips `indices[start:start + count]` into one triangle
+    list. Strips with STRIP_IS_TRISTRIP flip every odd triangle to keep the
+    winding and lose their degenerate triangles, the rest are lists.
+    Returns (triangle list, triangles kept per strip)."""
+    is_strip = (flags & STRIP_IS_TRISTRIP) != 0
+    num_triangles = np.where(is_strip, np.maximum(counts - 2, 0), counts // 3)
+    strip = np.repeat(np.arange(len(counts)), num_triangles)
+    first_triangle = np.cumsum(num_triangles) - num_triangles
+    k = np.arange(len(strip)) - first_triangle[strip]
+    first_corner = starts[strip] + k * np.where(is_strip[strip], 1, 3)
+    triangles = indices[first_corner[:, None] + np.arange(3)]
+
+    odd = is_strip[strip] & (k % 2 == 1)
+    triangles[odd] = triangles[odd][:, [0, 2, 1]]
+    keep = ~is_strip[strip] | (
+        (triangles[:, 0] != triangles[:, 1])
+        & (triangles[:, 1] != triangles[:, 2])
+        & (triangles[:, 2] != triangles[:, 0])
+    )
+    kept = np.bincount(strip[keep], minlength=len(counts)).astype(np.int64)
+    return triangles[keep].reshape(-1), kept
+
+
+class MeshIndices(NamedTuple):
+    """Index buffers of every bodypart/model/LOD/mesh of a VTX file.
+
+    `indices` is a single triangle list for all meshes, already remapped to
+    vertex ids of the VVD vertex array, strips are expanded to lists. `remap` holds the strip group
+    `origMeshVertID` tables in the same id space. `meshes` (MESH_TABLE_DTYPE)
+    and `strips` (STRIP_TABLE_DTYPE) are slices into these two arrays."""
+
+    indices: np.ndarray
+    remap: np.ndarray
+    meshes: np.ndarray
+    strips: np.ndarray
+
+    def find(self, bodypart: int, model: int, lod: int, mesh: int) -> int:
+        rows = np.flatnonzero(
+            (self.meshes["bodypart"] == bodypart)
+            & (self.meshes["model"] == model)
+            & (self.meshes["lod"] == lod)
+            & (self.meshes["mesh"] == mesh)
+        )
+        if len(rows) == 0:
+            raise KeyError((bodypart, model, lod, mesh))
+        return int(rows[0])
+
+    def mesh_indices(self, row: int) -> np.ndarray:
+        start = self.meshes["index_start"][row]
+        return self.indices[start : start + self.meshes["index_count"][row]]
+
+    def mesh_remap(self, row: int) -> np.ndarray:
+        start = self.meshes["remap_start"][row]
+        return self.remap[start : start + self.meshes["remap_count"][row]]
+
+    def lod_indices(self, lod: int) -> np.ndarray:
+        """Triangle list of every mesh of one LOD"""
+        rows = np.flatnonzero(self.meshes["lod"] == lod)
+        return np.concatenate(
+            [self.mesh_indices(row) for row in rows] or [self.indices[:0]]
+        )
+
+
+HITBOX_DTYPE = np.dtype(
+    [
+        ("set", np.int32),
+        ("bone", np.int32),
+        ("group", np.int32),
+        ("bbmin", np.float32, 3),
+        ("bbmax", np.float32, 3),
+    ]
+)
+
+
+class Hitboxes(NamedTuple):
+    """Every hitbox set, boxes of all sets are flattened into `boxes`
+    (HITBOX_DTYPE), with bone space bounds"""
+
+    set_names: list[str]
+    names: list[str]
+    boxes: np.ndarray
+
+    def set_boxes(self, hitbox_set: int | str = 0) -> np.ndarray:
+        if isinstance(hitbox_set, str):
+            hitbox_set = self.set_names.index(hitbox_set)
+        return np.flatnonzero(self.boxes["set"] == hitbox_set)
+
+    def aabb_index(self, world: np.ndarray) -> AABBIndex:
+        """Boxes moved by their bones' (bones, 3, 4) `world` matrices, ids are
+        indices into `boxes`"""
+        mins, maxs = transform_aabbs(
+            self.boxes["bbmin"], self.boxes["bbmax"], world[self.boxes["bone"]]
+        )
+        return AABBIndex(mins, maxs)
+
+
+class BoneWeights(NamedTuple):
+    """(N, 3) weights and bone ids per vertex, slots past `counts` are 0"""
+
+    weights: np.ndarray
+    bones: np.ndarray
+    counts: np.ndarray
+
+
+def quantize_weights(weights: np.ndarray, dtype: type = np.uint8) -> np.ndarray:
+    """(N, k) weights as float32, float16 or uint8. uint8 rows are rounded
+    so they still sum to 255 whenever the float row sums to 1."""
+    if np.dtype(dtype) != np.uint8:
+        return weights.astype(dtype)
+    quantized = np.round(weights * 255.0).astype(np.int64)
+    total = np.round(weights.sum(axis=1) * 255.0).astype(np.int64)
+    # the rounding error goes to the heaviest slot
+    heaviest = np.argmax(weights, axis=1)
+    rows = np.arange(len(weights))
+    quantized[rows, heaviest] += total - quantized.sum(axis=1)
+    return np.clip(quantized, 0, 255).astype(np.uint8)
+
+
+class Bodygroups(NamedTuple):
+    """Bodyparts as the engine's body value sees them: bodypart i shows
+    model (body // bases[i]) % num_models[i]"""
+
+    names: list[str]
+    bases: np.ndarray
+    num_models: np.ndarray
+
+    def choices(self, body: int) -> np.ndarray:
+        """Selected model of every bodypart"""
+        return (body // self.bases) % np.maximum(self.num_models, 1)
+
+    def body_value(self, choices: list[int] | np.ndarray) -> int:
+        choices = np.asarray(choices)
+        if len(choices) != len(self.bases) or np.any(
+            (choices < 0) | (choices >= self.num_models)
+        ):
+            raise ValueError(f"Invalid bodygroup choices {choices}")
+        return int(np.sum(choices * self.bases))
+
+
+class Skins(NamedTuple):
+    """`families` (skin families, skin references) holds the texture index
+    of every material reference per skin. `lod_materials` (LODs, textures)
+    maps a texture index to its VTX material replacement of that LOD, as an
+    index into `material_names` (textures first, then replacements)."""
+
+    material_names: list[str]
+    families: np.ndarray
+    lod_materials: np.ndarray
+
+    def mesh_materials(self, meshes: np.ndarray, skin: int = 0) -> np.ndarray:
+        """material_names index of every MESH_TABLE_DTYPE row"""
+        # the engine falls back to the default skin for invalid ones
+        if not 0 <= skin < len(self.families):
+            skin = 0
+        textures = self.families[skin][meshes["material"]]
+        lods = np.minimum(meshes["lod"], len(self.lod_materials) - 1)
+        return self.lod_materials[lods, textures]
+
+
+class Sequence(NamedTuple):
+    name: str
+    activity: str
+    flags: int
+    # blend grid (groupsize[1], groupsize[0]) of local animation indices
+    animations: np.ndarray
+
+
+def _section_arrays(value) -> list[np.ndarray]:
+    """Arrays held by a parsed section: an array, a NamedTuple of arrays,
+    a LODChain or an object with array attributes"""
+    if isinstance(value, np.ndarray):
+        return [value]
+    if isinstance(value, LODChain):
+        return [value.switch_points] + [array for lod in value.lods for array in lod]
+    fields = value if isinstance(value, tuple) else vars(value).values()
+    return [field for field in fields if isinstance(field, np.ndarray)]
 
 
 class SourceModel:
+    # lazily parsed parts of the model, see preload() and invalidate()
+    SECTIONS = (
+        "bones",
+        "bone_names",
+        "skeleton",
+        "textures",
+        "texture_dirs",
+        "bodyparts",
+        "skins",
+        "bodygroups",
+        "hitboxes",
+        "hitbox_index",
+        "collision",
+        "indices",
+        "bvh",
+        "lods",
+        "bounds",
+        "sequences",
+        "animations",
+        "vertices",
+    )
+    # sections built from other sections, invalidate() forgets them too
+    DEPENDENTS = {
+        "bones": ("skeleton",),
+        "bone_names": ("skeleton",),
+        "skeleton": ("hitbox_index",),
+        "hitboxes": ("hitbox_index",),
+        "indices": ("bvh", "lods"),
+        "vertices": ("bvh", "lods"),
+    }
+
     def __init__(
         self,
         mdl_path,
         vtx_path: str | None = None,
         vvd_path: str | None = None,
         texture_path: str | None = None,
+        cache_path: str | None = None,
+        phy_path: str | None = None,
     ):
         self.mdl_header: studiohdr_t
         self.studiohdr2: studiohdr2_t
@@ -74,308 +345,891 @@ class SourceModel:
         else:
             self.vvd_path = vvd_path
 
+        # collision models are optional, e.g. for effects or ragdoll-less props
+        self.phy_path = phy_path or ".".join(self.mdl_path.split(".")[:-1]) + ".phy"
+
         self.texture_path = texture_path
 
-        self.mdl_bytes = b""
-        self.vtx_bytes = b""
-        self.vvd_bytes = b""
+        self.mdl_bytes: mmap.mmap
+        self.vtx_bytes: mmap.mmap
+        self.vvd_bytes: mmap.mmap
+        self._vertex_records: dict[int, np.ndarray] = {}
+        self._tangents: dict[int, np.ndarray] = {}
+        self._compact_vertices: dict[int, CompactVertices] = {}
+        self._vertices: dict[int, np.ndarray] = {}
+        self._animations: dict[int, Animation] = {}
+        self._assemblies: dict[tuple[int, int], LODMesh] = {}
+        # set by share(), geometry arrays are parsed non-writeable
+        self.read_only = False
 
         self.mdl_name: str
-        self._check_files()
-
-    def _check_files(self):
-        with open(self.mdl_path, "rb") as mdl:
-            mdl_id = int.from_bytes(mdl.read(4), "little")
-            mdl_version = int.from_bytes(mdl.read(4), "little")
-            mdl_checksum = int.from_bytes(mdl.read(4), "little")
-            self.mdl_name = str(mdl.read(64), encoding="ascii")
-        with open(self.vtx_path, "rb") as vtx:
-            vtx_version = int.from_bytes(vtx.read(4), "little")
-            vtx.seek(16, 0)
-            vtx_checksum = int.from_bytes(vtx.read(4), "little")
-        with open(self.vvd_path, "rb") as vvd:
-            vvd_id = int.from_bytes(vvd.read(4), "little")
-            vvd_version = int.from_bytes(vvd.read(4), "little")
-            vvd_checksum = int.from_bytes(vvd.read(4), "little")
-
-        if vvd_id != MODEL_VERTEX_FILE_ID:
+        self._mapped = False
+        # a valid cache fills the sections so the model files are never mapped
+        if cache_path is None or not self._load_cache(cache_path):
+            self._map_files()
+            if cache_path is not None:
+                self.save_cache(cache_path)
+
+    def _map_files(self):
+        # every file is opened exactly once, everything else reads the maps
+        if self._mapped:
+            return
+        self._mapped = True
+        self.mdl_bytes = map_file(self.mdl_path)
+        self.vtx_bytes = map_file(self.vtx_path)
+        self.vvd_bytes = map_file(self.vvd_path)
+
+        self.mdl_header = studiohdr_t.from_buffer(self.mdl_bytes)
+        self.studiohdr2 = studiohdr2_t.from_buffer(
+            self.mdl_bytes, self.mdl_header.studiohdr2index
+        )
+        self.vtx_header = FileHeader_t.from_buffer(self.vtx_bytes)
+        self.vvd_header = vertexFileHeader_t.from_buffer(self.vvd_bytes)
+        self.mdl_name = self.mdl_header.name.decode("ascii")
+
+        if self.vvd_header.id != MODEL_VERTEX_FILE_ID:
             raise RuntimeError(
-                f"Unknown magic number of VVD file {vvd_id}.\nShould be {MODEL_VERTEX_FILE_ID}"
+                f"Unknown magic number of VVD file {self.vvd_header.id}.\nShould be {MODEL_VERTEX_FILE_ID}"
             )
-        if vvd_version != MODEL_VERTEX_FILE_VERSION:
+        if self.vvd_header.version != MODEL_VERTEX_FILE_VERSION:
             raise NotImplementedError(
-                f"VVD version {vvd_version} not supported :(.\nSupported version is {MODEL_VERTEX_FILE_VERSION}"
+                f"VVD version {self.vvd_header.version} not supported :(.\nSupported version is {MODEL_VERTEX_FILE_VERSION}"
             )
-        if vvd_checksum != mdl_checksum:
+        if self.vvd_header.checksum != self.mdl_header.checksum:
             raise RuntimeError("VVD's checksum != MDL's checksum")
-        if vtx_checksum != mdl_checksum:
+        if self.vtx_header.checkSum != self.mdl_header.checksum:
             raise RuntimeError("VTX's checksum != MDL's checksum")
 
-    def _load_mdl(self):
-        if not self.mdl_bytes:
-            with open(self.mdl_path, "rb") as file:
-                self.mdl_bytes = file.read()
-            self.mdl_header = studiohdr_t.from_buffer_copy(self.mdl_bytes)
-            self.studiohdr2 = studiohdr2_t.from_buffer_copy(
-                self.mdl_bytes, self.mdl_header.studiohdr2index
+    @functools.cached_property
+    def bones(self) -> ctypes.Array[mstudiobone_t]:
+        return self._get_bones()
+
+    @functools.cached_property
+    def bone_names(self) -> list[str]:
+        return self._get_bone_names()
+
+    @functools.cached_property
+    def skeleton(self) -> Skeleton:
+        return self._get_skeleton()
+
+    @functools.cached_property
+    def textures(self) -> list[str]:
+        return self._get_textures()
+
+    @functools.cached_property
+    def texture_dirs(self) -> list[str]:
+        """$cdmaterials folders texture names are relative to"""
+        return self._get_texture_dirs()
+
+    @functools.cached_property
+    def bodyparts(self) -> list:
+        return self._get_bodypart()
+
+    @functools.cached_property
+    def bodygroups(self) -> Bodygroups:
+        return self._get_bodygroups()
+
+    @functools.cached_property
+    def skins(self) -> Skins:
+        return self._get_skins()
+
+    @functools.cached_property
+    def hitboxes(self) -> Hitboxes:
+        return self._get_hitboxes()
+
+    @functools.cached_property
+    def hitbox_index(self) -> AABBIndex:
+        """Model space AABBs of every hitbox in the bind pose"""
+        return self._get_hitbox_index()
+
+    @functools.cached_property
+    def collision(self) -> CollisionModel | None:
+        """Convex pieces of the .phy file, None if the model has none"""
+        return self._shared(self._get_collision())
+
+    @functools.cached_property
+    def indices(self) -> MeshIndices:
+        return self._shared(self._get_indices())
+
+    @functools.cached_property
+    def bvh(self) -> TriangleBVH:
+        """Triangle BVH of every LOD 0 mesh, triangle ids index
+        indices.lod_indices(0).reshape(-1, 3)"""
+        return self._shared(self._get_bvh())
+
+    @functools.cached_property
+    def lods(self) -> LODChain:
+        """Buffers of every LOD extracted once, see LODChain.select()"""
+        return self._shared(self._get_lods())
+
+    @functools.cached_property
+    def bounds(self) -> np.ndarray:
+        return self._get_bounds()
+
+    @functools.cached_property
+    def sequences(self) -> list[Sequence]:
+        return self._get_sequences()
+
+    @property
+    def animations(self) -> list[Animation]:
+        """Every local animation decoded, see _get_animation()"""
+        self._map_files()
+        return [
+            self._get_animation(i) for i in range(self.mdl_header.localanim_count)
+        ]
+
+    @property
+    def vertices(self) -> np.ndarray:
+        """LOD 0 vertices, see _get_vertices()"""
+        return self._get_vertices(0)
+
+    @property
+    def tangents(self) -> np.ndarray:
+        """LOD 0 tangents, see _get_tangents()"""
+        return self._get_tangents(0)
+
+    @property
+    def bone_weights(self) -> BoneWeights:
+        """LOD 0 float32 skinning data, see _get_bone_weights()"""
+        return self._get_bone_weights(0)
+
+    def _sections(self, sections: str | tuple[str, ...] | None) -> tuple[str, ...]:
+        if sections is None:
+            return self.SECTIONS
+        if isinstance(sections, str):
+            sections = (sections,)
+        for section in sections:
+            if section not in self.SECTIONS:
+                raise KeyError(f"Unknown section {section}")
+        return sections
+
+    def preload(self, sections: str | tuple[str, ...] | None = None):
+        """Parses `sections` (default: all of SECTIONS) now instead of on
+        first access"""
+        for section in self._sections(sections):
+            getattr(self, section)
+
+    def invalidate(self, sections: str | tuple[str, ...] | None = None):
+        """Forgets parsed `sections` (default: all) and the DEPENDENTS built
+        from them, next access parses again"""
+        pending = list(self._sections(sections))
+        done = set()
+        while pending:
+            section = pending.pop()
+            if section in done:
+                continue
+            done.add(section)
+            pending += self.DEPENDENTS.get(section, ())
+            if section == "vertices":
+                self._vertex_records.clear()
+                self._tangents.clear()
+                self._compact_vertices.clear()
+                self._vertices.clear()
+            elif section == "animations":
+                self._animations.clear()
+            else:
+                if section == "lods" or section == "bodygroups":
+                    # assemblies are keyed by body value and LOD
+                    self._assemblies.clear()
+                self.__dict__.pop(section, None)
+
+    def share(self):
+        """Makes every parsed geometry array non-writeable, and the ones
+        parsed from now on too, so one model can be handed to many callers"""
+        self.read_only = True
+        values = [
+            *self._vertex_records.values(),
+            *self._tangents.values(),
+            *self._compact_vertices.values(),
+            *self._vertices.values(),
+            *self._assemblies.values(),
+        ]
+        for section in ("indices", "bvh", "lods", "collision"):
+            values.append(self.__dict__.get(section))
+        for value in values:
+            self._shared(value)
+
+    def _shared(self, value):
+        """`value` with its arrays made non-writeable if the model is shared"""
+        if self.read_only and value is not None:
+            for array in _section_arrays(value):
+                array.flags.writeable = False
+        return value
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by parsed geometry sections"""
+        arrays = list(self._vertices.values())
+        arrays += [compact.data for compact in self._compact_vertices.values()]
+        if "indices" in self.__dict__:
+            arrays += list(self.indices)
+        if "lods" in self.__dict__:
+            arrays += [array for lod in self.lods.lods for array in lod]
+        if self.__dict__.get("collision") is not None:
+            arrays += [self.collision.vertices, self.collision.faces]
+        if "bvh" in self.__dict__:
+            bvh = self.__dict__["bvh"]
+            arrays += [bvh.node_min, bvh.node_max, bvh.order, bvh.triangles]
+        return sum(array.nbytes for array in arrays)
+
+    def close(self):
+        """Drops cached arrays and unmaps the files. Arrays still referenced
+        by the caller keep their map alive until they are collected."""
+        self.invalidate()
+        if not self._mapped:
+            return
+        self._mapped = False
+        del self.mdl_header, self.studiohdr2, self.vtx_header, self.vvd_header
+        for data in (self.mdl_bytes, self.vtx_bytes, self.vvd_bytes):
+            try:
+                data.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _checksum(self) -> int:
+        if self._mapped:
+            return self.mdl_header.checksum
+        with open(self.mdl_path, "rb") as file:
+            return struct.unpack("<3i", file.read(12))[2]
+
+    def _cache_key(self) -> tuple[int, int, int, int]:
+        return cache_key(self._checksum(), self.mdl_path, self.vtx_path, self.vvd_path)
+
+    def _load_cache(self, cache_path: str) -> bool:
+        cached = read_model_cache(cache_path, self._cache_key())
+        if cached is None:
+            return False
+        arrays, meta = cached
+        self.mdl_name = meta["name"]
+        self.__dict__["textures"] = meta["textures"]
+        if "texture_dirs" in meta:
+            self.__dict__["texture_dirs"] = meta["texture_dirs"]
+        self.__dict__["bone_names"] = meta["bone_names"]
+        self.__dict__["bounds"] = arrays["bounds"]
+        self.__dict__["skins"] = Skins(
+            meta["material_names"], arrays["skin_families"], arrays["lod_materials"]
+        )
+        self.__dict__["bodygroups"] = Bodygroups(
+            meta["bodygroup_names"],
+            arrays["bodygroup_bases"],
+            arrays["bodygroup_models"],
+        )
+        self.__dict__["bones"] = (mstudiobone_t * len(arrays["bones"])).from_buffer(
+            arrays["bones"]
+        )
+        self.__dict__["indices"] = MeshIndices(
+            arrays["indices"], arrays["remap"], arrays["meshes"], arrays["strips"]
+        )
+        for lod in range(meta["num_lods"]):
+            if meta.get("compact_vertices"):
+                # decoded on first access of the LOD's float vertices
+                self._compact_vertices[lod] = CompactVertices(
+                    arrays[f"vertices_{lod}"],
+                    arrays[f"vertex_origin_{lod}"],
+                    arrays[f"vertex_scale_{lod}"],
+                )
+            else:
+                self._vertices[lod] = arrays[f"vertices_{lod}"]
+        self.num_vertices = len(arrays["vertices_0"])
+        self.num_indices = len(self.indices.indices)
+        if "lod_switch_points" in meta:
+            self.__dict__["lods"] = LODChain(
+                [
+                    LODMesh(
+                        arrays[f"lod_vertices_{lod}"],
+                        arrays[f"lod_indices_{lod}"],
+                        arrays[f"lod_meshes_{lod}"],
+                    )
+                    for lod in range(len(meta["lod_switch_points"]))
+                ],
+                meta["lod_switch_points"],
             )
+        return True
+
+    def save_cache(self, cache_path: str, compact: bool = False):
+        """Writes vertices of every LOD, index buffers, textures, skins,
+        bodygroups, bones, bounds and the LOD chain if built to `cache_path`,
+        SourceModel(..., cache_path=...) maps them back without parsing
+        anything. `compact` stores vertices in the compact vertex layout."""
+        self._map_files()
+        arrays = {}
+        for lod in range(self.vvd_header.numLODs):
+            if compact:
+                compact_vertices = self.compact_vertices(lod)
+                arrays[f"vertices_{lod}"] = compact_vertices.data
+                arrays[f"vertex_origin_{lod}"] = compact_vertices.origin
+                arrays[f"vertex_scale_{lod}"] = compact_vertices.scale
+            else:
+                arrays[f"vertices_{lod}"] = self._get_vertices(lod)
+        arrays.update(self.indices._asdict())
+        arrays["bones"] = np.frombuffer(self.bones, struct_dtype(mstudiobone_t))
+        arrays["bounds"] = self.bounds
+        arrays["skin_families"] = self.skins.families
+        arrays["lod_materials"] = self.skins.lod_materials
+        arrays["bodygroup_bases"] = self.bodygroups.bases
+        arrays["bodygroup_models"] = self.bodygroups.num_models
+        meta = {
+            "name": self.mdl_name,
+            "textures": self.textures,
+            "texture_dirs": self.texture_dirs,
+            "bone_names": self.bone_names,
+            "num_lods": self.vvd_header.numLODs,
+            "material_names": self.skins.material_names,
+            "bodygroup_names": self.bodygroups.names,
+            "compact_vertices": compact,
+        }
+        # LOD chains are only stored once built, e.g. by generate_lods()
+        if "lods" in self.__dict__:
+            for lod, lod_mesh in enumerate(self.lods.lods):
+                arrays[f"lod_vertices_{lod}"] = lod_mesh.vertices
+                arrays[f"lod_indices_{lod}"] = lod_mesh.indices
+                arrays[f"lod_meshes_{lod}"] = lod_mesh.meshes
+            meta["lod_switch_points"] = self.lods.switch_points.tolist()
+        write_model_cache(cache_path, self._cache_key(), arrays, meta)
 
-    def _load_vtx(self):
-        if not self.vtx_bytes:
-            with open(self.vtx_path, "rb") as file:
-                self.vtx_bytes = file.read()
-
-    def _load_vvd(self):
-        if not self.vvd_bytes:
-            with open(self.vvd_path, "rb") as file:
-                self.vvd_bytes = file.read()
-
-    def _get_vertices(self) -> list[tuple]:
-        self._load_vvd()
-        self._load_mdl()
-        self.vvd_header = vertexFileHeader_t.from_buffer_copy(self.vvd_bytes)
-        fixups = (vertexFileFixup_t * self.vvd_header.numFixups).from_buffer_copy(
-            self.vvd_bytes, self.vvd_header.fixupTableStart
-        )
-        start = self.vvd_header.vertexDataStart
-        if self.vvd_header.numFixups != 0:
-            start += fixups[0].sourceVertexID
-            # print("numLODs", self.vvd_header.numLODs)
-            # raise NotImplementedError("TODO: self.vvd_header.numLODs != 1")
-
-        self.num_vertices = self.vvd_header.numLODVertexes[0]
-        vertices = (mstudiovertex_t * self.num_vertices).from_buffer_copy(
-            self.vvd_bytes, start
-        )
-        # print(vertices)
-        vertices_list: list[tuple] = []
-
-        for v in vertices:
-            vertices_list.append(
-                (
-                    v.m_vecPosition.x,
-                    v.m_vecPosition.y,
-                    v.m_vecPosition.z,
-                    v.m_vecNormal.x,
-                    v.m_vecNormal.y,
-                    v.m_vecNormal.z,
-                    v.m_vecTexCoord.x,
-                    v.m_vecTexCoord.y,
+    def _get_bounds(self) -> np.ndarray:
+        """float32 (4, 3): hull_min, hull_max, view_bbmin, view_bbmax"""
+        self._map_files()
+        return np.array(
+            [
+                (vec.x, vec.y, vec.z)
+                for vec in (
+                    self.mdl_header.hull_min,
+                    self.mdl_header.hull_max,
+                    self.mdl_header.view_bbmin,
+                    self.mdl_header.view_bbmax,
                 )
+            ],
+            dtype=np.float32,
+        )
+
+    def _get_fixup_source(self, lod: int) -> np.ndarray | None:
+        """File vertex id of every vertex of one LOD after the fixup table,
+        None if the file has no fixups and LODs are prefixes of the data"""
+        self._map_files()
+        if not 0 <= lod < self.vvd_header.numLODs:
+            raise IndexError(
+                f"LOD {lod} out of range, VVD has {self.vvd_header.numLODs} LODs"
             )
+        if self.vvd_header.numFixups == 0:
+            return None
+        fixups = struct_array(
+            self.vvd_bytes,
+            vertexFileFixup_t,
+            self.vvd_header.fixupTableStart,
+            self.vvd_header.numFixups,
+        )
+        # a LOD uses every fixup range that is still present at that LOD
+        fixups = fixups[fixups["lod"] >= lod]
+        source = concat_ranges(fixups["sourceVertexID"], fixups["numVertexes"])
+        num_vertices = self.vvd_header.numLODVertexes[lod]
+        if len(source) != num_vertices:
+            warnings.warn(
+                f"VVD fixups give {len(source)} vertices for LOD {lod}, "
+                f"header says {num_vertices}"
+            )
+        return source
+
+    def _read_vvd_section(
+        self, offset: int, dtype: np.dtype | type, lod: int
+    ) -> np.ndarray:
+        """Per vertex records starting at `offset` with the fixups of `lod`
+        applied. Without fixups the result is a view into the map."""
+        source = self._get_fixup_source(lod)
+        if source is None:
+            return struct_array(
+                self.vvd_bytes, dtype, offset, self.vvd_header.numLODVertexes[lod]
+            )
+        return struct_array(self.vvd_bytes, dtype, offset, source.max(initial=-1) + 1)[
+            source
+        ]
 
-        return vertices_list
-
-    def _get_indices(self) -> list[int]:
-        self._load_vtx()
-
-        self.vtx_header = FileHeader_t.from_buffer_copy(self.vtx_bytes)
-        if self.vtx_header.numBodyParts != 1:
-            print(f"self.vtx_header.numBodyParts: {self.vtx_header.numBodyParts}")
-        if self.vtx_header.numLODs != 1:
-            print(f"self.vtx_header.numLODs: {self.vtx_header.numLODs}")
-
-        def get_offset(
-            struct_type: type[ctypes.Structure], length: int, offset: int
-        ) -> range:
-            # pylint: disable=W0212
-            return range(
-                offset,
-                offset + ctypes.sizeof(struct_type) * length,
-                ctypes.sizeof(struct_type),
+    def _get_vertex_records(self, lod: int = 0) -> np.ndarray:
+        """mstudiovertex_t records of one LOD with the whole fixup table
+        applied, cached per LOD"""
+        if lod not in self._vertex_records:
+            self._map_files()
+            self._vertex_records[lod] = self._read_vvd_section(
+                self.vvd_header.vertexDataStart, mstudiovertex_t, lod
+            )
+        return self._shared(self._vertex_records[lod])
+
+    def _get_tangents(self, lod: int = 0, dtype: type = np.float32) -> np.ndarray:
+        """(N, 4) tangents of one LOD, w is the bitangent sign. float32
+        arrays are cached per LOD, `dtype` float16 halves the size."""
+        if lod not in self._tangents:
+            self._map_files()
+            if self.vvd_header.tangentDataStart == 0:
+                raise RuntimeError("VVD has no tangent data")
+            self._tangents[lod] = np.ascontiguousarray(
+                self._read_vvd_section(
+                    self.vvd_header.tangentDataStart, np.dtype(("<f4", 4)), lod
+                )
             )
+        return self._shared(self._tangents[lod]).astype(dtype, copy=False)
 
-        num_lods = self.vtx_header.numLODs
-        strip_type = TypedDict("strip_type", {"hdr": StripHeader_t, "list": list})
-        stripgroup_type = TypedDict(
-            "stripgroup_type",
-            {"hdr": StripGroupHeader_t, "offset": int, "strips": list[strip_type]},
+    def _get_bone_weights(
+        self, lod: int = 0, weight_dtype: type = np.float32
+    ) -> BoneWeights:
+        """Skinning data of every vertex of one LOD. `weight_dtype` float16
+        or uint8 quantizes the weights, uint8 weights of a vertex sum to 255."""
+        records = self._get_vertex_records(lod)
+        # mstudioboneweight_t is the first 16 bytes of every 48 byte record
+        weights = records.view(np.float32).reshape(-1, 12)[:, :3].copy()
+        raw = records.view(np.uint8).reshape(-1, ctypes.sizeof(mstudiovertex_t))
+        bones = raw[:, 12:15].copy()
+        counts = np.minimum(raw[:, 15], MAX_NUM_BONES_PER_VERT)
+        unused = np.arange(MAX_NUM_BONES_PER_VERT) >= counts[:, None]
+        weights[unused] = 0
+        bones[unused] = 0
+        return BoneWeights(quantize_weights(weights, weight_dtype), bones, counts)
+
+    def compact_vertices(self, lod: int = 0) -> CompactVertices:
+        """Vertices of one LOD in the 14 byte compact layout, positions
+        quantized to the hull bounds, cached per LOD"""
+        if lod not in self._compact_vertices:
+            self._compact_vertices[lod] = encode_vertices(
+                self._get_vertices(lod), self.bounds[0], self.bounds[1]
+            )
+        return self._shared(self._compact_vertices[lod])
+
+    def _get_vertices(self, lod: int = 0) -> np.ndarray:
+        """float32 array (N, 8) of position, normal and uv, cached per LOD"""
+        if lod not in self._vertices and lod in self._compact_vertices:
+            self._vertices[lod] = decode_vertices(self._compact_vertices[lod])
+        if lod not in self._vertices:
+            records = self._get_vertex_records(lod)
+            # m_vecPosition, m_vecNormal and m_vecTexCoord are the last 8
+            # floats of every 48 byte record
+            floats = records.view(np.float32).reshape(-1, 12)
+            self._vertices[lod] = np.ascontiguousarray(floats[:, 4:])
+            if lod == 0:
+                self.num_vertices = len(records)
+        return self._shared(self._vertices[lod])
+
+    def _get_mesh_vertex_bases(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """First MDL mesh of every model, first VVD vertex and material
+        reference of every mesh, all flattened over bodyparts in file order"""
+        self._map_files()
+        bodypart_offsets = self.mdl_header.bodypart_offset + np.arange(
+            self.mdl_header.bodypart_count, dtype=np.int64
+        ) * ctypes.sizeof(mstudiobodyparts_t)
+        bodyparts = struct_array(
+            self.mdl_bytes,
+            mstudiobodyparts_t,
+            self.mdl_header.bodypart_offset,
+            self.mdl_header.bodypart_count,
         )
-        mesh_type = TypedDict(
-            "mesh_type", {"hdr": MeshHeader_t, "stripgroups": list[stripgroup_type]}
+        models, model_offsets, _, _ = read_children(
+            self.mdl_bytes,
+            mstudiomodel_t,
+            bodypart_offsets,
+            bodyparts["modelindex"],
+            bodyparts["nummodels"],
         )
-        lod_type = TypedDict(
-            "lod_type", {"hdr": ModelLODHeader_t, "meshes": list[mesh_type]}
+        meshes, _, mesh_model, _ = read_children(
+            self.mdl_bytes,
+            mstudiomesh_t,
+            model_offsets,
+            models["meshindex"],
+            models["nummeshes"],
         )
-        model_type = TypedDict(
-            "model_type", {"hdr": ModelHeader_t, "lods": list[lod_type]}
+        model_first_mesh = np.cumsum(models["nummeshes"], dtype=np.int64)
+        model_first_mesh -= models["nummeshes"]
+        mesh_vertex_base = (
+            models["vertexindex"][mesh_model] // ctypes.sizeof(mstudiovertex_t)
+            + meshes["vertexoffset"]
         )
-        bodypart_type = TypedDict(
-            "bodypart_type", {"hdr": BodyPartHeader_t, "models": list[model_type]}
+        return (
+            model_first_mesh,
+            mesh_vertex_base.astype(np.int64),
+            meshes["material"].astype(np.int32),
         )
-        bodyparts_name = self._get_bodypart()
-        bodyparts: list[bodypart_type] = []
-        for bodypart_offset in get_offset(
+
+    def _get_indices(self) -> MeshIndices:
+        self._map_files()
+        model_first_mesh, mesh_vertex_base, mesh_material = (
+            self._get_mesh_vertex_bases()
+        )
+
+        # walk the VTX tree one level at a time, every level is a flat array
+        bodypart_offsets = self.vtx_header.bodyPartOffset + np.arange(
+            self.vtx_header.numBodyParts, dtype=np.int64
+        ) * ctypes.sizeof(BodyPartHeader_t)
+        bodyparts = struct_array(
+            self.vtx_bytes,
             BodyPartHeader_t,
-            self.vtx_header.numBodyParts,
             self.vtx_header.bodyPartOffset,
+            self.vtx_header.numBodyParts,
+        )
+        models, model_offsets, model_bodypart, model_index = read_children(
+            self.vtx_bytes,
+            ModelHeader_t,
+            bodypart_offsets,
+            bodyparts["modelOffset"],
+            bodyparts["numModels"],
+        )
+        lods, lod_offsets, lod_model, lod_index = read_children(
+            self.vtx_bytes,
+            ModelLODHeader_t,
+            model_offsets,
+            models["lodOffset"],
+            models["numLODs"],
+        )
+        meshes, mesh_offsets, mesh_lod, mesh_index = read_children(
+            self.vtx_bytes,
+            MeshHeader_t,
+            lod_offsets,
+            lods["meshOffset"],
+            lods["numMeshes"],
+        )
+        stripgroups, stripgroup_offsets, stripgroup_mesh, _ = read_children(
+            self.vtx_bytes,
+            StripGroupHeader_t,
+            mesh_offsets,
+            meshes["stripGroupHeaderOffset"],
+            meshes["numStripGroups"],
+        )
+        strips, _, strip_stripgroup, _ = read_children(
+            self.vtx_bytes,
+            StripHeader_t,
+            stripgroup_offsets,
+            stripgroups["stripOffset"],
+            stripgroups["numStrips"],
+        )
+
+        mesh_model = lod_model[mesh_lod]
+        model_num_meshes = np.diff(model_first_mesh, append=len(mesh_vertex_base))
+        if len(models) != len(model_first_mesh) or np.any(
+            mesh_index >= model_num_meshes[mesh_model]
         ):
-            bodypart = BodyPartHeader_t.from_buffer_copy(
-                self.vtx_bytes, bodypart_offset
+            raise RuntimeError("VTX bodyparts don't match MDL bodyparts")
+        mdl_mesh = model_first_mesh[mesh_model] + mesh_index
+        stripgroup_base = mesh_vertex_base[mdl_mesh[stripgroup_mesh]]
+
+        num_verts = stripgroups["numVerts"].astype(np.int64)
+        num_indices = stripgroups["numIndices"].astype(np.int64)
+        remap_starts = np.cumsum(num_verts) - num_verts
+        index_starts = np.cumsum(num_indices) - num_indices
+
+        remap_parts: list[np.ndarray] = []
+        index_parts: list[np.ndarray] = []
+        for offset, vert_offset, n_verts, index_offset, n_indices in zip(
+            stripgroup_offsets.tolist(),
+            stripgroups["vertOffset"].tolist(),
+            num_verts.tolist(),
+            stripgroups["indexOffset"].tolist(),
+            num_indices.tolist(),
+        ):
+            remap_parts.append(
+                struct_array(self.vtx_bytes, Vertex_t, offset + vert_offset, n_verts)[
+                    "origMeshVertID"
+                ]
             )
-            bodyparts.append({"hdr": bodypart, "models": []})
-            for modelheader_offset in get_offset(
-                ModelHeader_t,
-                bodypart.numModels,
-                bodypart_offset + bodypart.modelOffset,
-            ):
-                modelheader = ModelHeader_t.from_buffer_copy(
-                    self.vtx_bytes, modelheader_offset
+            index_parts.append(
+                np.frombuffer(
+                    self.vtx_bytes, "<u2", n_indices, offset + index_offset
                 )
-                bodyparts[-1]["models"].append({"hdr": modelheader, "lods": []})
-                for modellodheader_offset in get_offset(
-                    ModelLODHeader_t,
-                    modelheader.numLODs,
-                    modelheader_offset + modelheader.lodOffset,
-                ):
-                    modellodheader = ModelLODHeader_t.from_buffer_copy(
-                        self.vtx_bytes, modellodheader_offset
-                    )
-                    bodyparts[-1]["models"][0]["lods"].append(
-                        {"hdr": modellodheader, "meshes": []}
-                    )
-                    for meshheader_offset in get_offset(
-                        MeshHeader_t,
-                        modellodheader.numMeshes,
-                        modellodheader_offset + modellodheader.meshOffset,
-                    ):
-                        meshheader = MeshHeader_t.from_buffer_copy(
-                            self.vtx_bytes, meshheader_offset
-                        )
-                        bodyparts[-1]["models"][0]["lods"][0]["meshes"].append(
-                            {"hdr": meshheader, "stripgroups": []}
-                        )
-                        for stripgroupheader_offset in get_offset(
-                            StripGroupHeader_t,
-                            meshheader.numStripGroups,
-                            meshheader_offset + meshheader.stripGroupHeaderOffset,
-                        ):
-                            stripgroupheader = StripGroupHeader_t.from_buffer_copy(
-                                self.vtx_bytes, stripgroupheader_offset
-                            )
-                            bodyparts[-1]["models"][0]["lods"][0]["meshes"][0][
-                                "stripgroups"
-                            ].append(
-                                {
-                                    "hdr": stripgroupheader,
-                                    "strips": [],
-                                    "offset": stripgroupheader_offset,
-                                }
-                            )
-                            for stripheader_offset in get_offset(
-                                StripHeader_t,
-                                stripgroupheader.numStrips,
-                                stripgroupheader_offset + stripgroupheader.stripOffset,
-                            ):
-                                stripheader = StripHeader_t.from_buffer_copy(
-                                    self.vtx_bytes, stripheader_offset
-                                )
-                                bodyparts[-1]["models"][0]["lods"][0]["meshes"][0]["stripgroups"][
-                                    0
-                                ]["strips"].append({"hdr": stripheader, "list": []})
-
-
-        last = bodyparts[0]["models"][0]["lods"][0]["meshes"][0]["stripgroups"][0]
-        pprint(bodyparts[0]["models"][0]["lods"][0]["meshes"][0])
-        offset = last["offset"]
-        indices_unordered = (ctypes.c_ushort * last["hdr"].numIndices).from_buffer_copy(
-            self.vtx_bytes, offset + last["hdr"].indexOffset
-        )
-        indices_mapping = [
-            int.from_bytes(self.vtx_bytes[i + 4 : i + 6], "little")
-            for i in range(
-                offset + last["hdr"].vertOffset,
-                offset + last["hdr"].vertOffset + 9 * last["hdr"].numVerts,
-                9,
             )
-        ]
-        # print_array([Vertex_t.from_buffer_copy(self.vtx_bytes, i) for i in range(offset+last["hdr"].vertOffset, offset+last["hdr"].vertOffset+9*last["hdr"].numVerts, 9)])
-        indices = [indices_mapping[i] for i in indices_unordered]
-        # indices = indices_unordered
-        return list(indices)
-        # offset += modelheader.lodOffset
-        # modellodheader = ModelLODHeader_t.from_buffer_copy(self.vtx_bytes, offset)
-        # offset += modellodheader.meshOffset
-        # meshheader = MeshHeader_t.from_buffer_copy(self.vtx_bytes, offset)
-        # offset += meshheader.stripGroupHeaderOffset
-        # stripgroupheader = StripGroupHeader_t.from_buffer_copy(self.vtx_bytes, offset)
-
-        # num_indices: int = stripgroupheader.numIndices
-        # indexoffset = offset + stripgroupheader.indexOffset
-        # indices_arr = (ctypes.c_ushort * num_indices).from_buffer_copy(
-        #     self.vtx_bytes, indexoffset
-        # )
-
-        # vertoffset = offset + stripgroupheader.vertOffset
-        # num_vertices: int = stripgroupheader.numVerts
-        # vertex_arr = (Vertex_t * num_vertices).from_buffer_copy(
-        #     self.vtx_bytes, vertoffset
-        # )
-
-        # new_indices_arr = []
-        # for i in indices_arr:
-        #     new_indices_arr.append(vertex_arr[i].origMeshVertID)
-        # return new_indices_arr
+
+        # origMeshVertID is mesh-local, strip group indices are local to their
+        # strip group; both gathers below run once over the whole file
+        remap = np.concatenate(remap_parts or [np.empty(0, np.uint16)]).astype(
+            np.uint32
+        )
+        remap += np.repeat(stripgroup_base, num_verts).astype(np.uint32)
+        local = np.concatenate(index_parts or [np.empty(0, np.uint16)]).astype(
+            np.int64
+        )
+        local += np.repeat(remap_starts, num_indices)
+        strip_indices = remap[local]
+
+        # strip groups without strips are a single triangle list
+        bare = np.flatnonzero(stripgroups["numStrips"] == 0)
+        strip_group = np.concatenate([strip_stripgroup, bare])
+        order = np.argsort(strip_group, kind="stable")
+        strip_group = strip_group[order]
+        strip_flags = np.concatenate(
+            [strips["flags"], np.full(len(bare), STRIP_IS_TRILIST, np.uint8)]
+        )[order]
+        strip_starts = np.concatenate(
+            [index_starts[strip_stripgroup] + strips["indexOffset"], index_starts[bare]]
+        )[order]
+        strip_counts = np.concatenate(
+            [strips["numIndices"], num_indices[bare]]
+        ).astype(np.int64)[order]
+        indices, strip_triangles = strips_to_lists(
+            strip_indices, strip_starts, strip_counts, strip_flags
+        )
+
+        table = np.zeros(len(meshes), dtype=MESH_TABLE_DTYPE)
+        table["bodypart"] = model_bodypart[mesh_model]
+        table["model"] = model_index[mesh_model]
+        table["lod"] = lod_index[mesh_lod]
+        table["mesh"] = mesh_index
+        table["material"] = mesh_material[mdl_mesh]
+        table["switch_point"] = lods["switchPoint"][mesh_lod]
+        table["flags"] = meshes["flags"]
+        strip_mesh = stripgroup_mesh[strip_group]
+        table["index_count"] = np.bincount(
+            strip_mesh, weights=strip_triangles * 3, minlength=len(meshes)
+        )
+        table["index_start"] = np.cumsum(table["index_count"]) - table["index_count"]
+        table["remap_count"] = np.bincount(
+            stripgroup_mesh, weights=num_verts, minlength=len(meshes)
+        )
+        table["remap_start"] = np.cumsum(table["remap_count"]) - table["remap_count"]
+
+        strip_table = np.zeros(len(strip_group), dtype=STRIP_TABLE_DTYPE)
+        strip_table["mesh"] = strip_mesh
+        strip_table["flags"] = strip_flags
+        strip_table["index_count"] = strip_triangles * 3
+        strip_table["index_start"] = (
+            np.cumsum(strip_table["index_count"]) - strip_table["index_count"]
+        )
+
+        self.num_indices = len(indices)
+        return MeshIndices(indices, remap, table, strip_table)
+
+    def optimized_mesh(self, lod: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Welded, cache and fetch ordered copy of one LOD for export.
+        Returns (vertices, indices, meshes), `meshes` are the LOD's
+        MESH_TABLE_DTYPE rows with index ranges into the new indices."""
+        meshes = self.indices.meshes[self.indices.meshes["lod"] == lod].copy()
+        vertices, indices, counts = optimize_mesh(
+            self.vertices,
+            self.indices.lod_indices(lod),
+            meshes["index_count"],
+        )
+        meshes["index_count"] = counts
+        meshes["index_start"] = np.cumsum(counts) - counts
+        # strip group vertex tables don't apply to the welded vertices
+        meshes["remap_start"] = 0
+        meshes["remap_count"] = 0
+        return vertices, indices, meshes
+
+    def generate_lods(
+        self,
+        ratios: tuple[float, ...] = DEFAULT_LOD_RATIOS,
+        switch_points: tuple[float, ...] | None = None,
+        max_error: float = np.inf,
+    ) -> LODChain:
+        """Appends simplified LODs to `lods` when the model ships fewer than
+        `ratios` asks for, the shipped LODs and their switch points stay.
+        See simplify.extend_lod_chain(), save_cache() keeps the result."""
+        if len(self.lods) > len(ratios):
+            return self.lods
+        radius = float(np.linalg.norm(self.bounds[1] - self.bounds[0])) * 0.5
+        chain = extend_lod_chain(self.lods, radius, ratios, switch_points, max_error)
+        self.__dict__["lods"] = self._shared(chain)
+        self._assemblies.clear()
+        return chain
+
+    def assemble(self, body: int = 0, lod: int = 0) -> LODMesh:
+        """Geometry of the models that bodygroup value `body` selects at one
+        LOD of `lods`, memoized per (body, lod)"""
+        choices = self.bodygroups.choices(body)
+        key = (
+            int(np.sum(choices * self.bodygroups.bases)),
+            min(lod, len(self.lods) - 1),
+        )
+        if key not in self._assemblies:
+            source = self.lods[key[1]]
+            rows = source.meshes[
+                choices[source.meshes["bodypart"]] == source.meshes["model"]
+            ].copy()
+            indices = source.indices[
+                concat_ranges(rows["index_start"], rows["index_count"])
+            ]
+            rows["index_start"] = np.cumsum(rows["index_count"]) - rows["index_count"]
+            self._assemblies[key] = compact_lod(source.vertices, indices, rows)
+        return self._shared(self._assemblies[key])
+
+    def _get_lods(self) -> LODChain:
+        meshes = self.indices.meshes
+        lods = []
+        switch_points = []
+        for lod in np.unique(meshes["lod"]).tolist():
+            rows = meshes[meshes["lod"] == lod].copy()
+            # negative switch points mark shadow LODs, never drawn by distance
+            if lod > 0 and np.all(rows["switch_point"] < 0):
+                continue
+            rows["index_start"] = np.cumsum(rows["index_count"]) - rows["index_count"]
+            rows["remap_start"] = 0
+            rows["remap_count"] = 0
+            lods.append(
+                compact_lod(self.vertices, self.indices.lod_indices(lod), rows)
+            )
+            switch_points.append(rows["switch_point"].max(initial=0.0))
+        if not lods:
+            raise RuntimeError("Model has no LODs")
+        switch_points[0] = 0.0
+        return LODChain(lods, np.maximum.accumulate(switch_points))
+
+    def _get_bvh(self) -> TriangleBVH:
+        triangles = self.indices.lod_indices(0).reshape(-1, 3)
+        return TriangleBVH(self.vertices[:, :3], triangles)
 
     def _get_bones(self) -> ctypes.Array[mstudiobone_t]:
         # flags here https://github.com/ValveSoftware/source-sdk-2013/blob/0d8dceea4310fde5706b3ce1c70609d72a38efdf/sp/src/public/studio.h#L373
-        self._load_mdl()
+        self._map_files()
         bone_count: int = self.mdl_header.bone_count
-        bones = (mstudiobone_t * bone_count).from_buffer_copy(
+        bones = (mstudiobone_t * bone_count).from_buffer(
             self.mdl_bytes, self.mdl_header.bone_offset
         )
         return bones
 
-    def _get_hitboxes(self) -> ctypes.Array[mstudiohitboxset_t]:
-        self._load_mdl()
-        hitbox_count: int = self.mdl_header.hitbox_count
-        hitboxes = (mstudiohitboxset_t * hitbox_count).from_buffer_copy(
-            self.mdl_bytes, self.mdl_header.hitbox_offset
-        )
-        if hitbox_count != 1:
-            raise NotImplementedError()
-        if hitboxes[0].numhitboxes != 1:
-            raise NotImplementedError()
-
-        name = bytearray()
-        for i in range(
-            self.mdl_header.hitbox_offset + hitboxes[0].sznameindex,
-            self.mdl_header.hitbox_offset + hitboxes[0].sznameindex + 64,
-        ):
-            if self.mdl_bytes[i] == 0:
-                break
-            name.append(self.mdl_bytes[i])
+    def _get_bone_names(self) -> list[str]:
+        self._map_files()
+        return [
+            read_cstring(
+                self.mdl_bytes,
+                self.mdl_header.bone_offset
+                + ctypes.sizeof(mstudiobone_t) * i
+                + bone.sznameindex,
+            ).decode("ascii")
+            for i, bone in enumerate(self.bones)
+        ]
 
-        offset = self.mdl_header.hitbox_offset + hitboxes[0].hitboxindex
-        bbox = mstudiobbox_t.from_buffer_copy(self.mdl_bytes, offset)
+    def _get_skeleton(self) -> Skeleton:
+        return Skeleton.from_bones(
+            np.frombuffer(self.bones, struct_dtype(mstudiobone_t)), self.bone_names
+        )
 
-        bbox_name = bytearray()
-        for i in range(
-            offset + bbox.szhitboxnameindex, offset + bbox.szhitboxnameindex + 64
-        ):
-            if self.mdl_bytes[i] == 0:
-                break
-            bbox_name.append(self.mdl_bytes[i])
+    def _get_hitboxes(self) -> Hitboxes:
+        self._map_files()
+        set_offsets = self.mdl_header.hitbox_offset + np.arange(
+            self.mdl_header.hitbox_count, dtype=np.int64
+        ) * ctypes.sizeof(mstudiohitboxset_t)
+        sets = struct_array(
+            self.mdl_bytes,
+            mstudiohitboxset_t,
+            self.mdl_header.hitbox_offset,
+            self.mdl_header.hitbox_count,
+        )
+        bboxes, bbox_offsets, bbox_set, _ = read_children(
+            self.mdl_bytes,
+            mstudiobbox_t,
+            set_offsets,
+            sets["hitboxindex"],
+            sets["numhitboxes"],
+        )
+
+        boxes = np.empty(len(bboxes), dtype=HITBOX_DTYPE)
+        boxes["set"] = bbox_set
+        boxes["bone"] = bboxes["bone"]
+        boxes["group"] = bboxes["group"]
+        boxes["bbmin"] = recfunctions.structured_to_unstructured(bboxes["bbmin"])
+        boxes["bbmax"] = recfunctions.structured_to_unstructured(bboxes["bbmax"])
+        return Hitboxes(
+            [
+                read_cstring(self.mdl_bytes, offset + name, 64).decode("ascii")
+                for offset, name in zip(
+                    set_offsets.tolist(), sets["sznameindex"].tolist()
+                )
+            ],
+            [
+                # unnamed boxes have szhitboxnameindex 0
+                read_cstring(self.mdl_bytes, offset + name, 64).decode("ascii")
+                if name
+                else ""
+                for offset, name in zip(
+                    bbox_offsets.tolist(), bboxes["szhitboxnameindex"].tolist()
+                )
+            ],
+            boxes,
+        )
 
-        return hitboxes
+    def _get_hitbox_index(self) -> AABBIndex:
+        return self.hitboxes.aabb_index(self.skeleton.bind_world)
 
-    def _get_animation(self):
-        self._load_mdl()
-        animdesc = (
-            mstudioanimdesc_t * self.mdl_header.localanim_count
-        ).from_buffer_copy(self.mdl_bytes, self.mdl_header.localanim_offset)
+    def _get_collision(self) -> CollisionModel | None:
+        if not os.path.exists(self.phy_path):
+            return None
+        phy_bytes = map_file(self.phy_path)
+        try:
+            header = phyheader_t.from_buffer_copy(phy_bytes)
+            if header.checkSum != self._checksum():
+                raise RuntimeError("PHY's checksum != MDL's checksum")
+            # parse_phy copies everything out of the map
+            return parse_phy(phy_bytes)
+        finally:
+            phy_bytes.close()
 
-    def _get_localsec(self):
-        self._load_mdl()
-        localsec = (mstudioseqdesc_t * self.mdl_header.localseq_count).from_buffer_copy(
+    def _get_animation(self, index: int) -> Animation:
+        """Dense per-frame tracks of local animation `index`, cached"""
+        if index in self._animations:
+            return self._animations[index]
+        self._map_files()
+        if not 0 <= index < self.mdl_header.localanim_count:
+            raise IndexError(f"Animation {index} out of range")
+        desc_offset = (
+            self.mdl_header.localanim_offset + ctypes.sizeof(mstudioanimdesc_t) * index
+        )
+        desc = mstudioanimdesc_t.from_buffer(self.mdl_bytes, desc_offset)
+        positions, quaternions = decode_animation(
+            self.mdl_bytes,
+            desc_offset,
+            desc,
+            np.frombuffer(self.bones, struct_dtype(mstudiobone_t)),
+        )
+        animation = Animation(
+            read_cstring(self.mdl_bytes, desc_offset + desc.sznameindex).decode(
+                "ascii"
+            ),
+            desc.fps,
+            desc.flags,
+            positions,
+            quaternions,
+        )
+        self._animations[index] = animation
+        return animation
+
+    def _get_sequences(self) -> list[Sequence]:
+        self._map_files()
+        sequences: list[Sequence] = []
+        seqdescs = (mstudioseqdesc_t * self.mdl_header.localseq_count).from_buffer(
             self.mdl_bytes, self.mdl_header.localseq_offset
         )
+        for i, seqdesc in enumerate(seqdescs):
+            offset = (
+                self.mdl_header.localseq_offset + ctypes.sizeof(mstudioseqdesc_t) * i
+            )
+            width, height = seqdesc.groupsize
+            sequences.append(
+                Sequence(
+                    read_cstring(self.mdl_bytes, offset + seqdesc.szlabelindex).decode(
+                        "ascii"
+                    ),
+                    read_cstring(
+                        self.mdl_bytes, offset + seqdesc.szactivitynameindex
+                    ).decode("ascii"),
+                    seqdesc.flags,
+                    np.frombuffer(
+                        self.mdl_bytes,
+                        "<i2",
+                        width * height,
+                        offset + seqdesc.animindexindex,
+                    ).reshape(height, width),
+                )
+            )
+        return sequences
 
-    def _get_textures(self) -> list[str]:
-        self._load_mdl()
+    def _get_sequence_animation(self, sequence: int | str, blend: int = 0) -> Animation:
+        """Animation `blend` of the blend grid of a sequence (index or name)"""
+        if isinstance(sequence, str):
+            sequence = [seq.name for seq in self.sequences].index(sequence)
+        return self._get_animation(int(self.sequences[sequence].animations.flat[blend]))
 
+    def _get_textures(self) -> list[str]:
+        self._map_files()
         tex_names: list[str] = []
-        textures = (mstudiotexture_t * self.mdl_header.texture_count).from_buffer_copy(
+        textures = (mstudiotexture_t * self.mdl_header.texture_count).from_buffer(
             self.mdl_bytes, self.mdl_header.texture_offset
         )
         for i, tex in enumerate(textures):
@@ -384,26 +1238,64 @@ class SourceModel:
                 + tex.name_offset
                 + ctypes.sizeof(mstudiotexture_t) * i
             )
-            tex_names.append(
-                read_until_null(self.mdl_bytes[name_offset:]).decode("ascii")
-            )
+            tex_names.append(read_cstring(self.mdl_bytes, name_offset).decode("ascii"))
+        return tex_names
 
-        texturedir_offset = list(
-            self.mdl_bytes[
-                self.mdl_header.texture_offset : self.mdl_header.texture_offset
-                + self.mdl_header.texturedir_count
-            ]
+    def _get_texture_dirs(self) -> list[str]:
+        self._map_files()
+        texturedir_offset = np.frombuffer(
+            self.mdl_bytes,
+            "<i4",
+            self.mdl_header.texturedir_count,
+            self.mdl_header.texturedir_offset,
         )
-        # for offset in texturedir_offset:
-        #     print(read_until_null(self.mdl_bytes[offset:]))
-        return tex_names
+        return [
+            read_cstring(self.mdl_bytes, offset).decode("ascii")
+            for offset in texturedir_offset.tolist()
+        ]
 
-    def _get_skins(self):
-        raise NotImplementedError()
+    def _get_bodygroups(self) -> Bodygroups:
+        self._map_files()
+        bodyparts = struct_array(
+            self.mdl_bytes,
+            mstudiobodyparts_t,
+            self.mdl_header.bodypart_offset,
+            self.mdl_header.bodypart_count,
+        )
+        names = [
+            read_cstring(
+                self.mdl_bytes,
+                self.mdl_header.bodypart_offset
+                + ctypes.sizeof(mstudiobodyparts_t) * i
+                + name_offset,
+            ).decode("ascii")
+            for i, name_offset in enumerate(bodyparts["sznameindex"].tolist())
+        ]
+        return Bodygroups(
+            names,
+            bodyparts["base"].astype(np.int64),
+            bodyparts["nummodels"].astype(np.int64),
+        )
 
-    def _get_bodypart(self) -> list:
-        self._load_mdl()
+    def _get_skins(self) -> Skins:
+        self._map_files()
+        family_count = self.mdl_header.skinrfamily_count
+        reference_count = self.mdl_header.skinreference_count
+        if family_count == 0:
+            # no skin table, references are texture indices
+            families = np.arange(self.mdl_header.texture_count, dtype=np.int16)[None]
+        else:
+            families = np.frombuffer(
+                self.mdl_bytes,
+                "<i2",
+                family_count * reference_count,
+                self.mdl_header.skinreference_index,
+            ).reshape(family_count, reference_count)
+        names, lod_materials = self._get_material_replacements()
+        return Skins(names, families.astype(np.int32), lod_materials)
 
+    def _get_bodypart(self) -> list:
+        self._map_files()
         model_type = TypedDict(
             "model_type", {"name": str, "meshes": ctypes.Array[MeshHeader_t]}
         )
@@ -412,48 +1304,79 @@ class SourceModel:
         )
         output: list[bodypart_type] = []
 
-        bodypart_count: int = self.mdl_header.bodypart_count
-        bodyparts = (mstudiobodyparts_t * bodypart_count).from_buffer_copy(
-            self.mdl_bytes, self.mdl_header.bodypart_offset
-        )
-
-        for i, bodypart in enumerate(bodyparts):
-            if bodypart.base != 1:
-                warnings.warn("mstudiobodyparts_t.base != 1")
-            bpart = {
-                "name": read_until_null(
-                    self.mdl_bytes[
-                        self.mdl_header.bodypart_offset
-                        + ctypes.sizeof(mstudiobodyparts_t) * i
-                        + bodypart.sznameindex :
-                    ]
-                ),
-                "models": [],
-            }
-            models_offset = (
-                self.mdl_header.bodypart_offset
-                + ctypes.sizeof(i * mstudiobodyparts_t)
-                + bodypart.modelindex
-            )
-            models = (mstudiomodel_t * bodypart.nummodels).from_buffer_copy(
-                self.mdl_bytes,
-                models_offset,
+        bodypart_offsets = self.mdl_header.bodypart_offset + np.arange(
+            self.mdl_header.bodypart_count, dtype=np.int64
+        ) * ctypes.sizeof(mstudiobodyparts_t)
+        bodyparts = struct_array(
+            self.mdl_bytes,
+            mstudiobodyparts_t,
+            self.mdl_header.bodypart_offset,
+            self.mdl_header.bodypart_count,
+        )
+        models, model_offsets, model_bodypart, _ = read_children(
+            self.mdl_bytes,
+            mstudiomodel_t,
+            bodypart_offsets,
+            bodyparts["modelindex"],
+            bodyparts["nummodels"],
+        )
+        for offset, name_offset in zip(
+            bodypart_offsets.tolist(), bodyparts["sznameindex"].tolist()
+        ):
+            name = read_cstring(self.mdl_bytes, offset + name_offset)
+            output.append({"name": name, "models": []})
+        for model, offset, bodypart in zip(
+            models, model_offsets.tolist(), model_bodypart.tolist()
+        ):
+            meshes = (mstudiomesh_t * int(model["nummeshes"])).from_buffer(
+                self.mdl_bytes, offset + int(model["meshindex"])
             )
-
-            for model in models:
-                meshes = (mstudiomesh_t * model.nummeshes).from_buffer_copy(
-                    self.mdl_bytes, models_offset + model.meshindex
-                )
-                models_offset += ctypes.sizeof(mstudiomodel_t)
-                bpart["models"].append({"name": model.name, "meshes": meshes})
-
-            output.append(bpart)
+            name = model["name"].tobytes().split(b"\0", 1)[0]
+            output[bodypart]["models"].append({"name": name, "meshes": meshes})
         return output
 
-    def _get_material(self):
-        self._load_mdl()
-        # print(self.vtx_bytes[self.vtx_header.materialReplacementListOffset :])
+    def _get_material_replacements(self) -> tuple[list[str], np.ndarray]:
+        """Texture names extended by the VTX replacement materials, and the
+        (LODs, textures) table of which name every texture uses per LOD"""
+        self._map_files()
+        names = list(self.textures)
+        num_lods = max(self.vtx_header.numLODs, 1)
+        lod_materials = np.tile(
+            np.arange(len(names), dtype=np.int32), (num_lods, 1)
+        )
+        list_offset = self.vtx_header.materialReplacementListOffset
+        if list_offset == 0:
+            return names, lod_materials
 
+        list_offsets = list_offset + np.arange(
+            num_lods, dtype=np.int64
+        ) * ctypes.sizeof(MaterialReplacementListHeader_t)
+        lists = struct_array(
+            self.vtx_bytes, MaterialReplacementListHeader_t, list_offset, num_lods
+        )
+        replacements, offsets, lods, _ = read_children(
+            self.vtx_bytes,
+            MaterialReplacementHeader_t,
+            list_offsets,
+            lists["replacementOffset"],
+            lists["numReplacements"],
+        )
+        name_ids: dict[str, int] = {}
+        for offset, name_offset, lod, material in zip(
+            offsets.tolist(),
+            replacements["replacementMaterialNameOffset"].tolist(),
+            lods.tolist(),
+            replacements["materialID"].tolist(),
+        ):
+            if not 0 <= material < len(self.textures):
+                warnings.warn(f"Material replacement of unknown material {material}")
+                continue
+            name = read_cstring(self.vtx_bytes, offset + name_offset).decode("ascii")
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+            lod_materials[lod, material] = name_ids[name]
+        return names, lod_materials
 
 def main():
     model = SourceModel(
@@ -466,7 +1389,7 @@ def main():
     # model._get_textures()
     # model._get_bodypart()
     model._get_indices()
-    # model._get_material()
+    # model._get_skins()
 
 
 if __name__ == "__main__":
@@ -417,6 +417,30 @@ class mstudioanimdesc_t(PrintableStruct):
     _pack_ = 1
 
 
+class mstudioanimsections_t(PrintableStruct):
+    _fields_ = (
+        ("animblock", ctypes.c_int),
+        ("animindex", ctypes.c_int),
+    )
+    _pack_ = 1
+
+
+class mstudioanim_valueptr_t(PrintableStruct):
+    _fields_ = (
+        ("offset", ctypes.c_short * 3),
+    )
+    _pack_ = 1
+
+
+class mstudioanim_t(PrintableStruct):
+    _fields_ = (
+        ("bone", byte),
+        ("flags", byte),
+        ("nextoffset", ctypes.c_short),
+    )
+    _pack_ = 1
+
+
 class mstudioseqdesc_t(PrintableStruct):
     _fields_ = (
         ("baseptr", ctypes.c_int),
@@ -487,3 +511,57 @@ class vertexFileFixup_t(PrintableStruct):
     _pack_ = 1
 
 
+class phyheader_t(PrintableStruct):
+    _fields_ = (
+        ("size", ctypes.c_int),
+        ("id", ctypes.c_int),
+        ("solidCount", ctypes.c_int),
+        ("checkSum", ctypes.c_int),
+    )
+    _pack_ = 1
+
+
+class compactsurfaceheader_t(PrintableStruct):
+    _fields_ = (
+        ("size", ctypes.c_int),
+        ("vphysicsID", ctypes.c_int),
+        ("version", ctypes.c_short),
+        ("modelType", ctypes.c_short),
+        ("surfaceSize", ctypes.c_int),
+        ("dragAxisAreas", Vector),
+        ("axisMapSize", ctypes.c_int),
+    )
+    _pack_ = 1
+
+
+class ivpcompactsurface_t(PrintableStruct):
+    _fields_ = (
+        ("mass_center", ctypes.c_float * 3),
+        ("rotation_inertia", ctypes.c_float * 3),
+        ("upper_limit_radius", ctypes.c_float),
+        ("max_factor_surface_deviation_and_byte_size", ctypes.c_uint),
+        ("offset_ledgetree_root", ctypes.c_int),
+        ("dummy", ctypes.c_int * 3),
+    )
+    _pack_ = 1
+
+
+class ivpcompactledge_t(PrintableStruct):
+    _fields_ = (
+        ("c_point_offset", ctypes.c_int),
+        ("client_data", ctypes.c_int),
+        ("flags_and_size_div_16", ctypes.c_uint),
+        ("n_triangles", ctypes.c_short),
+        ("for_future_use", ctypes.c_short),
+    )
+    _pack_ = 1
+
+
+class ivpcompacttriangle_t(PrintableStruct):
+    _fields_ = (
+        ("tri_index_pierce_material_virtual", ctypes.c_uint),
+        ("c_three_edges", ctypes.c_uint * 3),
+    )
+    _pack_ = 1
+
+
@@ -0,0 +1,193 @@
+"""Welding and reordering of indexed triangle meshes before export.
+
+Vertices are (N, K) float arrays, position first, indices are flat triangle
+lists. Triangles are only reordered inside their group (index_counts), so
+per material ranges survive.
+"""
+import numpy as np
+
+# quantization steps of the (N, 8) position/normal/uv layout of
+# SourceModel vertices
+WELD_STEPS = np.array([1e-3] * 3 + [1e-3] * 3 + [1e-5] * 2, dtype=np.float64)
+
+# Forsyth's "Linear-Speed Vertex Cache Optimisation" constants
+CACHE_SIZE = 32
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+
+def weld_vertices(
+    vertices: np.ndarray, indices: np.ndarray, steps: np.ndarray | float | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Merges vertices whose attributes quantize to the same grid cell.
+    `steps` is one quantization step per column (default WELD_STEPS for 8
+    columns, 1e-5 otherwise). Returns (welded vertices, remapped indices)."""
+    vertices = np.asarray(vertices)
+    if steps is None:
+        steps = WELD_STEPS if vertices.shape[1] == len(WELD_STEPS) else 1e-5
+    quantized = np.ascontiguousarray(np.round(vertices / steps).astype(np.int64))
+    # every quantized row as one opaque record, equal rows group together
+    keys = quantized.view(np.dtype((np.void, quantized.itemsize * quantized.shape[1])))
+    _, first, inverse = np.unique(keys.ravel(), return_index=True, return_inverse=True)
+    return vertices[first], inverse.reshape(-1)[indices]
+
+
+def remove_degenerate_triangles(indices: np.ndarray) -> np.ndarray:
+    triangles = np.asarray(indices).reshape(-1, 3)
+    keep = (
+        (triangles[:, 0] != triangles[:, 1])
+        & (triangles[:, 1] != triangles[:, 2])
+        & (triangles[:, 2] != triangles[:, 0])
+    )
+    return triangles[keep].reshape(-1)
+
+
+def _vertex_scores(cache_size: int, max_valence: int) -> tuple[list, list]:
+    """Score of every cache position and of every remaining valence"""
+    cache_scores = [LAST_TRIANGLE_SCORE] * 3 + [
+        (1.0 - (position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER
+        for position in range(3, cache_size)
+    ]
+    valence_scores = [0.0] + [
+        VALENCE_BOOST_SCALE * valence**-VALENCE_BOOST_POWER
+        for valence in range(1, max_valence + 1)
+    ]
+    return cache_scores, valence_scores
+
+
+def optimize_vertex_cache(
+    indices: np.ndarray, num_vertices: int, cache_size: int = CACHE_SIZE
+) -> np.ndarray:
+    """Triangles reordered for post-transform cache hits with Forsyth's
+    greedy algorithm. The walk is sequential by nature, so it runs on
+    Python lists; adjacency is built with array operations."""
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    num_triangles = len(triangles)
+    if num_triangles == 0:
+        return triangles.reshape(-1)
+
+    # vertex -> triangles adjacency in CSR form
+    valence = np.bincount(triangles.reshape(-1), minlength=num_vertices)
+    adjacency_start = (np.cumsum(valence) - valence).tolist()
+    adjacency = (np.argsort(triangles.reshape(-1), kind="stable") // 3).tolist()
+    cache_scores, valence_scores = _vertex_scores(cache_size, int(valence.max()))
+
+    corners = triangles.tolist()
+    live = valence.tolist()
+    live_triangles = [
+        adjacency[start : start + count]
+        for start, count in zip(adjacency_start, live)
+    ]
+    position = [-1] * num_vertices
+    vertex_score = [valence_scores[count] for count in live]
+    triangle_score = [
+        vertex_score[a] + vertex_score[b] + vertex_score[c] for a, b, c in corners
+    ]
+    emitted = [False] * num_triangles
+
+    order = []
+    cache: list[int] = []
+    best = max(range(num_triangles), key=triangle_score.__getitem__)
+    # dead ends restart from the first triangle not emitted yet
+    cursor = 0
+    while True:
+        order.append(best)
+        emitted[best] = True
+        triangle = corners[best]
+        for vertex in triangle:
+            live[vertex] -= 1
+            live_triangles[vertex].remove(best)
+
+        cache = triangle + [vertex for vertex in cache if vertex not in triangle]
+        for vertex in cache[cache_size:]:
+            position[vertex] = -1
+            vertex_score[vertex] = valence_scores[live[vertex]]
+        del cache[cache_size:]
+
+        touched = set()
+        for slot, vertex in enumerate(cache):
+            position[vertex] = slot
+            vertex_score[vertex] = (
+                cache_scores[slot] + valence_scores[live[vertex]]
+                if live[vertex]
+                else -1.0
+            )
+            touched.update(live_triangles[vertex])
+
+        best, best_score = -1, -1.0
+        for candidate in touched:
+            a, b, c = corners[candidate]
+            score = vertex_score[a] + vertex_score[b] + vertex_score[c]
+            triangle_score[candidate] = score
+            if score > best_score:
+                best, best_score = candidate, score
+        if best < 0:
+            while cursor < num_triangles and emitted[cursor]:
+                cursor += 1
+            if cursor == num_triangles:
+                break
+            best = cursor
+    return triangles[order].reshape(-1)
+
+
+def optimize_vertex_fetch(
+    vertices: np.ndarray, indices: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Vertices sorted by first use in `indices`, unused ones are dropped"""
+    indices = np.asarray(indices)
+    used, first_use = np.unique(indices, return_index=True)
+    order = used[np.argsort(first_use, kind="stable")]
+    remap = np.full(len(vertices), -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return vertices[order], remap[indices].astype(indices.dtype)
+
+
+def vertex_cache_miss_ratio(indices: np.ndarray, cache_size: int = 16) -> float:
+    """Average cache misses per triangle (ACMR) of a FIFO cache"""
+    indices = np.asarray(indices).tolist()
+    if not indices:
+        return 0.0
+    fifo: list[int] = []
+    cached = set()
+    misses = 0
+    for vertex in indices:
+        if vertex in cached:
+            continue
+        misses += 1
+        fifo.append(vertex)
+        cached.add(vertex)
+        if len(fifo) > cache_size:
+            cached.discard(fifo.pop(0))
+    return misses / (len(indices) // 3)
+
+
+def optimize_mesh(
+    vertices: np.ndarray,
+    indices: np.ndarray,
+    index_counts: np.ndarray | None = None,
+    steps: np.ndarray | float | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Weld, vertex cache and vertex fetch passes. `index_counts` splits
+    `indices` into consecutive groups (meshes) that keep their own range.
+    Returns (vertices, indices, index_counts), counts shrink by the
+    triangles welding made degenerate."""
+    indices = np.asarray(indices)
+    if index_counts is None:
+        index_counts = np.array([len(indices)])
+    welded, welded_indices = weld_vertices(vertices, indices, steps)
+
+    starts = np.cumsum(index_counts) - index_counts
+    groups = [
+        optimize_vertex_cache(
+            remove_degenerate_triangles(welded_indices[start : start + count]),
+            len(welded),
+        )
+        for start, count in zip(starts.tolist(), np.asarray(index_counts).tolist())
+    ]
+    new_counts = np.array([len(group) for group in groups], dtype=np.int64)
+    optimized = np.concatenate(groups or [np.empty(0, np.int64)])
+    new_vertices, new_indices = optimize_vertex_fetch(welded, optimized)
+    index_dtype = np.uint16 if len(new_vertices) <= 0x10000 else np.uint32
+    return new_vertices, new_indices.astype(index_dtype), new_counts
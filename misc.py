@@ -1,4 +1,8 @@
 import ctypes
+import functools
+import mmap
+
+import numpy as np
 
 def print_array(array: ctypes.Array):
     TAB = " "*4
@@ -12,4 +16,72 @@ def read_until_null(bts: bytes) -> bytearray:
         if i == 0:
             break
         byte.append(i)
-    return byte
\ No newline at end of file
+    return byte
+
+
+@functools.cache
+def struct_dtype(struct_type: type[ctypes.Structure]) -> np.dtype:
+    return np.dtype(struct_type)
+
+
+def struct_array(
+    buf, struct_type: type[ctypes.Structure], offset: int, count: int
+) -> np.ndarray:
+    """Structured array view (no copy) of `count` packed structs at `offset`"""
+    count = int(count)
+    if count <= 0:
+        return np.empty(0, dtype=struct_dtype(struct_type))
+    return np.frombuffer(buf, struct_dtype(struct_type), count, int(offset))
+
+
+def read_children(
+    buf,
+    struct_type: type[ctypes.Structure],
+    parent_offsets: np.ndarray,
+    child_offsets: np.ndarray,
+    child_counts: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Reads one level of an offset-linked header tree (VTX, MDL bodyparts...).
+
+    Every parent at `parent_offsets` owns `child_counts` consecutive structs
+    starting `child_offsets` bytes after itself. Returns the children of all
+    parents concatenated, their absolute offsets, the index of their parent
+    and their index inside the parent."""
+    starts = np.asarray(parent_offsets, dtype=np.int64) + child_offsets
+    counts = np.asarray(child_counts, dtype=np.int64)
+    headers = np.concatenate(
+        [
+            struct_array(buf, struct_type, start, count)
+            for start, count in zip(starts.tolist(), counts.tolist())
+        ]
+        or [struct_array(buf, struct_type, 0, 0)]
+    )
+    parent = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(len(headers)) - np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = np.repeat(starts, counts) + local * ctypes.sizeof(struct_type)
+    return headers, offsets, parent, local
+
+
+def concat_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + count) for every pair"""
+    starts = np.asarray(starts, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    first = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(first - starts, counts)
+
+
+def read_cstring(buf, offset: int, max_length: int = -1) -> bytes:
+    """Null terminated string at `offset` without slicing the rest of `buf`"""
+    end = buf.find(b"\0", offset, len(buf) if max_length < 0 else offset + max_length)
+    if end == -1:
+        end = len(buf) if max_length < 0 else min(len(buf), offset + max_length)
+    return bytes(buf[offset:end])
+
+
+def map_file(path) -> mmap.mmap:
+    """Maps the whole file copy-on-write so ctypes from_buffer() works on it"""
+    with open(path, "rb") as file:
+        try:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError as error:
+            raise RuntimeError(f"Couldn't map {path}: {error}") from error
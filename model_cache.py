@@ -0,0 +1,128 @@
+"""Single file cache of parsed model arrays.
+
+Layout: ModelCacheHeader_t, JSON table of contents, then the raw arrays,
+each aligned to CACHE_ALIGNMENT so they can be used straight from a map.
+"""
+import ctypes
+import json
+import os
+
+import numpy as np
+
+from gmod.custom_structure import PrintableStruct
+from gmod.misc import map_file
+
+MODEL_CACHE_ID = b"GMDC"
+MODEL_CACHE_VERSION = 6
+CACHE_ALIGNMENT = 64
+
+
+class ModelCacheHeader_t(PrintableStruct):
+    _fields_ = (
+        ("id", ctypes.c_char * 4),
+        ("version", ctypes.c_int),
+        ("checksum", ctypes.c_int),
+        ("unused", ctypes.c_int),
+        ("mdl_mtime", ctypes.c_longlong),
+        ("vtx_mtime", ctypes.c_longlong),
+        ("vvd_mtime", ctypes.c_longlong),
+        ("toc_offset", ctypes.c_longlong),
+        ("toc_size", ctypes.c_longlong),
+    )
+    _pack_ = 1
+
+
+def cache_key(
+    checksum: int, mdl_path: str, vtx_path: str, vvd_path: str
+) -> tuple[int, int, int, int]:
+    return (
+        checksum,
+        os.stat(mdl_path).st_mtime_ns,
+        os.stat(vtx_path).st_mtime_ns,
+        os.stat(vvd_path).st_mtime_ns,
+    )
+
+
+def write_model_cache(
+    path: str,
+    key: tuple[int, int, int, int],
+    arrays: dict[str, np.ndarray],
+    meta: dict,
+):
+    """Writes `arrays` and the JSON-serializable `meta` to `path`. The file is
+    written next to `path` first and then renamed, so readers never see a
+    half written cache."""
+    header = ModelCacheHeader_t()
+    header.id = MODEL_CACHE_ID
+    header.version = MODEL_CACHE_VERSION
+    header.checksum, header.mdl_mtime, header.vtx_mtime, header.vvd_mtime = key
+
+    toc: dict = {"meta": meta, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        toc["arrays"][name] = {
+            "dtype": np.lib.format.dtype_to_descr(array.dtype),
+            "shape": array.shape,
+            "offset": offset,
+        }
+        offset += -(-array.nbytes // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+    toc_bytes = json.dumps(toc).encode("utf-8")
+    header.toc_offset = ctypes.sizeof(ModelCacheHeader_t)
+    header.toc_size = len(toc_bytes)
+    data_start = header.toc_offset + header.toc_size
+    data_start = -(-data_start // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(bytes(header))
+        file.write(toc_bytes)
+        for name, array in arrays.items():
+            file.seek(data_start + toc["arrays"][name]["offset"])
+            file.write(np.ascontiguousarray(array).data)
+        file.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def read_model_cache(
+    path: str, key: tuple[int, int, int, int]
+) -> tuple[dict[str, np.ndarray], dict] | None:
+    """Maps the cache at `path`. Returns None if it is missing, broken or was
+    written for another `key`. Arrays are views into the map."""
+    if not os.path.exists(path):
+        return None
+    try:
+        data = map_file(path)
+    except RuntimeError:
+        return None
+    if len(data) < ctypes.sizeof(ModelCacheHeader_t):
+        return None
+    header = ModelCacheHeader_t.from_buffer_copy(data)
+    if (
+        header.id != MODEL_CACHE_ID
+        or header.version != MODEL_CACHE_VERSION
+        or (header.checksum, header.mdl_mtime, header.vtx_mtime, header.vvd_mtime)
+        != key
+    ):
+        return None
+
+    try:
+        toc = json.loads(data[header.toc_offset : header.toc_offset + header.toc_size])
+        data_start = header.toc_offset + header.toc_size
+        data_start = -(-data_start // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+        arrays: dict[str, np.ndarray] = {}
+        for name, entry in toc["arrays"].items():
+            dtype = np.lib.format.descr_to_dtype(entry["dtype"])
+            shape = tuple(entry["shape"])
+            count = int(np.prod(shape))
+            if count == 0:
+                arrays[name] = np.empty(shape, dtype)
+                continue
+            start = data_start + entry["offset"]
+            if start < data_start or start + count * dtype.itemsize > len(data):
+                # truncated file
+                return None
+            arrays[name] = np.frombuffer(data, dtype, count, start).reshape(shape)
+        return arrays, toc["meta"]
+    except (ValueError, KeyError, TypeError):
+        # json.JSONDecodeError and bad dtypes or shapes are ValueErrors
+        return None
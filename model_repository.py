@@ -0,0 +1,222 @@
+"""Shared SourceModels for props referenced many times, e.g. by a dupe.
+
+Models are interned by (real path, checksum), so the same file reached
+through several spellings, symlinks or search paths is parsed once while
+different files that happen to share a header name and checksum stay
+apart. Unused models stay cached until the memory budget forces them out,
+least recently used first.
+"""
+import os
+import struct
+import threading
+import warnings
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+from gmod.lod import LODChain, LODMesh
+from gmod.mdl import MeshIndices, SourceModel
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+# sections parsed when a model enters the repository
+GEOMETRY_SECTIONS = ("indices", "vertices")
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class ModelKey(NamedTuple):
+    path: str
+    checksum: int
+
+
+class _Entry:
+    def __init__(self, key: ModelKey, model: SourceModel):
+        self.key = key
+        self.model = model
+        self.refcount = 0
+        self.last_used = 0
+        self.nbytes = model.memory_usage()
+
+
+class ModelHandle:
+    """Read-only access to a shared model, release() (or leaving the with
+    block) gives it back to the repository. A handle that is garbage
+    collected unreleased is released with a ResourceWarning."""
+
+    def __init__(self, repository: "ModelRepository", entry: _Entry):
+        self._repository = repository
+        self._entry: _Entry | None = entry
+
+    @property
+    def key(self) -> ModelKey:
+        return self._model_entry().key
+
+    @property
+    def model(self) -> SourceModel:
+        """The shared model, its geometry arrays are not writeable (see
+        SourceModel.share())"""
+        return self._model_entry().model
+
+    @property
+    def vertices(self) -> np.ndarray:
+        return _read_only(self.model.vertices)
+
+    @property
+    def indices(self) -> MeshIndices:
+        return MeshIndices(*(_read_only(array) for array in self.model.indices))
+
+    @property
+    def lods(self) -> LODChain:
+        lods = self.model.lods
+        return LODChain(
+            [LODMesh(*(_read_only(array) for array in lod)) for lod in lods.lods],
+            _read_only(lods.switch_points),
+        )
+
+    def _model_entry(self) -> _Entry:
+        if self._entry is None:
+            raise RuntimeError("Model handle was released")
+        return self._entry
+
+    def release(self):
+        if self._entry is not None:
+            self._repository._release(self._entry)
+            self._entry = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def __del__(self):
+        if getattr(self, "_entry", None) is not None:
+            warnings.warn(
+                f"Unreleased model handle {self._entry.key.path}",
+                ResourceWarning,
+                source=self,
+            )
+            self.release()
+
+
+class ModelRepository:
+    def __init__(
+        self,
+        search_paths: list[str] | None = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        cache_dir: str | None = None,
+    ):
+        """`search_paths` are game or addon roots that dupe model paths
+        (models/...) are relative to. With `cache_dir` parsed models go
+        through the model cache files there."""
+        self.search_paths = search_paths or []
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        # resolved path: (mtime, key), a replaced file is read again
+        self._paths: dict[str, tuple[int, ModelKey]] = {}
+        self._entries: dict[ModelKey, _Entry] = {}
+        self._clock = 0
+        self._lock = threading.RLock()
+        self.parses = 0
+
+    def resolve(self, path: str) -> str:
+        """Absolute path of a model, `path` is absolute or relative to one
+        of the search paths. Source paths are case insensitive, so a lower
+        case spelling is tried too."""
+        path = path.replace("\\", "/")
+        candidates = [path] if os.path.isabs(path) else [
+            os.path.join(root, spelling)
+            for root in self.search_paths
+            for spelling in (path, path.lower())
+        ]
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return os.path.realpath(candidate)
+        raise FileNotFoundError(f"Couldn't find model {path}")
+
+    @staticmethod
+    def read_key(mdl_path: str) -> ModelKey:
+        with open(mdl_path, "rb") as file:
+            _, _, checksum = struct.unpack("<3i", file.read(12))
+        return ModelKey(os.path.realpath(mdl_path), checksum)
+
+    def acquire(self, path: str) -> ModelHandle:
+        """Handle of the model at `path`, parsing it only if the file isn't
+        in the repository yet (or was replaced since)"""
+        with self._lock:
+            resolved = self.resolve(path)
+            key = self._path_key(resolved)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(key, self._load(resolved, key))
+            entry.refcount += 1
+            self._clock += 1
+            entry.last_used = self._clock
+            self._evict()
+            return ModelHandle(self, entry)
+
+    def _path_key(self, resolved: str) -> ModelKey:
+        mtime = os.stat(resolved).st_mtime_ns
+        cached = self._paths.get(resolved)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        key = self.read_key(resolved)
+        self._paths[resolved] = (mtime, key)
+        return key
+
+    def _load(self, resolved: str, key: ModelKey) -> SourceModel:
+        cache_path = None
+        if self.cache_dir is not None:
+            # files with the same name and checksum get their own cache
+            base = os.path.splitext(os.path.basename(resolved))[0]
+            path_hash = zlib.crc32(resolved.encode("utf-8", "surrogateescape"))
+            cache_path = os.path.join(
+                self.cache_dir,
+                f"{base}_{key.checksum & 0xFFFFFFFF:08x}_{path_hash:08x}.gmdc",
+            )
+        model = SourceModel(resolved, cache_path=cache_path)
+        model.preload(GEOMETRY_SECTIONS)
+        model.share()
+        self.parses += 1
+        return model
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refcount -= 1
+            # geometry built while the model was in use (lods, bvh) counts too
+            entry.nbytes = entry.model.memory_usage()
+            self._evict()
+
+    def _evict(self):
+        idle = sorted(
+            (entry for entry in self._entries.values() if entry.refcount == 0),
+            key=lambda entry: entry.last_used,
+        )
+        for entry in idle:
+            if self.memory_usage <= self.memory_budget:
+                break
+            del self._entries[entry.key]
+            entry.model.close()
+
+    @property
+    def memory_usage(self) -> int:
+        return sum(entry.nbytes for entry in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, path: str) -> bool:
+        with self._lock:
+            return self._path_key(self.resolve(path)) in self._entries
+
+    def clear(self):
+        """Drops every model nobody holds a handle to"""
+        with self._lock:
+            budget, self.memory_budget = self.memory_budget, -1
+            self._evict()
+            self.memory_budget = budget
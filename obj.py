@@ -0,0 +1,50 @@
+"""Wavefront OBJ export of static batches (see dupe_scene.batch_props).
+
+Rows are formatted a block at a time with np.savetxt. Like the glTF export
+the output is Y up and scaled to meters by default, faces are turned
+counter-clockwise and V is flipped to OBJ's bottom-left origin.
+"""
+import os
+
+import numpy as np
+
+from gmod.dupe_scene import Batch
+from gmod.gltf import EXPORT_CHUNK, INCHES_TO_METERS
+
+
+def _to_y_up(vectors: np.ndarray, scale: float) -> np.ndarray:
+    return np.stack([vectors[:, 0], vectors[:, 2], -vectors[:, 1]], axis=1) * scale
+
+
+def write_obj(batches: list[Batch], path: str, scale: float = INCHES_TO_METERS):
+    """Writes `path` and a .mtl next to it naming one material per batch,
+    every batch is an object with its own `usemtl`"""
+    mtl_path = os.path.splitext(path)[0] + ".mtl"
+    with open(mtl_path, "w", encoding="utf-8") as mtl:
+        for batch in batches:
+            mtl.write(f"newmtl {batch.material}\nKd 1 1 1\n\n")
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(f"mtllib {os.path.basename(mtl_path)}\n")
+        base = 1
+        for batch in batches:
+            file.write(f"o {batch.material}\nusemtl {batch.material}\n")
+            for start in range(0, len(batch.vertices), EXPORT_CHUNK):
+                vertices = batch.vertices[start : start + EXPORT_CHUNK]
+                np.savetxt(file, _to_y_up(vertices[:, :3], scale), "v %.6g %.6g %.6g")
+            for start in range(0, len(batch.vertices), EXPORT_CHUNK):
+                vertices = batch.vertices[start : start + EXPORT_CHUNK]
+                uv = vertices[:, 6:8].copy()
+                uv[:, 1] = 1.0 - uv[:, 1]
+                np.savetxt(file, uv, "vt %.6g %.6g")
+            for start in range(0, len(batch.vertices), EXPORT_CHUNK):
+                vertices = batch.vertices[start : start + EXPORT_CHUNK]
+                np.savetxt(file, _to_y_up(vertices[:, 3:6], 1.0), "vn %.6g %.6g %.6g")
+            # v/vt/vn share one index, studio triangles are clockwise
+            for start in range(0, len(batch.indices), EXPORT_CHUNK * 3):
+                triangles = batch.indices[start : start + EXPORT_CHUNK * 3]
+                triangles = triangles.reshape(-1, 3)[:, ::-1].astype(np.int64) + base
+                np.savetxt(
+                    file, np.repeat(triangles, 3, axis=1), "f" + " %d/%d/%d" * 3
+                )
+            base += len(batch.vertices)
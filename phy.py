@@ -0,0 +1,183 @@
+"""Collision models (.phy): every solid is an IVP compact surface made of
+convex pieces (ledges). Pieces become flat vertex/face arrays in model
+space inches.
+Reference: https://developer.valvesoftware.com/wiki/PHY
+"""
+import ctypes
+
+import numpy as np
+
+from gmod.aabb import AABBIndex
+from gmod.mdl_structs import (
+    compactsurfaceheader_t,
+    ivpcompactledge_t,
+    ivpcompactsurface_t,
+    phyheader_t,
+)
+
+VPHYSICS_ID = int.from_bytes(b"VPHY", "little")
+METERS_TO_INCHES = 1.0 / 0.0254
+
+PIECE_DTYPE = np.dtype(
+    [
+        ("solid", np.int32),
+        ("vertex_start", np.int64),
+        ("vertex_count", np.int64),
+        ("face_start", np.int64),
+        ("face_count", np.int64),
+        ("mins", np.float32, 3),
+        ("maxs", np.float32, 3),
+    ]
+)
+
+
+def ivp_to_source(points: np.ndarray) -> np.ndarray:
+    """IVP meters (y down) to Source inches (ConvertPositionToHL)"""
+    return (
+        np.stack([points[:, 0], points[:, 2], -points[:, 1]], axis=1)
+        * METERS_TO_INCHES
+    ).astype(np.float32)
+
+
+class CollisionModel:
+    def __init__(
+        self,
+        vertices: np.ndarray,
+        faces: np.ndarray,
+        pieces: np.ndarray,
+        num_solids: int,
+        text: str = "",
+    ):
+        """`faces` index `vertices` directly, `pieces` (PIECE_DTYPE) slice
+        both per convex piece. `text` is the key values section."""
+        self.vertices = vertices
+        self.faces = faces
+        self.pieces = pieces
+        self.num_solids = num_solids
+        self.text = text
+
+    def __len__(self) -> int:
+        return len(self.pieces)
+
+    def piece(self, row: int) -> tuple[np.ndarray, np.ndarray]:
+        """Vertices and piece-local faces of one convex piece"""
+        piece = self.pieces[row]
+        vertices = self.vertices[
+            piece["vertex_start"] : piece["vertex_start"] + piece["vertex_count"]
+        ]
+        faces = self.faces[
+            piece["face_start"] : piece["face_start"] + piece["face_count"]
+        ]
+        return vertices, faces - piece["vertex_start"]
+
+    def solid_pieces(self, solid: int) -> np.ndarray:
+        return np.flatnonzero(self.pieces["solid"] == solid)
+
+    @property
+    def bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def aabb_index(self, matrix: np.ndarray | None = None) -> AABBIndex:
+        """AABBs of the convex pieces, moved by a (3, 4) matrix if given;
+        ids are piece rows"""
+        index = AABBIndex(self.pieces["mins"], self.pieces["maxs"])
+        return index if matrix is None else index.transformed(matrix)
+
+
+def _read_ledges(
+    buf, surface_offset: int
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """(points, faces) of every ledge of an IVP compact surface"""
+    surface = ivpcompactsurface_t.from_buffer_copy(buf, surface_offset)
+    ledge_offset = surface_offset + ctypes.sizeof(ivpcompactsurface_t)
+    # ledges are followed by the point pool and the ledge tree
+    end = surface_offset + surface.offset_ledgetree_root
+    ledges = []
+    while ledge_offset < end:
+        ledge = ivpcompactledge_t.from_buffer_copy(buf, ledge_offset)
+        triangles = np.frombuffer(
+            buf,
+            "<u4",
+            ledge.n_triangles * 4,
+            ledge_offset + ctypes.sizeof(ivpcompactledge_t),
+        ).reshape(-1, 4)
+        # ivpcompactedge_t: start_point_index is the low 16 bits
+        local = (triangles[:, 1:] & 0xFFFF).astype(np.int64)
+        point_offset = ledge_offset + ledge.c_point_offset
+        end = min(end, point_offset)
+        used, faces = np.unique(local, return_inverse=True)
+        points = np.frombuffer(
+            buf, "<f4", (used.max(initial=-1) + 1) * 4, point_offset
+        ).reshape(-1, 4)[used, :3]
+        ledges.append((ivp_to_source(points), faces.reshape(-1, 3)))
+
+        size = (ledge.flags_and_size_div_16 >> 8) * 16
+        ledge_offset += size or ctypes.sizeof(ivpcompactledge_t) + triangles.nbytes
+    return ledges
+
+
+def parse_phy(buf) -> CollisionModel:
+    header = phyheader_t.from_buffer_copy(buf)
+    solid_offset = header.size
+    solids = []
+    for _ in range(header.solidCount):
+        surface_header = compactsurfaceheader_t.from_buffer_copy(buf, solid_offset)
+        if surface_header.vphysicsID == VPHYSICS_ID:
+            if surface_header.modelType != 0:
+                raise NotImplementedError(
+                    f"Collision model type {surface_header.modelType} not supported"
+                )
+            surface_offset = solid_offset + ctypes.sizeof(compactsurfaceheader_t)
+        else:
+            # old files have only the size before the surface
+            surface_offset = solid_offset + 4
+        solids.append(_read_ledges(buf, surface_offset))
+        solid_offset += 4 + surface_header.size
+
+    vertex_parts = []
+    face_parts = []
+    pieces = np.zeros(sum(map(len, solids)), dtype=PIECE_DTYPE)
+    row = 0
+    vertex_start = face_start = 0
+    for solid, ledges in enumerate(solids):
+        for points, faces in ledges:
+            pieces[row] = (
+                solid,
+                vertex_start,
+                len(points),
+                face_start,
+                len(faces),
+                points.min(axis=0, initial=np.inf),
+                points.max(axis=0, initial=-np.inf),
+            )
+            vertex_parts.append(points)
+            face_parts.append(faces + vertex_start)
+            vertex_start += len(points)
+            face_start += len(faces)
+            row += 1
+
+    text = bytes(buf[solid_offset:]).split(b"\0", 1)[0].decode("ascii", "replace")
+    return CollisionModel(
+        np.concatenate(vertex_parts or [np.empty((0, 3), np.float32)]),
+        np.concatenate(face_parts or [np.empty((0, 3), np.int64)]).astype(np.int32),
+        pieces,
+        header.solidCount,
+        text,
+    )
+
+
+def overlapping_instances(
+    models: list[CollisionModel], matrices: np.ndarray
+) -> np.ndarray:
+    """(P, 2) pairs of instances whose convex piece AABBs overlap, instance
+    i is models[i] placed by matrices[i] (3, 4)"""
+    indices = [
+        model.aabb_index().transformed(matrix, np.full(len(model), instance))
+        for instance, (model, matrix) in enumerate(zip(models, matrices))
+    ]
+    if not indices:
+        return np.empty((0, 2), dtype=np.int64)
+    combined = AABBIndex.concatenate(indices)
+    pairs = combined.ids[combined.overlapping_pairs()]
+    pairs = np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1)
+    return np.unique(pairs, axis=0)
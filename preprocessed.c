@@ -350,6 +350,21 @@ struct mstudioanimdesc_t
     int zeroframeindex;
     float zeroframestalltime;
 };
+struct mstudioanimsections_t
+{
+    int animblock;
+    int animindex;
+};
+struct mstudioanim_valueptr_t
+{
+    short offset[3];
+};
+struct mstudioanim_t
+{
+    byte bone;
+    byte flags;
+    short nextoffset;
+};
 struct mstudioseqdesc_t
 {
     int baseptr;
@@ -408,4 +423,47 @@ struct vertexFileFixup_t
     int lod;
     int sourceVertexID;
     int numVertexes;
-};
\ No newline at end of file
+};
+struct phyheader_t
+{
+    int size;
+    int id;
+    int solidCount;
+    int checkSum;
+};
+
+struct compactsurfaceheader_t
+{
+    int size;
+    int vphysicsID;
+    short version;
+    short modelType;
+    int surfaceSize;
+    Vector dragAxisAreas;
+    int axisMapSize;
+};
+
+struct ivpcompactsurface_t
+{
+    float mass_center[3];
+    float rotation_inertia[3];
+    float upper_limit_radius;
+    unsigned int max_factor_surface_deviation_and_byte_size;
+    int offset_ledgetree_root;
+    int dummy[3];
+};
+
+struct ivpcompactledge_t
+{
+    int c_point_offset;
+    int client_data;
+    unsigned int flags_and_size_div_16;
+    short n_triangles;
+    short for_future_use;
+};
+
+struct ivpcompacttriangle_t
+{
+    unsigned int tri_index_pierce_material_virtual;
+    unsigned int c_three_edges[3];
+};
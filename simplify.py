@@ -0,0 +1,317 @@
+"""Quadric error metric simplification (Garland & Heckbert 1997).
+
+Half-edge collapses: a vertex moves onto a neighbour and keeps that
+neighbour's attributes, so normals and UVs never need interpolation.
+Quadrics are built with array operations, the collapse loop is a heap walk
+over Python lists.
+"""
+import heapq
+
+import numpy as np
+
+from gmod.lod import LODChain, LODMesh, compact_vertices
+
+# fraction of LOD 0 triangles kept by each generated LOD
+DEFAULT_LOD_RATIOS = (0.5, 0.25, 0.125)
+# LOD 1 switches at this many bounding radii, every further LOD doubles it
+DEFAULT_SWITCH_RADII = 8.0
+# collapses that turn a face further than this (cosine) are rejected
+FLIP_COSINE = 0.2
+# vertices sharing a position closer than this are attribute seams
+SEAM_EPSILON = 1e-5
+
+
+def vertex_quadrics(positions: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Area weighted plane quadrics summed per vertex, (N, 10) upper
+    triangle of the symmetric 4x4 matrix in row order"""
+    corners = positions[triangles].astype(np.float64)
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    double_area = np.linalg.norm(normals, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normals = np.where(double_area[:, None] > 0, normals / double_area[:, None], 0)
+    planes = np.column_stack(
+        [normals, -np.einsum("ij,ij->i", normals, corners[:, 0])]
+    )
+    rows, cols = np.triu_indices(4)
+    face_quadrics = planes[:, rows] * planes[:, cols] * (double_area * 0.5)[:, None]
+    quadrics = np.zeros((len(positions), 10), dtype=np.float64)
+    for corner in range(3):
+        np.add.at(quadrics, triangles[:, corner], face_quadrics)
+    return quadrics
+
+
+def _quadric_error(q: list, x: float, y: float, z: float) -> float:
+    return (
+        q[0] * x * x
+        + 2 * q[1] * x * y
+        + 2 * q[2] * x * z
+        + 2 * q[3] * x
+        + q[4] * y * y
+        + 2 * q[5] * y * z
+        + 2 * q[6] * y
+        + q[7] * z * z
+        + 2 * q[8] * z
+        + q[9]
+    )
+
+
+def position_groups(positions: np.ndarray) -> np.ndarray:
+    """Group id of every vertex, copies of a position along UV or normal
+    seams (closer than SEAM_EPSILON) share one"""
+    quantized = np.round(positions / SEAM_EPSILON).astype(np.int64)
+    _, inverse = np.unique(quantized, axis=0, return_inverse=True)
+    return inverse.reshape(-1)
+
+
+def border_groups(groups: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Position groups on open borders of the surface with its seams
+    closed, moving them would tear it"""
+    edges = np.sort(
+        groups[triangles][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1
+    )
+    unique_edges, counts = np.unique(edges, axis=0, return_counts=True)
+    border = np.zeros(int(groups.max(initial=-1)) + 1, dtype=bool)
+    border[unique_edges[counts == 1].reshape(-1)] = True
+    return border
+
+
+def simplify(
+    vertices: np.ndarray,
+    indices: np.ndarray,
+    target_triangles: int,
+    max_error: float = np.inf,
+    lock_border: bool = True,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Collapses edges until at most `target_triangles` are left or the
+    next collapse costs more than `max_error` (squared distance). Returns
+    (vertices, indices) with unused vertices dropped.
+
+    Collapses work on positions: every copy of the source position along a
+    seam moves onto the copy of the target it shares an edge with, so seams
+    stay closed and simplify along themselves. A collapse that would leave
+    a copy without such a partner (e.g. across a hard edge) is skipped."""
+    vertices = np.asarray(vertices)
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    positions = vertices[:, :3].astype(np.float64)
+    if len(triangles) <= target_triangles:
+        return compact_vertices(vertices, triangles.reshape(-1))
+
+    vertex_group = position_groups(positions)
+    num_groups = int(vertex_group.max(initial=-1)) + 1
+    group_quadrics = np.zeros((num_groups, 10), dtype=np.float64)
+    np.add.at(group_quadrics, vertex_group, vertex_quadrics(positions, triangles))
+    quadrics = group_quadrics.tolist()
+    locked = (
+        border_groups(vertex_group, triangles)
+        if lock_border
+        else np.zeros(num_groups, dtype=bool)
+    ).tolist()
+    xyz = np.zeros((num_groups, 3))
+    xyz[vertex_group] = positions
+    xyz = xyz.tolist()
+    group = vertex_group.tolist()
+    members: list[list[int]] = [[] for _ in range(num_groups)]
+    for vertex, vertex_group_id in enumerate(group):
+        members[vertex_group_id].append(vertex)
+    corners = triangles.tolist()
+    alive = [True] * len(corners)
+    vertex_triangles: list[set[int]] = [set() for _ in range(len(vertices))]
+    for triangle, (a, b, c) in enumerate(corners):
+        vertex_triangles[a].add(triangle)
+        vertex_triangles[b].add(triangle)
+        vertex_triangles[c].add(triangle)
+    version = [0] * num_groups
+
+    def group_triangles(g: int) -> set[int]:
+        result = set()
+        for vertex in members[g]:
+            result |= vertex_triangles[vertex]
+        return result
+
+    def neighbours(g: int) -> set[int]:
+        result = set()
+        for triangle in group_triangles(g):
+            result.update(group[vertex] for vertex in corners[triangle])
+        result.discard(g)
+        return result
+
+    def push(heap: list, a: int, b: int):
+        """Both directions of collapsing edge a-b, a direction can still
+        be skipped when it is popped"""
+        q = [qa + qb for qa, qb in zip(quadrics[a], quadrics[b])]
+        if not locked[a]:
+            cost = _quadric_error(q, *xyz[b])
+            heapq.heappush(heap, (cost, a, b, version[a], version[b]))
+        if not locked[b]:
+            cost = _quadric_error(q, *xyz[a])
+            heapq.heappush(heap, (cost, b, a, version[b], version[a]))
+
+    def normal(a: list, b: list, c: list) -> tuple[float, float, float]:
+        ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+        vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+        return uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+
+    def flips(source: int, target: int, triangles: set[int]) -> bool:
+        """Would moving `source` onto `target` fold a remaining face"""
+        for triangle in triangles:
+            triangle_groups = [group[vertex] for vertex in corners[triangle]]
+            if target in triangle_groups:
+                continue
+            old = normal(*(xyz[g] for g in triangle_groups))
+            new = normal(
+                *(xyz[target] if g == source else xyz[g] for g in triangle_groups)
+            )
+            dot = old[0] * new[0] + old[1] * new[1] + old[2] * new[2]
+            length = (
+                (old[0] ** 2 + old[1] ** 2 + old[2] ** 2)
+                * (new[0] ** 2 + new[1] ** 2 + new[2] ** 2)
+            ) ** 0.5
+            if length == 0 or dot < FLIP_COSINE * length:
+                return True
+        return False
+
+    def partners(source: int, target: int) -> dict[int, int] | None:
+        """Copy of `target` every copy of `source` moves onto"""
+        result = {}
+        for vertex in members[source]:
+            for other in members[target]:
+                if vertex_triangles[vertex] & vertex_triangles[other]:
+                    result[vertex] = other
+                    break
+            else:
+                return None
+        return result
+
+    heap: list = []
+    edges = np.unique(
+        np.sort(vertex_group[triangles][:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1),
+        axis=0,
+    )
+    for a, b in edges.tolist():
+        push(heap, a, b)
+
+    remaining = len(corners)
+    while heap and remaining > target_triangles:
+        cost, source, target, source_version, target_version = heapq.heappop(heap)
+        if cost > max_error:
+            break
+        if source_version != version[source] or target_version != version[target]:
+            continue
+        source_triangles = group_triangles(source)
+        shared = source_triangles & group_triangles(target)
+        if not shared:
+            continue
+        # link condition: the edge's only common neighbours are the
+        # opposite corners of its faces, otherwise the result is not manifold
+        opposite = {
+            group[vertex]
+            for triangle in shared
+            for vertex in corners[triangle]
+        } - {source, target}
+        if neighbours(source) & neighbours(target) != opposite:
+            continue
+        moves = partners(source, target)
+        if moves is None or flips(source, target, source_triangles):
+            continue
+
+        for triangle in shared:
+            alive[triangle] = False
+            for vertex in corners[triangle]:
+                vertex_triangles[vertex].discard(triangle)
+        remaining -= len(shared)
+        for vertex, other in moves.items():
+            for triangle in vertex_triangles[vertex]:
+                corners[triangle] = [
+                    other if corner == vertex else corner
+                    for corner in corners[triangle]
+                ]
+            vertex_triangles[other] |= vertex_triangles[vertex]
+            vertex_triangles[vertex] = set()
+        members[source] = []
+        quadrics[target] = [
+            qa + qb for qa, qb in zip(quadrics[target], quadrics[source])
+        ]
+        version[source] += 1
+        version[target] += 1
+        for neighbour in neighbours(target):
+            push(heap, target, neighbour)
+
+    kept = np.array(
+        [corners[triangle] for triangle in range(len(corners)) if alive[triangle]],
+        dtype=np.int64,
+    ).reshape(-1)
+    return compact_vertices(vertices, kept)
+
+
+def simplify_lod(lod: LODMesh, ratio: float, max_error: float = np.inf) -> LODMesh:
+    """Every mesh of `lod` simplified on its own so material ranges stay
+    intact, keeping about `ratio` of its triangles"""
+    vertices = []
+    indices = []
+    meshes = lod.meshes.copy()
+    base = 0
+    for row, (start, count) in enumerate(
+        zip(lod.meshes["index_start"].tolist(), lod.meshes["index_count"].tolist())
+    ):
+        mesh_vertices, mesh_indices = simplify(
+            lod.vertices,
+            lod.indices[start : start + count],
+            int(count // 3 * ratio),
+            max_error,
+        )
+        vertices.append(mesh_vertices)
+        indices.append(mesh_indices.astype(np.int64) + base)
+        meshes["index_count"][row] = len(mesh_indices)
+        base += len(mesh_vertices)
+    meshes["index_start"] = np.cumsum(meshes["index_count"]) - meshes["index_count"]
+    all_vertices = np.concatenate(vertices or [lod.vertices[:0]])
+    all_indices = np.concatenate(indices or [np.empty(0, np.int64)])
+    index_dtype = np.uint16 if len(all_vertices) <= 0x10000 else np.uint32
+    return LODMesh(all_vertices, all_indices.astype(index_dtype), meshes)
+
+
+def generate_lod_chain(
+    base: LODMesh,
+    radius: float,
+    ratios: tuple[float, ...] = DEFAULT_LOD_RATIOS,
+    switch_points: tuple[float, ...] | None = None,
+    max_error: float = np.inf,
+) -> LODChain:
+    """LODChain of `base` and one simplified LOD per entry of `ratios`.
+    Without `switch_points` LOD i switches at
+    radius * DEFAULT_SWITCH_RADII * 2 ** (i - 1)."""
+    return extend_lod_chain(
+        LODChain([base], np.zeros(1)), radius, ratios, switch_points, max_error
+    )
+
+
+def extend_lod_chain(
+    chain: LODChain,
+    radius: float,
+    ratios: tuple[float, ...] = DEFAULT_LOD_RATIOS,
+    switch_points: tuple[float, ...] | None = None,
+    max_error: float = np.inf,
+) -> LODChain:
+    """`chain` followed by simplified LODs for the levels of `ratios` it
+    lacks. LOD i keeps about ratios[i - 1] of LOD 0's triangles and is made
+    from the coarsest LOD of `chain`. `switch_points` are per level like in
+    generate_lod_chain(), default ones are pushed past the shipped LODs."""
+    generated_points = switch_points
+    if generated_points is None:
+        generated_points = tuple(
+            radius * DEFAULT_SWITCH_RADII * 2**level for level in range(len(ratios))
+        )
+    if len(generated_points) != len(ratios):
+        raise ValueError("Need one switch point per generated LOD")
+    lods = list(chain.lods)
+    points = chain.switch_points.tolist()
+    coarsest = lods[-1]
+    base_triangles = lods[0].num_triangles
+    for level in range(len(lods), len(ratios) + 1):
+        ratio = ratios[level - 1] * base_triangles / max(coarsest.num_triangles, 1)
+        lods.append(simplify_lod(coarsest, min(ratio, 1.0), max_error))
+        point = generated_points[level - 1]
+        if switch_points is None and point <= points[-1]:
+            point = points[-1] * 2
+        points.append(point)
+    return LODChain(lods, np.array(points))
@@ -0,0 +1,159 @@
+"""Bone hierarchy math on whole arrays of bones.
+
+Matrices are matrix3x4_t shaped (..., 3, 4): rotation in [..., :3] and
+translation in [..., 3], quaternions are (x, y, z, w) like in studio.h.
+"""
+import numpy as np
+from numpy.lib import recfunctions
+
+
+def quaternion_matrix(quaternions: np.ndarray) -> np.ndarray:
+    """(..., 4) quaternions to (..., 3, 3) rotation matrices (QuaternionMatrix)"""
+    x, y, z, w = np.moveaxis(np.asarray(quaternions, dtype=np.float32), -1, 0)
+    matrix = np.empty(x.shape + (3, 3), dtype=np.float32)
+    matrix[..., 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    matrix[..., 1, 0] = 2.0 * (x * y + w * z)
+    matrix[..., 2, 0] = 2.0 * (x * z - w * y)
+    matrix[..., 0, 1] = 2.0 * (x * y - w * z)
+    matrix[..., 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    matrix[..., 2, 1] = 2.0 * (y * z + w * x)
+    matrix[..., 0, 2] = 2.0 * (x * z + w * y)
+    matrix[..., 1, 2] = 2.0 * (y * z - w * x)
+    matrix[..., 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    return matrix
+
+
+def compose(positions: np.ndarray, quaternions: np.ndarray) -> np.ndarray:
+    """(..., 3) positions and (..., 4) quaternions to (..., 3, 4) matrices"""
+    rotation = quaternion_matrix(quaternions)
+    matrix = np.empty(rotation.shape[:-1] + (4,), dtype=np.float32)
+    matrix[..., :3] = rotation
+    matrix[..., 3] = positions
+    return matrix
+
+
+def concat_transforms(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """a * b for (..., 3, 4) matrices (ConcatTransforms)"""
+    matrix = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=np.float32)
+    matrix[..., :3] = a[..., :3] @ b[..., :3]
+    matrix[..., 3] = (a[..., :3] @ b[..., 3, None])[..., 0] + a[..., 3]
+    return matrix
+
+
+def invert_transforms(matrix: np.ndarray) -> np.ndarray:
+    """Inverse of rigid (..., 3, 4) matrices (MatrixInvert)"""
+    inverse = np.empty_like(matrix)
+    inverse[..., :3] = np.swapaxes(matrix[..., :3], -1, -2)
+    inverse[..., 3] = -(inverse[..., :3] @ matrix[..., 3, None])[..., 0]
+    return inverse
+
+
+def hierarchy_levels(parents: np.ndarray) -> list[np.ndarray]:
+    """Bones grouped by depth, every group only depends on earlier groups"""
+    parents = np.asarray(parents, dtype=np.int64)
+    depth = np.zeros(len(parents), dtype=np.int64)
+    ancestor = parents.copy()
+    for _ in range(len(parents) + 1):
+        has_parent = ancestor >= 0
+        if not has_parent.any():
+            break
+        depth += has_parent
+        ancestor[has_parent] = parents[ancestor[has_parent]]
+    else:
+        raise RuntimeError("Bone hierarchy has a cycle")
+    order = np.argsort(depth, kind="stable")
+    splits = np.flatnonzero(np.diff(depth[order])) + 1
+    return np.split(order, splits)
+
+
+def angle_quaternion(angles: np.ndarray) -> np.ndarray:
+    """(..., 3) RadianEuler to (..., 4) quaternions (AngleQuaternion)"""
+    half = np.asarray(angles, dtype=np.float32) * 0.5
+    sr, sp, sy = np.moveaxis(np.sin(half), -1, 0)
+    cr, cp, cy = np.moveaxis(np.cos(half), -1, 0)
+    quaternions = np.empty(half.shape[:-1] + (4,), dtype=np.float32)
+    quaternions[..., 0] = sr * cp * cy - cr * sp * sy
+    quaternions[..., 1] = cr * sp * cy + sr * cp * sy
+    quaternions[..., 2] = cr * cp * sy - sr * sp * cy
+    quaternions[..., 3] = cr * cp * cy + sr * sp * sy
+    return quaternions
+
+
+def qangle_quaternion(angles: np.ndarray) -> np.ndarray:
+    """(..., 3) QAngle degrees (pitch, yaw, roll), e.g. entity angles, to
+    (..., 4) quaternions"""
+    radians = np.radians(np.asarray(angles, dtype=np.float64))
+    return angle_quaternion(radians[..., [2, 0, 1]])
+
+
+def slerp(q0: np.ndarray, q1: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Spherical interpolation of (..., 4) quaternions by (...) factors,
+    q1 is flipped into q0's hemisphere first (QuaternionSlerp)"""
+    t = np.asarray(t, dtype=np.float32)[..., None]
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0.0, -q1, q1)
+    dot = np.minimum(np.abs(dot), 1.0)
+    theta = np.arccos(dot)
+    sin_theta = np.sin(theta)
+    # nearly identical quaternions fall back to lerp
+    linear = sin_theta < 1e-6
+    sin_theta = np.where(linear, 1.0, sin_theta)
+    w0 = np.where(linear, 1.0 - t, np.sin((1.0 - t) * theta) / sin_theta)
+    w1 = np.where(linear, t, np.sin(t * theta) / sin_theta)
+    return (w0 * q0 + w1 * q1).astype(np.float32)
+
+
+class Skeleton:
+    def __init__(
+        self,
+        names: list[str],
+        parents: np.ndarray,
+        positions: np.ndarray,
+        quaternions: np.ndarray,
+        pose_to_bone: np.ndarray,
+    ):
+        self.names = names
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.positions = np.asarray(positions, dtype=np.float32)
+        self.quaternions = np.asarray(quaternions, dtype=np.float32)
+        self.pose_to_bone = np.asarray(pose_to_bone, dtype=np.float32)
+        self.levels = hierarchy_levels(self.parents)
+
+        self.bind_local = compose(self.positions, self.quaternions)
+        self.bind_world = self.world_matrices(self.bind_local)
+
+    @classmethod
+    def from_bones(cls, bones: np.ndarray, names: list[str]) -> "Skeleton":
+        """From a structured array of mstudiobone_t records"""
+        return cls(
+            names,
+            bones["parent"],
+            recfunctions.structured_to_unstructured(bones["pos"]),
+            recfunctions.structured_to_unstructured(bones["quat"]),
+            bones["poseToBone"]["m_flMatVal"].reshape(-1, 3, 4),
+        )
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def world_matrices(self, local: np.ndarray) -> np.ndarray:
+        """Bone-to-model matrices from parent-relative ones. `local` is
+        (..., bones, 3, 4), leading axes (frames, instances) are evaluated
+        together, one vectorized step per hierarchy depth."""
+        world = np.array(local, dtype=np.float32)
+        for level in self.levels[1:]:
+            world[..., level, :, :] = concat_transforms(
+                world[..., self.parents[level], :, :], world[..., level, :, :]
+            )
+        return world
+
+    def skinning_matrices(self, world: np.ndarray | None = None) -> np.ndarray:
+        """Model-space vertex transforms (world * poseToBone), defaults to the
+        bind pose"""
+        if world is None:
+            world = self.bind_world
+        return concat_transforms(world, self.pose_to_bone)
+
+    def index(self, name: str) -> int:
+        return self.names.index(name)
+
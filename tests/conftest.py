@@ -0,0 +1,14 @@
+"""The modules import each other as `gmod.<module>`, so the checkout is
+registered as the gmod package whatever its folder is called."""
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if "gmod" not in sys.modules:
+    spec = importlib.machinery.ModuleSpec("gmod", None, is_package=True)
+    spec.submodule_search_locations = [ROOT]
+    sys.modules["gmod"] = importlib.util.module_from_spec(spec)
@@ -0,0 +1,332 @@
+"""Writes small MDL/VVD/VTX triples from explicit geometry for the tests.
+
+Every mesh is (vertices, triangles): (n, 8) position, normal and uv rows
+and (t, 3) indices into them. Vertices are stored in VVD in mesh order,
+strip groups use them one to one and every LOD repeats LOD 0.
+"""
+import ctypes
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+from gmod.mdl_structs import (
+    BodyPartHeader_t,
+    FileHeader_t,
+    MeshHeader_t,
+    ModelHeader_t,
+    ModelLODHeader_t,
+    StripGroupHeader_t,
+    StripHeader_t,
+    Vertex_t,
+    mstudiobodyparts_t,
+    mstudiobone_t,
+    mstudiomesh_t,
+    mstudiomodel_t,
+    mstudiotexture_t,
+    mstudiovertex_t,
+    studiohdr2_t,
+    studiohdr_t,
+    vertexFileHeader_t,
+)
+
+
+class Mesh(NamedTuple):
+    vertices: np.ndarray
+    triangles: np.ndarray
+    material: int = 0
+
+
+class _Writer:
+    def __init__(self):
+        self.data = bytearray()
+
+    def at(self) -> int:
+        return len(self.data)
+
+    def put(self, data) -> int:
+        offset = len(self.data)
+        self.data += bytes(data)
+        return offset
+
+    def patch(self, offset: int, data):
+        data = bytes(data)
+        self.data[offset : offset + len(data)] = data
+
+    def cstring(self, text: str) -> int:
+        return self.put(text.encode("ascii") + b"\0")
+
+
+def box_mesh(size: float = 10.0, subdivisions: int = 1) -> Mesh:
+    """Hard edged box, every face has its own vertices (normal seams) and
+    is a grid of subdivisions x subdivisions quads"""
+    vertices = []
+    triangles = []
+    steps = np.linspace(-size, size, subdivisions + 1)
+    for axis in range(3):
+        for sign in (-1.0, 1.0):
+            u_axis, v_axis = [other for other in range(3) if other != axis]
+            base = sum(len(face) for face in vertices)
+            face = np.zeros((subdivisions + 1, subdivisions + 1, 8), np.float32)
+            u, v = np.meshgrid(steps, steps, indexing="ij")
+            face[..., axis] = sign * size
+            face[..., u_axis] = u
+            face[..., v_axis] = v
+            face[..., 3 + axis] = sign
+            face[..., 6] = (u + size) / (2 * size)
+            face[..., 7] = (v + size) / (2 * size)
+            vertices.append(face.reshape(-1, 8))
+            grid = np.arange((subdivisions + 1) ** 2).reshape(subdivisions + 1, -1)
+            a, b = grid[:-1, :-1].ravel(), grid[1:, :-1].ravel()
+            c, d = grid[1:, 1:].ravel(), grid[:-1, 1:].ravel()
+            quads = np.stack([a, b, c, a, c, d], axis=1).reshape(-1, 3) + base
+            if sign > 0:
+                quads = quads[:, ::-1]
+            triangles.append(quads)
+    return Mesh(np.concatenate(vertices), np.concatenate(triangles))
+
+
+def cylinder_mesh(
+    radius: float = 10.0, height: float = 20.0, sides: int = 24, rings: int = 8
+) -> Mesh:
+    """Smooth sided cylinder with a UV seam down one side and hard edged
+    caps that have their own vertices"""
+    angles = np.linspace(0.0, 2 * np.pi, sides + 1)
+    heights = np.linspace(0.0, height, rings + 1)
+    angle, z = np.meshgrid(angles, heights, indexing="ij")
+    side = np.zeros((sides + 1, rings + 1, 8), np.float32)
+    side[..., 0] = radius * np.cos(angle)
+    side[..., 1] = radius * np.sin(angle)
+    side[..., 2] = z
+    side[..., 3] = np.cos(angle)
+    side[..., 4] = np.sin(angle)
+    side[..., 6] = angle / (2 * np.pi)
+    side[..., 7] = z / height
+    # the last column repeats the first position with u = 1
+    side[-1, :, :6] = side[0, :, :6]
+    grid = np.arange((sides + 1) * (rings + 1)).reshape(sides + 1, -1)
+    a, b = grid[:-1, :-1].ravel(), grid[1:, :-1].ravel()
+    c, d = grid[1:, 1:].ravel(), grid[:-1, 1:].ravel()
+    vertices = [side.reshape(-1, 8)]
+    triangles = [np.stack([a, d, c, a, c, b], axis=1).reshape(-1, 3)]
+    for top in (False, True):
+        base = sum(len(part) for part in vertices)
+        cap = np.zeros((sides + 1, 8), np.float32)
+        cap[:sides, 0] = radius * np.cos(angles[:-1])
+        cap[:sides, 1] = radius * np.sin(angles[:-1])
+        cap[:, 2] = height if top else 0.0
+        cap[:, 5] = 1.0 if top else -1.0
+        cap[:, 6:8] = cap[:, 0:2] / (2 * radius) + 0.5
+        ring = np.arange(sides)
+        fan = np.stack([np.full(sides, sides), ring, (ring + 1) % sides], axis=1)
+        vertices.append(cap)
+        triangles.append((fan[:, ::-1] if top else fan) + base)
+    return Mesh(np.concatenate(vertices), np.concatenate(triangles))
+
+
+def soup_mesh(mesh: Mesh, seed: int = 0) -> Mesh:
+    """Every triangle with its own copies of its vertices, in random order,
+    like an unwelded export"""
+    rng = np.random.default_rng(seed)
+    triangles = mesh.triangles[rng.permutation(len(mesh.triangles))]
+    return Mesh(
+        mesh.vertices[triangles.reshape(-1)],
+        np.arange(triangles.size).reshape(-1, 3),
+        mesh.material,
+    )
+
+
+def write_model(
+    directory: str,
+    name: str,
+    bodyparts: list[tuple[str, list[tuple[str, list[Mesh]]]]],
+    checksum: int = 1234,
+    textures: tuple[str, ...] = ("metal", "wood"),
+    num_lods: int = 1,
+    num_bones: int = 1,
+) -> str:
+    """Writes name.mdl, name.vvd and name.dx90.vtx to `directory`, returns
+    the .mdl path. `bodyparts` are (name, [(model name, meshes)])."""
+    os.makedirs(directory, exist_ok=True)
+    models = [model for _, bodypart_models in bodyparts for model in bodypart_models]
+    model_starts = []
+    total = 0
+    for _, meshes in models:
+        model_starts.append(total)
+        total += sum(len(mesh.vertices) for mesh in meshes)
+
+    records = (mstudiovertex_t * total)()
+    index = 0
+    for _, meshes in models:
+        for mesh in meshes:
+            for row in np.asarray(mesh.vertices, dtype=np.float32):
+                record = records[index]
+                record.m_BoneWeights.weight[0] = 1.0
+                record.m_BoneWeights.numbones = 1
+                record.m_vecPosition.x, record.m_vecPosition.y, record.m_vecPosition.z = map(float, row[:3])
+                record.m_vecNormal.x, record.m_vecNormal.y, record.m_vecNormal.z = map(float, row[3:6])
+                record.m_vecTexCoord.x, record.m_vecTexCoord.y = map(float, row[6:8])
+                index += 1
+
+    vvd = _Writer()
+    vvd_header = vertexFileHeader_t()
+    vvd_header.id = int.from_bytes(b"VSDI", "big")
+    vvd_header.version = 4
+    vvd_header.checksum = checksum
+    vvd_header.numLODs = num_lods
+    for lod in range(num_lods):
+        vvd_header.numLODVertexes[lod] = total
+    vvd.put(vvd_header)
+    vvd_header.vertexDataStart = vvd.put(records)
+    vvd_header.tangentDataStart = vvd.put(np.zeros((total, 4), np.float32).tobytes())
+    vvd.patch(0, vvd_header)
+
+    mdl = _Writer()
+    header = studiohdr_t()
+    header.id = int.from_bytes(b"IDST", "little")
+    header.version = 48
+    header.checksum = checksum
+    header.name = (name + ".mdl").encode("ascii")
+    mdl.put(header)
+    header.studiohdr2index = mdl.put(studiohdr2_t())
+
+    header.bone_count = num_bones
+    header.bone_offset = mdl.at()
+    bones = (mstudiobone_t * num_bones)()
+    mdl.put(bones)
+    for i in range(num_bones):
+        bones[i].parent = i - 1
+        bones[i].quat.w = 1.0
+        bones[i].sznameindex = mdl.cstring(f"bone{i}") - (
+            header.bone_offset + i * ctypes.sizeof(mstudiobone_t)
+        )
+    mdl.patch(header.bone_offset, bones)
+
+    header.texture_count = len(textures)
+    header.texture_offset = mdl.at()
+    texture_headers = (mstudiotexture_t * len(textures))()
+    mdl.put(texture_headers)
+    for i, texture in enumerate(textures):
+        texture_headers[i].name_offset = mdl.cstring(texture) - (
+            header.texture_offset + i * ctypes.sizeof(mstudiotexture_t)
+        )
+    mdl.patch(header.texture_offset, texture_headers)
+    header.texturedir_count = 1
+    header.texturedir_offset = mdl.put(b"\0\0\0\0")
+    mdl.patch(header.texturedir_offset, ctypes.c_int(mdl.cstring("models\\test\\")))
+    header.skinreference_count = len(textures)
+    header.skinrfamily_count = 1
+    header.skinreference_index = mdl.put(np.arange(len(textures), dtype="<i2").tobytes())
+
+    header.bodypart_count = len(bodyparts)
+    header.bodypart_offset = mdl.at()
+    bodypart_headers = (mstudiobodyparts_t * len(bodyparts))()
+    mdl.put(bodypart_headers)
+    flat = 0
+    base = 1
+    for i, (bodypart_name, bodypart_models) in enumerate(bodyparts):
+        offset = header.bodypart_offset + i * ctypes.sizeof(mstudiobodyparts_t)
+        bodypart_headers[i].sznameindex = mdl.cstring(bodypart_name) - offset
+        bodypart_headers[i].nummodels = len(bodypart_models)
+        bodypart_headers[i].base = base
+        base *= len(bodypart_models)
+        model_offset = mdl.at()
+        bodypart_headers[i].modelindex = model_offset - offset
+        model_headers = (mstudiomodel_t * len(bodypart_models))()
+        mdl.put(model_headers)
+        for j, (model_name, meshes) in enumerate(bodypart_models):
+            model = model_headers[j]
+            model.name = model_name.encode("ascii")
+            model.nummeshes = len(meshes)
+            model.numvertices = sum(len(mesh.vertices) for mesh in meshes)
+            model.vertexindex = model_starts[flat] * ctypes.sizeof(mstudiovertex_t)
+            model.tangentsindex = model_starts[flat] * 16
+            flat += 1
+            mesh_headers = (mstudiomesh_t * len(meshes))()
+            vertex_offset = 0
+            for k, mesh in enumerate(meshes):
+                mesh_headers[k].material = mesh.material
+                mesh_headers[k].numvertices = len(mesh.vertices)
+                mesh_headers[k].vertexoffset = vertex_offset
+                mesh_headers[k].meshid = k
+                for lod in range(num_lods):
+                    mesh_headers[k].vertexdata.numLODVertexes[lod] = len(mesh.vertices)
+                vertex_offset += len(mesh.vertices)
+            model.meshindex = mdl.put(mesh_headers) - (
+                model_offset + j * ctypes.sizeof(mstudiomodel_t)
+            )
+        mdl.patch(model_offset, model_headers)
+    mdl.patch(header.bodypart_offset, bodypart_headers)
+    header.dataLength = mdl.at()
+    mdl.patch(0, header)
+
+    vtx = _Writer()
+    file_header = FileHeader_t()
+    file_header.version = 7
+    file_header.checkSum = checksum
+    file_header.numLODs = num_lods
+    file_header.numBodyParts = len(bodyparts)
+    vtx.put(file_header)
+    file_header.bodyPartOffset = vtx.at()
+    vtx_bodyparts = (BodyPartHeader_t * len(bodyparts))()
+    vtx.put(vtx_bodyparts)
+    for i, (_, bodypart_models) in enumerate(bodyparts):
+        offset = file_header.bodyPartOffset + i * ctypes.sizeof(BodyPartHeader_t)
+        vtx_bodyparts[i].numModels = len(bodypart_models)
+        model_offset = vtx.at()
+        vtx_bodyparts[i].modelOffset = model_offset - offset
+        vtx_models = (ModelHeader_t * len(bodypart_models))()
+        vtx.put(vtx_models)
+        for j, (_, meshes) in enumerate(bodypart_models):
+            vtx_models[j].numLODs = num_lods
+            lod_offset = vtx.at()
+            vtx_models[j].lodOffset = lod_offset - (
+                model_offset + j * ctypes.sizeof(ModelHeader_t)
+            )
+            lods = (ModelLODHeader_t * num_lods)()
+            vtx.put(lods)
+            for lod in range(num_lods):
+                lods[lod].numMeshes = len(meshes)
+                lods[lod].switchPoint = 100.0 * lod
+                mesh_offset = vtx.at()
+                lods[lod].meshOffset = mesh_offset - (
+                    lod_offset + lod * ctypes.sizeof(ModelLODHeader_t)
+                )
+                vtx_meshes = (MeshHeader_t * len(meshes))()
+                vtx.put(vtx_meshes)
+                for k, mesh in enumerate(meshes):
+                    group_offset = vtx.at()
+                    vtx_meshes[k].numStripGroups = 1
+                    vtx_meshes[k].stripGroupHeaderOffset = group_offset - (
+                        mesh_offset + k * ctypes.sizeof(MeshHeader_t)
+                    )
+                    group = StripGroupHeader_t()
+                    vtx.put(group)
+                    group.numVerts = len(mesh.vertices)
+                    group.vertOffset = vtx.at() - group_offset
+                    for vertex_id in range(len(mesh.vertices)):
+                        vertex = Vertex_t()
+                        vertex.origMeshVertID = vertex_id
+                        vertex.numBones = 1
+                        vtx.put(vertex)
+                    indices = np.asarray(mesh.triangles, dtype="<u2").reshape(-1)
+                    group.numIndices = len(indices)
+                    group.indexOffset = vtx.put(indices.tobytes()) - group_offset
+                    group.numStrips = 1
+                    strip = StripHeader_t()
+                    strip.numIndices = len(indices)
+                    strip.numVerts = len(mesh.vertices)
+                    strip.flags = 1
+                    group.stripOffset = vtx.put(strip) - group_offset
+                    vtx.patch(group_offset, group)
+                vtx.patch(mesh_offset, vtx_meshes)
+            vtx.patch(lod_offset, lods)
+        vtx.patch(model_offset, vtx_models)
+    vtx.patch(file_header.bodyPartOffset, vtx_bodyparts)
+    vtx.patch(0, file_header)
+
+    path = os.path.join(directory, name)
+    for extension, writer in ((".mdl", mdl), (".vvd", vvd), (".dx90.vtx", vtx)):
+        with open(path + extension, "wb") as file:
+            file.write(writer.data)
+    return path + ".mdl"
@@ -0,0 +1,56 @@
+import os
+import struct
+
+import pytest
+
+from gmod.advdupe2 import (
+    AdvDupe2,
+    ReaderContextVersion4,
+    ReaderContextVersion5,
+    build_value,
+    iter_entities,
+    iter_events,
+)
+from conftest import ROOT
+
+SAMPLES = ["test.txt", "test1.txt", "volvo 940 diesel white.txt"]
+
+
+def payload(revision: int) -> bytes:
+    """{"a": {"k": 2.0, "s": <long string>}, "b": <reference to a>, "l": [true]}"""
+    long = b"x" * 300
+    string = (
+        bytes([248]) + long + b"\0"
+        if revision == 4
+        else bytes([248]) + struct.pack("<L", len(long)) + long
+    )
+    return (
+        bytes([255, 1]) + b"a"
+        + bytes([255, 1]) + b"k" + bytes([251]) + struct.pack("<d", 2.0)
+        + bytes([1]) + b"s" + string + bytes([0])
+        + bytes([1]) + b"b" + bytes([247]) + struct.pack("<h", 2)
+        + bytes([1]) + b"l" + bytes([254, 253, 0])
+        + bytes([0])
+    )
+
+
+@pytest.mark.parametrize(
+    "revision, context", [(4, ReaderContextVersion4), (5, ReaderContextVersion5)]
+)
+@pytest.mark.parametrize("pause_gc", [False, True])
+def test_reader(revision, context, pause_gc):
+    value = context(payload(revision)).read(pause_gc)
+    assert value == {"a": {"k": 2.0, "s": "x" * 300}, "b": value["a"], "l": [True]}
+    assert value["b"] is value["a"]
+
+    data = payload(revision)
+    events = iter_events((data[i : i + 1] for i in range(len(data))), revision)
+    assert build_value(events, next(events), {}) == value
+
+
+@pytest.mark.parametrize("name", SAMPLES)
+def test_streaming_matches(name):
+    path = os.path.join(ROOT, name)
+    dupe = AdvDupe2(path)
+    assert repr(AdvDupe2(path, streaming=True).dupe) == repr(dupe.dupe)
+    assert repr(dict(iter_entities(path))) == repr(dupe.dupe["Entities"])
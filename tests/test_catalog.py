@@ -0,0 +1,30 @@
+import os
+
+from gmod.catalog import scan_models
+from synthetic_model import box_mesh, write_model
+
+
+def test_long_paths_are_kept_whole(tmp_path):
+    # deeper than the 512 characters the path column used to hold
+    folders = [f"folder_{i:02d}_" + "x" * 40 for i in range(12)]
+    deep = os.path.join(str(tmp_path), *folders)
+    paths = [
+        write_model(deep, "crate", [("body", [("crate", [box_mesh()])])]),
+        write_model(
+            str(tmp_path),
+            "barrel",
+            [("body", [("barrel", [box_mesh()])])],
+            checksum=99,
+            textures=("wood",),
+        ),
+    ]
+    assert len(paths[0]) > 512
+
+    catalog = scan_models(str(tmp_path), workers=1)
+    assert sorted(catalog.paths.tolist()) == sorted(paths)
+    crate = catalog.find(paths[0])
+    barrel = catalog.find(paths[1])
+    assert catalog.paths[crate] == paths[0]
+    assert catalog.entries["checksum"][barrel] == 99
+    assert catalog.textures(crate) == ["metal", "wood"]
+    assert catalog.textures(barrel) == ["wood"]
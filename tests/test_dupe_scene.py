@@ -0,0 +1,40 @@
+import warnings
+
+from gmod.dupe_scene import batch_props, dupe_props
+from gmod.gltf import export_dupe_glb
+from gmod.model_repository import ModelRepository
+from synthetic_model import box_mesh, write_model
+
+
+def entity(model: str, x: float) -> dict:
+    return {
+        "Model": model,
+        "Class": "prop_physics",
+        "PhysicsObjects": {0.0: {"Pos": (x, 0.0, 0.0), "Angle": (0.0, 0.0, 0.0)}},
+    }
+
+
+def test_mixed_case_model_paths_resolve(tmp_path):
+    write_model(
+        str(tmp_path / "models" / "SProps" / "b"),
+        "Cyl",
+        [("body", [("cyl", [box_mesh()])])],
+    )
+    dupe = {
+        "Entities": {
+            1.0: entity("models\\SProps\\b\\Cyl.mdl", 0.0),
+            2.0: entity("models/sprops/b/cyl.mdl", 50.0),
+        }
+    }
+    props = dupe_props(dupe)
+    # one model, grouped case insensitively, spelled like the first prop
+    assert props.models == ["models/SProps/b/Cyl.mdl"]
+    assert props.model.tolist() == [0, 0]
+
+    repository = ModelRepository([str(tmp_path)])
+    with warnings.catch_warnings():
+        # props whose model isn't found are skipped with a warning
+        warnings.filterwarnings("error", "Skipping")
+        batches = batch_props(props, repository)
+        export_dupe_glb(props, repository, str(tmp_path / "dupe.glb"))
+    assert sum(len(batch.indices) for batch in batches) == 2 * box_mesh().triangles.size
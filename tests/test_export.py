@@ -0,0 +1,68 @@
+import json
+import struct
+
+import numpy as np
+
+from gmod.gltf import export_glb
+from gmod.mdl import SourceModel
+from gmod.mesh_optimize import vertex_cache_miss_ratio
+from synthetic_model import box_mesh, soup_mesh, write_model
+
+COMPONENT_DTYPES = {5121: np.uint8, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+
+
+def read_glb(path: str) -> tuple[dict, bytes]:
+    with open(path, "rb") as file:
+        data = file.read()
+    json_length = struct.unpack_from("<I", data, 12)[0]
+    gltf = json.loads(data[20 : 20 + json_length])
+    return gltf, data[20 + json_length + 8 :]
+
+
+def read_accessor(gltf: dict, binary: bytes, index: int) -> np.ndarray:
+    accessor = gltf["accessors"][index]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    dtype = np.dtype(COMPONENT_DTYPES[accessor["componentType"]])
+    width = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4}[accessor["type"]]
+    stride = view.get("byteStride", dtype.itemsize * width)
+    start = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    rows = np.lib.stride_tricks.as_strided(
+        np.frombuffer(binary, np.uint8, offset=start),
+        (accessor["count"], width * dtype.itemsize),
+        (stride, 1),
+    )
+    return np.ascontiguousarray(rows).view(dtype).reshape(accessor["count"], width)
+
+
+def exported_mesh(path: str) -> tuple[np.ndarray, np.ndarray]:
+    gltf, binary = read_glb(path)
+    primitives = gltf["meshes"][0]["primitives"]
+    positions = read_accessor(gltf, binary, primitives[0]["attributes"]["POSITION"])
+    indices = np.concatenate(
+        [read_accessor(gltf, binary, primitive["indices"]) for primitive in primitives]
+    )
+    return positions, indices.reshape(-1)
+
+
+def triangle_set(positions: np.ndarray, indices: np.ndarray) -> set:
+    corners = np.round(positions[indices.reshape(-1, 3)], 3)
+    # same triangle whichever corner comes first
+    return {
+        min(tuple(map(tuple, np.roll(triangle, shift, axis=0))) for shift in range(3))
+        for triangle in corners
+    }
+
+
+def test_optimized_export_is_welded_and_cache_ordered(tmp_path):
+    path = write_model(
+        str(tmp_path), "soup", [("body", [("box", [soup_mesh(box_mesh(10, 6))])])]
+    )
+    model = SourceModel(path)
+    export_glb(model, str(tmp_path / "raw.glb"), optimize=False)
+    export_glb(model, str(tmp_path / "optimized.glb"))
+    raw_positions, raw_indices = exported_mesh(str(tmp_path / "raw.glb"))
+    positions, indices = exported_mesh(str(tmp_path / "optimized.glb"))
+
+    assert len(positions) < len(raw_positions)
+    assert vertex_cache_miss_ratio(indices) < vertex_cache_miss_ratio(raw_indices)
+    assert triangle_set(positions, indices) == triangle_set(raw_positions, raw_indices)
@@ -0,0 +1,33 @@
+from gmod.mdl import SourceModel
+from synthetic_model import box_mesh, write_model
+
+
+def test_bodyparts(tmp_path):
+    box = box_mesh()
+    path = write_model(
+        str(tmp_path),
+        "parts",
+        [
+            ("body", [("body_a", [box, box]), ("body_b", [box])]),
+            ("head", [("head_a", [box])]),
+            ("arms", [("arms_a", [box]), ("arms_b", [box, box, box]), ("none", [])]),
+        ],
+    )
+    model = SourceModel(path)
+    model.preload()
+    parts = [
+        (part["name"], [(m["name"], len(m["meshes"])) for m in part["models"]])
+        for part in model.bodyparts
+    ]
+    assert parts == [
+        (b"body", [(b"body_a", 2), (b"body_b", 1)]),
+        (b"head", [(b"head_a", 1)]),
+        (b"arms", [(b"arms_a", 1), (b"arms_b", 3), (b"none", 0)]),
+    ]
+    assert model.bodygroups.names == ["body", "head", "arms"]
+    assert model.bodygroups.num_models.tolist() == [2, 1, 3]
+    vertex_counts = [
+        [mesh.numvertices for m in part["models"] for mesh in m["meshes"]]
+        for part in model.bodyparts
+    ]
+    assert vertex_counts == [[len(box.vertices)] * 3, [len(box.vertices)], [len(box.vertices)] * 4]
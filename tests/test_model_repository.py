@@ -0,0 +1,56 @@
+import gc
+import os
+
+import pytest
+
+from gmod.model_repository import ModelRepository
+from synthetic_model import box_mesh, write_model
+
+
+def write_box(directory: str, name: str, checksum: int = 1234) -> str:
+    return write_model(
+        directory, name, [("body", [(name, [box_mesh()])])], checksum=checksum
+    )
+
+
+def test_same_header_different_files(tmp_path):
+    # header name and checksum match, the files don't
+    first = write_box(str(tmp_path / "a"), "crate")
+    second = write_box(str(tmp_path / "b"), "crate")
+    repository = ModelRepository([str(tmp_path)])
+    with repository.acquire(first) as a, repository.acquire(second) as b:
+        assert a.key != b.key
+        assert a.model is not b.model
+        assert len(repository) == 2
+    # another spelling of the same file shares the entry
+    with repository.acquire(os.path.join("a", "..", "a", "crate.mdl")) as handle:
+        assert handle.key.path == os.path.realpath(first)
+    assert repository.parses == 2
+
+
+def test_eviction_follows_explicit_releases(tmp_path):
+    paths = [write_box(str(tmp_path), f"box{i}", checksum=i) for i in range(3)]
+    repository = ModelRepository([str(tmp_path)], memory_budget=0)
+    handles = [repository.acquire(path) for path in paths]
+    # everything is held, nothing can go
+    assert len(repository) == 3
+
+    handles[1].release()
+    assert paths[1] not in repository
+    assert paths[0] in repository and paths[2] in repository
+    with pytest.raises(RuntimeError):
+        handles[1].model
+    handles[1].release()
+
+    with handles[0]:
+        pass
+    assert len(repository) == 1
+    handles[2].release()
+    assert len(repository) == 0
+
+    # a dropped handle is released by the collector with a warning
+    handle = repository.acquire(paths[0])
+    with pytest.warns(ResourceWarning):
+        del handle
+        gc.collect()
+    assert len(repository) == 0
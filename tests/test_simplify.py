@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from gmod.lod import LODMesh
+from gmod.mdl import MESH_TABLE_DTYPE
+from gmod.simplify import generate_lod_chain, simplify
+from synthetic_model import box_mesh, cylinder_mesh
+
+
+def face_alignment(vertices: np.ndarray, indices: np.ndarray) -> float:
+    """Smallest |cos| between a triangle's normal and its corner normals"""
+    corners = vertices[np.asarray(indices, dtype=np.int64).reshape(-1, 3)]
+    normals = np.cross(
+        corners[:, 1, :3] - corners[:, 0, :3], corners[:, 2, :3] - corners[:, 0, :3]
+    )
+    normals /= np.linalg.norm(normals, axis=1, keepdims=True)
+    return float(np.abs(np.einsum("ij,ikj->ik", normals, corners[:, :, 3:6])).min())
+
+
+@pytest.mark.parametrize("ratio", [0.5, 0.25, 0.125])
+def test_hard_edged_box_reaches_target(ratio):
+    box = box_mesh(10.0, 8)
+    target = int(len(box.triangles) * ratio)
+    vertices, indices = simplify(box.vertices, box.triangles.reshape(-1), target)
+    assert len(indices) // 3 == target
+    # corners stay put and no triangle crosses a hard edge
+    assert vertices[:, :3].min(axis=0).tolist() == [-10.0] * 3
+    assert vertices[:, :3].max(axis=0).tolist() == [10.0] * 3
+    assert face_alignment(vertices, indices) > 0.999
+
+
+def test_cylinder_lod_chain_reaches_targets():
+    cylinder = cylinder_mesh()
+    meshes = np.zeros(1, dtype=MESH_TABLE_DTYPE)
+    meshes["index_count"] = cylinder.triangles.size
+    base = LODMesh(cylinder.vertices, cylinder.triangles.reshape(-1), meshes)
+    chain = generate_lod_chain(base, 10.0, (0.5, 0.25))
+    counts = chain.triangle_counts.tolist()
+    assert counts[1] <= base.num_triangles * 0.5
+    assert counts[2] <= base.num_triangles * 0.25
+    # the caps stay flat and apart from the sides
+    for lod in chain.lods[1:]:
+        z = lod.vertices[:, 2]
+        caps = lod.vertices[np.abs(lod.vertices[:, 5]) == 1.0]
+        assert z.min() == 0.0 and z.max() == 20.0
+        assert np.all((caps[:, 2] == 0.0) | (caps[:, 2] == 20.0))
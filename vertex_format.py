@@ -0,0 +1,106 @@
+"""Compact 14 byte vertex layout for the (N, 8) position/normal/uv arrays.
+
+Positions are uint16 fractions of a box around the model, normals are
+octahedral encoded into two snorm16 and UVs are float16, against 32 bytes
+for the float32 layout.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+COMPACT_VERTEX_DTYPE = np.dtype(
+    [
+        ("position", "<u2", 3),
+        ("normal", "<i2", 2),
+        ("uv", "<f2", 2),
+    ]
+)
+POSITION_STEPS = 0xFFFF
+SNORM16_MAX = 0x7FFF
+
+
+def _sign(values: np.ndarray) -> np.ndarray:
+    """Like np.sign, but 0 counts as positive"""
+    return np.where(values >= 0, 1.0, -1.0).astype(values.dtype)
+
+
+def octahedral_encode(normals: np.ndarray) -> np.ndarray:
+    """(..., 3) unit vectors to (..., 2) snorm16 octahedral coordinates"""
+    normals = np.asarray(normals, dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        projected = normals / np.abs(normals).sum(axis=-1, keepdims=True)
+    projected = np.nan_to_num(projected)
+    x, y, z = projected[..., 0], projected[..., 1], projected[..., 2]
+    # the lower hemisphere folds over the diagonals
+    folded_x = np.where(z < 0, (1.0 - np.abs(y)) * _sign(x), x)
+    folded_y = np.where(z < 0, (1.0 - np.abs(x)) * _sign(y), y)
+    encoded = np.stack([folded_x, folded_y], axis=-1)
+    return np.round(np.clip(encoded, -1.0, 1.0) * SNORM16_MAX).astype(np.int16)
+
+
+def octahedral_decode(encoded: np.ndarray) -> np.ndarray:
+    """(..., 2) snorm16 octahedral coordinates to (..., 3) unit vectors"""
+    xy = np.asarray(encoded, dtype=np.float32) / SNORM16_MAX
+    x, y = xy[..., 0], xy[..., 1]
+    z = 1.0 - np.abs(x) - np.abs(y)
+    fold = np.maximum(-z, 0.0)
+    x = x - fold * _sign(x)
+    y = y - fold * _sign(y)
+    normals = np.stack([x, y, z], axis=-1)
+    return normals / np.linalg.norm(normals, axis=-1, keepdims=True)
+
+
+class CompactVertices(NamedTuple):
+    """COMPACT_VERTEX_DTYPE records and the box their positions are
+    quantized to: position = origin + stored * scale"""
+
+    data: np.ndarray
+    origin: np.ndarray
+    scale: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes + self.origin.nbytes + self.scale.nbytes
+
+    def decode(self) -> np.ndarray:
+        return decode_vertices(self)
+
+
+def encode_vertices(
+    vertices: np.ndarray,
+    bounds_min: np.ndarray | None = None,
+    bounds_max: np.ndarray | None = None,
+) -> CompactVertices:
+    """(N, 8) float vertices to the compact layout. Positions are quantized
+    to the given bounds (e.g. the studiohdr_t hull) grown to contain every
+    vertex, so nothing is clamped."""
+    vertices = np.asarray(vertices, dtype=np.float32)
+    positions = vertices[:, :3]
+    low = positions.min(axis=0, initial=np.inf)
+    high = positions.max(axis=0, initial=-np.inf)
+    if bounds_min is not None:
+        low = np.minimum(low, bounds_min)
+    if bounds_max is not None:
+        high = np.maximum(high, bounds_max)
+    if len(vertices) == 0 and (bounds_min is None or bounds_max is None):
+        low = high = np.zeros(3, dtype=np.float32)
+    scale = np.maximum(high - low, 1e-6).astype(np.float32) / POSITION_STEPS
+    origin = low.astype(np.float32)
+
+    data = np.empty(len(vertices), dtype=COMPACT_VERTEX_DTYPE)
+    data["position"] = np.clip(
+        np.round((positions - origin) / scale), 0, POSITION_STEPS
+    ).astype(np.uint16)
+    data["normal"] = octahedral_encode(vertices[:, 3:6])
+    data["uv"] = vertices[:, 6:8].astype(np.float16)
+    return CompactVertices(data, origin, scale)
+
+
+def decode_vertices(compact: CompactVertices) -> np.ndarray:
+    """Compact layout back to (N, 8) float32 vertices"""
+    data = compact.data
+    vertices = np.empty((len(data), 8), dtype=np.float32)
+    vertices[:, :3] = data["position"] * compact.scale + compact.origin
+    vertices[:, 3:6] = octahedral_decode(data["normal"])
+    vertices[:, 6:8] = data["uv"]
+    return vertices